@@ -8,17 +8,21 @@ import cache from "./cache.mjs";
  *
  * Optionally include the service name to only retrieve metrics for that service
  *
+ * Host-wide values shared by every service, (ie: host pressure, UDP errors and save directory growth), are retrieved in the same call
+ * when the application supports `--get-host-metrics`, and returned as host_metrics.
+ *
  * @param appData {AppData}
  * @param hostData {HostAppData}
  * @param service {string|null}
- * @returns {Promise<{services:Object.<{string}, ServiceData>, app:AppData, host:HostAppData, response_time:number}>}
+ * @returns {Promise<{services:Object.<{string}, ServiceData>, host_metrics:Object|null, app:AppData, host:HostAppData, response_time:number}>}
  */
 export async function getApplicationMetrics(appData, hostData, service = null) {
 	return new Promise((resolve, reject) => {
 
 		const guid = appData.guid,
 			requestStartTime = Date.now();
-		let cmd;
+		let cmd,
+			withHost = false;
 
 		if (hostData.options.includes('get-metrics')) {
 			// Application supports service-level metrics collection
@@ -28,6 +32,12 @@ export async function getApplicationMetrics(appData, hostData, service = null) {
 			else {
 				cmd = `${hostData.path}/manage.py --get-metrics`
 			}
+
+			if (hostData.options.includes('get-host-metrics')) {
+				// Returns {"host": {...}, "services": {...}} instead
+				cmd += ' --get-host-metrics';
+				withHost = true;
+			}
 		}
 		else {
 			// Fallback to general status of all services
@@ -37,11 +47,16 @@ export async function getApplicationMetrics(appData, hostData, service = null) {
 
 		cmdRunner(hostData.host, cmd)
 			.then(async result => {
-				let appServices;
+				let appServices,
+					hostMetrics = null;
 				const responseTime = Date.now() - requestStartTime;
 
 				try{
 					appServices = JSON.parse(result.stdout);
+					if (withHost) {
+						hostMetrics = appServices.host;
+						appServices = appServices.services;
+					}
 
 					// Store the metrics as they are retrieved.
 					// This is suitable to be done here since this method queries the live application.
@@ -49,9 +64,15 @@ export async function getApplicationMetrics(appData, hostData, service = null) {
 						let svc = appServices[svcName];
 						const timestamp = Math.floor(Date.now() / 1000);
 
-						// Parse memory usage - handle MB and GB
-						let memoryValue = 0;
-						if (svc.memory_usage && svc.memory_usage !== 'N/A') {
+						// Prefer the numeric values when provided by the application,
+						// older versions only report formatted strings, (ie: "1.23 GB" and "28%")
+						let memoryValue = 0,
+							cpuValue = 0;
+						if (typeof(svc.memory_bytes) === 'number') {
+							memoryValue = Math.round(svc.memory_bytes / (1024 * 1024));
+						}
+						else if (svc.memory_usage && svc.memory_usage !== 'N/A') {
+							// Parse memory usage - handle MB and GB
 							const memoryMatch = svc.memory_usage.match(/^([\d.]+)\s*(MB|GB)?/i);
 							if (memoryMatch) {
 								memoryValue = parseFloat(memoryMatch[1]);
@@ -65,6 +86,13 @@ export async function getApplicationMetrics(appData, hostData, service = null) {
 							}
 						}
 
+						if (typeof(svc.cpu_percent) === 'number') {
+							cpuValue = Math.round(svc.cpu_percent);
+						}
+						else {
+							cpuValue = parseInt(svc.cpu_usage) || 0;
+						}
+
 						let metrics = {
 							timestamp: timestamp,
 							app_guid: guid,
@@ -74,7 +102,7 @@ export async function getApplicationMetrics(appData, hostData, service = null) {
 							player_count: svc.player_count || 0,
 							status: svc.status === 'running' ? 1 : 0,
 							memory_usage: memoryValue,
-							cpu_usage: parseInt(svc.cpu_usage) || 0
+							cpu_usage: cpuValue
 						};
 
 						try {
@@ -97,6 +125,7 @@ export async function getApplicationMetrics(appData, hostData, service = null) {
 					app: appData,
 					host: hostData,
 					services: appServices,
+					host_metrics: hostMetrics,
 					response_time: responseTime
 				});
 			})
@@ -91,6 +91,7 @@ router.get('/stream/:guid/:host/:service', validate_session, (req, res) => {
 					app: results.app.guid,
 					host: results.host,
 					service: results.services[req.params.service],
+					host_metrics: results.host_metrics,
 				};
 
 				ret.service['response_time'] = results.response_time;
@@ -1,3 +1,4 @@
+import atexit
 import datetime
 import json
 import os
@@ -8,6 +9,14 @@ from urllib import error as urllib_error
 from typing import Union
 from scriptlets.bz_eval_tui.prompt_yn import *
 from scriptlets.bz_eval_tui.prompt_text import *
+from scriptlets.warlock.systemd_backend import *
+from scriptlets.warlock.process_sampler import *
+from scriptlets.warlock.process_tree import *
+from scriptlets.warlock.directory_size import *
+from scriptlets.warlock.page_cache import *
+from scriptlets.warlock.cpu_placement import *
+from scriptlets.warlock.crash_loop import *
+from scriptlets.warlock.memory_trend import *
 
 
 class BaseApp:
@@ -48,6 +57,54 @@ class BaseApp:
 
 		self.configured = False
 
+		self._sampler = None
+		"""
+		:type ProcessSampler|None:
+		Shared sampler for the process metrics of all service instances
+		"""
+
+		self._process_tree = None
+		"""
+		:type ProcessTree|None:
+		Shared discovery of the game process of all service instances
+		"""
+
+		self._directory_sizes = None
+		"""
+		:type DirectorySizeTracker|None:
+		Incremental size tracking of the save directory
+		"""
+
+		self._memory_trend = None
+		"""
+		:type MemoryTrend|None:
+		Shared memory history of all service instances
+		"""
+
+		self._crash_tracker = None
+		"""
+		:type CrashLoopTracker|None:
+		Shared restart history and crash loop state of all service instances
+		"""
+
+		self.prewarm_files = []
+		"""
+		:type list<str>:
+		Glob patterns of files under AppFiles to read into the page cache before starting, (ie: '**/*.pak')
+		"""
+
+		self.prewarm_max_bytes = 0
+		"""
+		:type int:
+		Maximum number of bytes to prewarm, (0 to only limit to half the available memory)
+		"""
+
+		self._prewarm_result = None
+		"""
+		:type dict|None:
+		Result of the prewarm during this invocation, (the page cache is shared by all instances)
+		"""
+
 	def load(self):
 		"""
 		Load the configuration files
@@ -210,13 +267,157 @@ class BaseApp:
 				self._svcs.append(GameService(svc, self))
 		return self._svcs
 
+	def load_service_states(self) -> ServiceStateSnapshot:
+		"""
+		Query the systemd state of all service instances at once
+
+		The state cache of each service is primed from the result,
+		so subsequent lookups within the cache interval do not query systemd again.
+
+		:return:
+		"""
+		snapshot = ServiceStateSnapshot([svc.service for svc in self.get_services()]).refresh(get_systemd_backend())
+		for svc in self.get_services():
+			if snapshot.has(svc.service):
+				svc.set_state(snapshot.get(svc.service), snapshot.timestamp)
+		return snapshot
+
+	def get_cache_path(self, filename: str) -> str:
+		"""
+		Get the path of a file used to persist runtime data between invocations
+
+		:param filename:
+		:return:
+		"""
+		here = os.path.dirname(os.path.realpath(__file__))
+		cache_dir = os.path.join(here, '.cache')
+		if not os.path.exists(cache_dir):
+			try:
+				os.makedirs(cache_dir)
+				if os.geteuid() == 0:
+					# Ensure consistent ownership with the game files
+					stat_info = os.stat(here)
+					os.chown(cache_dir, stat_info.st_uid, stat_info.st_gid)
+			except OSError as e:
+				print('Unable to create cache directory %s: %s' % (cache_dir, e), file=sys.stderr)
+		return os.path.join(cache_dir, filename)
+
+	def get_process_sampler(self) -> ProcessSampler:
+		"""
+		Get the shared process sampler, (samples are persisted automatically on exit)
+
+		:return:
+		"""
+		if self._sampler is None:
+			self._sampler = ProcessSampler(self.get_cache_path('process_samples.json'))
+			atexit.register(self._sampler.save)
+		return self._sampler
+
+	def get_memory_trend(self) -> MemoryTrend:
+		"""
+		Get the shared memory history, (samples are persisted automatically on exit)
+
+		:return:
+		"""
+		if self._memory_trend is None:
+			self._memory_trend = MemoryTrend(self.get_cache_path('memory_trend.json'))
+			atexit.register(self._memory_trend.save)
+		return self._memory_trend
+
+	def get_crash_tracker(self) -> CrashLoopTracker:
+		"""
+		Get the shared restart history, (persisted automatically on exit)
+
+		:return:
+		"""
+		if self._crash_tracker is None:
+			self._crash_tracker = CrashLoopTracker(self.get_cache_path('crash_history.json'))
+			atexit.register(self._crash_tracker.save)
+		return self._crash_tracker
+
+	def get_process_tree(self) -> ProcessTree:
+		"""
+		Get the shared process tree, (discovered game processes are persisted automatically on exit)
+
+		:return:
+		"""
+		if self._process_tree is None:
+			self._process_tree = ProcessTree(self.get_cache_path('game_pids.json'))
+			atexit.register(self._process_tree.save)
+		return self._process_tree
+
+	def prewarm(self, progress: bool = True) -> Union[dict, None]:
+		"""
+		Read the files matching prewarm_files into the page cache, (see PageCachePrewarmer.prewarm)
+
+		Only performed once per invocation, as the page cache is shared by all instances.
+
+		:param progress: Print a summary once prewarmed
+		:return: None if this game has no files to prewarm
+		"""
+		if len(self.prewarm_files) == 0:
+			return None
+
+		if self._prewarm_result is None:
+			here = os.path.dirname(os.path.realpath(__file__))
+			prewarmer = PageCachePrewarmer(self.prewarm_max_bytes)
+			files = prewarmer.expand(os.path.join(here, 'AppFiles'), self.prewarm_files)
+			self._prewarm_result = prewarmer.prewarm(files)
+			if progress:
+				print('Requested readahead of %d files (%s) in %.1f seconds, %d skipped' % (
+					self._prewarm_result['files'],
+					format_bytes(self._prewarm_result['bytes_requested']),
+					self._prewarm_result['seconds_to_queue'],
+					len(self._prewarm_result['skipped'])
+				))
+		return self._prewarm_result
+
+	def plan_cpu_placement(self) -> dict:
+		"""
+		Assign each service instance its own cores, (see CpuTopology.plan)
+
+		Instances pinned manually through their 'CPU Affinity' option keep their CPUs,
+		and those CPUs are not handed out to other instances.
+
+		:return: dict of service name to its placement
+		"""
+		pinned = {}
+		for svc in self.get_services():
+			config = svc.get_systemd_config()
+			if config.has_value('CPU Affinity'):
+				pinned[svc.service] = config.get_value('CPU Affinity')
+		return CpuTopology().plan([svc.service for svc in self.get_services()], pinned)
+
+	def apply_cpu_placement(self, enabled: bool = True) -> dict:
+		"""
+		Write the planned placement of each instance to its systemd drop-in and reload systemd
+
+		Takes effect the next time each instance is started.
+
+		:param enabled: False to remove the automatic placement from all instances instead
+		:return: dict of service name to its placement, (empty when removed)
+		"""
+		placement = self.plan_cpu_placement() if enabled else {}
+		for svc in self.get_services():
+			entry = placement.get(svc.service)
+			# Manually pinned instances are configured by their own options
+			auto = entry is not None and entry['source'] == 'auto'
+			config = svc.get_placement_config()
+			config.set_value('CPU Affinity', entry['cpu_affinity'] if auto else '')
+			config.set_value('NUMA Policy', (entry['numa_policy'] or '') if auto else '')
+			config.set_value('NUMA Mask', (entry['numa_mask'] or '') if auto else '')
+			config.save()
+		get_systemd_backend().reload()
+		return placement
+
 	def is_active(self) -> bool:
 		"""
 		Check if any service instance is currently running or starting
 		:return:
 		"""
+		self.load_service_states()
 		for svc in self.get_services():
-			if svc.is_running() or svc.is_starting() or svc.is_stopping():
+			if svc.is_active():
 				return True
 		return False
 
@@ -282,6 +483,25 @@ class BaseApp:
 		"""
 		return None
 
+	def get_save_directory_size(self) -> Union[dict, None]:
+		"""
+		Get the size of the save directory, (see DirectorySizeTracker.measure)
+
+		Only directories which changed since the previous measurement are scanned,
+		and a measurement is reused for DirectorySizeTracker.MIN_INTERVAL seconds.
+
+		:return: None if this game has no save directory
+		"""
+		save_dir = self.get_save_directory()
+		if save_dir is None:
+			return None
+
+		if self._directory_sizes is None:
+			self._directory_sizes = DirectorySizeTracker(self.get_cache_path('save_manifest.json'))
+			atexit.register(self._directory_sizes.save)
+
+		return self._directory_sizes.measure(save_dir, DirectorySizeTracker.MIN_INTERVAL)
+
 	def get_save_files(self) -> Union[list, None]:
 		"""
 		Get the list of save files/directories for this game, or None if not applicable
@@ -2,8 +2,16 @@ import datetime
 import os
 import subprocess
 import time
-from typing import Union
+from typing import Iterator, Union
 from scriptlets.warlock.base_app import *
+from scriptlets.warlock.systemd_backend import *
+from scriptlets.warlock.cgroup_stats import *
+from scriptlets.warlock.proc_net import *
+from scriptlets.warlock.pid_waiter import *
+from scriptlets.warlock.journal_reader import *
+from scriptlets.warlock.systemd_config import *
+from scriptlets.warlock.cpu_placement import *
+from scriptlets.warlock.steam_query import *
 from scriptlets.bz_eval_tui.prompt_yn import *
 from scriptlets.bz_eval_tui.prompt_text import *
 
@@ -12,6 +20,12 @@ class BaseService:
 	"""
 	Service definition and handler
 	"""
+
+	RUNTIME_PROPERTIES = ('MemoryMax', 'CPUQuota', 'IOWeight', 'TasksMax')
+	"""
+	:type tuple<str>:
+	Systemd options of the service which can be changed while it is running
+	"""
 	def __init__(self, service: str, game: BaseApp):
 		"""
 		Initialize and load the service definition
@@ -22,6 +36,53 @@ class BaseService:
 		self.configured = False
 		self.configs = {}
 
+		self.start_timeout = 300
+		"""
+		:type int:
+		Maximum number of seconds to wait for the game to become ready when starting
+		"""
+
+		self.steam_query = False
+		"""
+		:type bool:
+		Set by games whose query port answers Steam A2S queries, (enables the A2S probe of is_responsive)
+		"""
+
+		self.stop_timeout = 600
+		"""
+		:type int:
+		Maximum number of seconds to wait for the service to stop, (includes player warnings from pre_stop)
+		"""
+
+		self.game_process_pattern = None
+		"""
+		:type str|None:
+		Regular expression matching the executable path or command line of the game server process,
+		(used to find it under wrappers such as proton), None to use the descendant with the most memory
+		"""
+
+		self.ready_check_interval = 2.0
+		"""
+		:type float:
+		Number of seconds between readiness checks while starting
+		"""
+
+		self.state_ttl = 1.0
+		"""
+		:type float:
+		Number of seconds the systemd state of this service is cached for
+		"""
+
+		self.unit_dir = '/etc/systemd/system'
+		"""
+		:type str:
+		Directory of the systemd unit of this service, (drop-ins are written to <unit_dir>/<service>.service.d)
+		"""
+
+		self._state = None
+		self._state_time = 0.0
+		self._systemd_config = None
+
 	def load(self):
 		"""
 		Load the configuration files
@@ -32,13 +93,120 @@ class BaseService:
 				config.load()
 				self.configured = True
 
+	def get_systemd_config(self) -> SystemdConfig:
+		"""
+		Get the service options stored as a systemd drop-in of this unit, (shared by every game)
+
+		:return:
+		"""
+		if self._systemd_config is None:
+			self._systemd_config = SystemdConfig('systemd', SystemdConfig.dropin_path(self.unit_dir, self.service, 'warlock-service'))
+			self._systemd_config.add_option(
+				'CPU Affinity', 'Service', 'CPUAffinity', '', 'str',
+				'CPUs to pin this instance to, (ie: 0-3,8-11), takes precedence over the automatic placement'
+			)
+			self._systemd_config.add_option(
+				'NUMA Policy', 'Service', 'NUMAPolicy', '', 'str',
+				'NUMA memory policy of this instance, used with NUMA Mask',
+				['default', 'preferred', 'bind', 'interleave', 'local']
+			)
+			self._systemd_config.add_option(
+				'NUMA Mask', 'Service', 'NUMAMask', '', 'str',
+				'NUMA nodes to allocate memory from, (ie: 0 or 0-1)'
+			)
+			self._systemd_config.add_option(
+				'Memory Max', 'Service', 'MemoryMax', '', 'str',
+				'Maximum memory of this instance, (ie: 12G), it is killed when exceeded'
+			)
+			self._systemd_config.add_option(
+				'CPU Quota', 'Service', 'CPUQuota', '', 'str',
+				'Maximum CPU time of this instance, (ie: 200% for two full cores)'
+			)
+			self._systemd_config.add_option(
+				'IO Weight', 'Service', 'IOWeight', '', 'int',
+				'Share of disk IO relative to other instances, (1-10000, default 100)'
+			)
+			self._systemd_config.add_option(
+				'Tasks Max', 'Service', 'TasksMax', '', 'str',
+				'Maximum number of processes and threads of this instance'
+			)
+			self._systemd_config.load()
+		return self._systemd_config
+
+	def get_placement_config(self) -> SystemdConfig:
+		"""
+		Get the drop-in holding the automatic CPU placement of this unit, (see BaseApp.apply_cpu_placement)
+
+		Drop-ins are applied in alphabetical order, so the service options in warlock-service.conf are applied after this one.
+		CPUAffinity= and NUMAMask= would otherwise be merged across both, so each drop-in clears them first,
+		(see SystemdConfig.RESET_DIRECTIVES), and a manual setting replaces the automatic one.
+
+		:return:
+		"""
+		config = SystemdConfig('placement', SystemdConfig.dropin_path(self.unit_dir, self.service, 'warlock-placement'))
+		config.add_option('CPU Affinity', 'Service', 'CPUAffinity')
+		config.add_option('NUMA Policy', 'Service', 'NUMAPolicy')
+		config.add_option('NUMA Mask', 'Service', 'NUMAMask')
+		config.load()
+		return config
+
+	def get_configs(self) -> list:
+		"""
+		Get all configurations of this service, including the systemd drop-in options
+
+		:return:
+		"""
+		return list(self.configs.values()) + [self.get_systemd_config()]
+
+	def get_cpu_placement(self) -> Union[dict, None]:
+		"""
+		Get the CPU placement of this service as configured in its drop-ins
+
+		* cpu_affinity - str: CPUs the instance is pinned to
+		* numa_policy - str|None: NUMA memory policy
+		* numa_mask - str|None: NUMA nodes memory is allocated from
+		* source - str: 'manual' if set via the service options, 'auto' if assigned by the placement
+
+		:return: None if the instance is not pinned
+		"""
+		for config, source in ((self.get_systemd_config(), 'manual'), (self.get_placement_config(), 'auto')):
+			if config.has_value('CPU Affinity'):
+				return {
+					'cpu_affinity': config.get_value('CPU Affinity'),
+					'numa_policy': config.get_value('NUMA Policy') or None,
+					'numa_mask': config.get_value('NUMA Mask') or None,
+					'source': source,
+				}
+		return None
+
+	def apply_resource_limits(self) -> bool:
+		"""
+		Apply the resource limit options to the running service, so they take effect without a restart
+
+		Only the limits set in the drop-in are sent, those left to the unit's own settings are not touched.
+
+		:return:
+		"""
+		config = self.get_systemd_config()
+		properties = {}
+		for key in self.RUNTIME_PROPERTIES:
+			if key in config.values.get('Service', {}):
+				properties[key] = config.values['Service'][key]
+		if len(properties) == 0:
+			return True
+		if not get_systemd_backend().set_properties(self.service, properties):
+			print('Unable to apply resource limits to %s, they will apply on the next start' % self.service, file=sys.stderr)
+			return False
+		self.invalidate_state()
+		return True
+
 	def get_options(self) -> list:
 		"""
 		Get a list of available configuration options for this service
 		:return:
 		"""
 		opts = []
-		for config in self.configs.values():
+		for config in self.get_configs():
 			opts.extend(list(config.options.keys()))
 
 		# Sort alphabetically
@@ -52,7 +220,7 @@ class BaseService:
 		:param option:
 		:return:
 		"""
-		for config in self.configs.values():
+		for config in self.get_configs():
 			if option in config.options:
 				return config.get_value(option)
 
@@ -65,7 +233,7 @@ class BaseService:
 		:param option:
 		:return:
 		"""
-		for config in self.configs.values():
+		for config in self.get_configs():
 			if option in config.options:
 				return config.get_default(option)
 
@@ -78,7 +246,7 @@ class BaseService:
 		:param option:
 		:return:
 		"""
-		for config in self.configs.values():
+		for config in self.get_configs():
 			if option in config.options:
 				return config.get_type(option)
 
@@ -91,7 +259,7 @@ class BaseService:
 		:param option:
 		:return:
 		"""
-		for config in self.configs.values():
+		for config in self.get_configs():
 			if option in config.options:
 				return config.options[option][4]
 
@@ -115,15 +283,30 @@ class BaseService:
 		:param value:
 		:return:
 		"""
-		for config in self.configs.values():
+		for config in self.get_configs():
 			if option in config.options:
 				previous_value = config.get_value(option)
 				if previous_value == value:
 					# No change
 					return
 
+				if config is self._systemd_config and os.geteuid() != 0:
+					print('ERROR - Unable to change the systemd options of %s unless run with sudo' % self.service, file=sys.stderr)
+					return
+
 				config.set_value(option, value)
 				config.save()
+				if config is self._systemd_config:
+					key = config.options[option][1]
+					backend = get_systemd_backend()
+					# Unit drop-ins only take effect once systemd reloads them
+					backend.reload()
+					if key in self.RUNTIME_PROPERTIES:
+						if not config.has_value(option) and backend.clear_runtime_property(self.service, key):
+							# The running instance keeps the previous limit
+							print('%s removed, takes effect when %s is next started' % (option, self.service))
+						elif config.has_value(option) and self.is_active():
+							self.apply_resource_limits()
 
 				self.option_value_updated(option, previous_value, value)
 				return
@@ -136,7 +319,7 @@ class BaseService:
 		:param option:
 		:return:
 		"""
-		for config in self.configs.values():
+		for config in self.get_configs():
 			if option in config.options:
 				return config.has_value(option)
 
@@ -149,7 +332,7 @@ class BaseService:
 		:param options:
 		:return:
 		"""
-		for config in self.configs.values():
+		for config in self.get_configs():
 			if option in config.options:
 				return config.get_options(option)
 
@@ -222,75 +405,261 @@ class BaseService:
 		"""
 		pass
 
+	def _get_state(self) -> dict:
+		"""
+		Get the systemd state of this service
+
+		All properties are retrieved in a single query and cached for `state_ttl` seconds,
+		(or primed for all instances at once via BaseApp.load_service_states).
+
+		:return:
+		"""
+		if self._state is None or time.time() - self._state_time > self.state_ttl:
+			snapshot = ServiceStateSnapshot([self.service]).refresh(get_systemd_backend())
+			self.set_state(snapshot.get(self.service), snapshot.timestamp)
+
+		return self._state
+
+	def set_state(self, state: dict, timestamp: float):
+		"""
+		Store the systemd state of this service in the cache
+
+		:param state: State as retrieved in a ServiceStateSnapshot
+		:param timestamp: Time the state was retrieved
+		:return:
+		"""
+		self._state = state
+		self._state_time = timestamp
+
+	def invalidate_state(self):
+		"""
+		Discard the cached systemd state so the next lookup queries systemd
+
+		Must be called after any action which changes the state of the service.
+
+		:return:
+		"""
+		self._state = None
+
 	def get_pid(self) -> int:
 		"""
 		Get the PID of the running service, or 0 if not running
 		:return:
 		"""
-		pid = subprocess.run([
-			'systemctl', 'show', '-p', 'MainPID', self.service
-		], stdout=subprocess.PIPE).stdout.decode().strip()[8:]
-
-		return int(pid)
+		return self._get_state()['MainPID']
 
 	def get_process_status(self) -> int:
-		return int(subprocess.run([
-			'systemctl', 'show', '-p', 'ExecMainStatus', self.service
-		], stdout=subprocess.PIPE).stdout.decode().strip()[15:])
+		return self._get_state()['ExecMainStatus']
+
+	def get_start_time(self) -> Union[int, None]:
+		"""
+		Get the time the main process of this service was last started, or None if it never was
+		:return:
+		"""
+		return self._get_state()['ExecMainStartTimestamp']
 
 	def get_game_pid(self) -> int:
 		"""
 		Get the primary game process PID of the actual game server, or 0 if not running
+
+		Found among the descendants of the service's main process, (see game_process_pattern),
+		falling back to the main process itself.
 		:return:
 		"""
-		pass
+		pid = self.get_pid()
+		if pid == 0:
+			return 0
 
-	def get_memory_usage(self) -> str:
+		control_group = self._get_state()['ControlGroup'] or CgroupReader.unit_control_group(self.service)
+		cgroup_procs = os.path.join(CgroupReader().get_path(control_group), 'cgroup.procs')
+		return self.game.get_process_tree().find_game_pid(self.service, pid, self.game_process_pattern, cgroup_procs) or pid
+
+	def get_process_metrics(self) -> Union[dict, None]:
 		"""
-		Get the formatted memory usage of the service, or N/A if not running
+		Get the CPU and memory usage of the game process, or None if not running
+
+		* pid - int: PID of the sampled game process
+		* cpu_percent - float: CPU usage since the previous sample, (100 = one full core)
+		* rss_bytes - int: Resident memory of the process
+		* pss_bytes - int: Proportional share of resident memory, (None if not readable)
+
 		:return:
 		"""
-
 		pid = self.get_game_pid()
 
 		if pid == 0 or pid is None:
-			return 'N/A'
+			return None
 
-		mem = subprocess.run([
-			'ps', 'h', '-p', str(pid), '-o', 'rss'
-		], stdout=subprocess.PIPE).stdout.decode().strip()
+		return self.game.get_process_sampler().sample(pid)
 
-		if mem.isdigit():
-			mem = int(mem)
-			if mem >= 1024 * 1024:
-				mem_gb = mem / (1024 * 1024)
-				return '%.2f GB' % mem_gb
-			else:
-				mem_mb = mem // 1024
-				return '%.0f MB' % mem_mb
-		else:
-			return 'N/A'
+	def get_memory_trend(self, process: Union[dict, None] = None) -> Union[dict, None]:
+		"""
+		Record the memory of the game process and get its growth, (see MemoryTrend.fit)
 
-	def get_cpu_usage(self) -> str:
+		:param process: Result of get_process_metrics when already sampled
+		:return: None if not running or there is not enough history yet
 		"""
-		Get the formatted CPU usage of the service, or N/A if not running
+		if process is None:
+			process = self.get_process_metrics()
+		if process is None:
+			return None
+
+		stat = self.game.get_process_sampler().read_stat(process['pid'])
+		if stat is None:
+			return None
+
+		trend = self.game.get_memory_trend()
+		trend.record(self.service, stat['start'], process['rss_bytes'], time.time())
+		return trend.fit(self.service)
+
+	def get_memory_threshold(self, rss: int) -> Union[int, None]:
+		"""
+		Get the memory the game process should stay below
+
+		90% of the service's MemoryMax when one is set, otherwise the point at which the host
+		would have less than 10% of its memory available.
+
+		:param rss: Current resident memory of the game process
+		:return: None if it cannot be determined
+		"""
+		control_group = self._get_state()['ControlGroup'] or CgroupReader.unit_control_group(self.service)
+		limits = CgroupReader().read_limits(control_group)
+		if limits is not None and limits['memory_max_bytes']:
+			return int(limits['memory_max_bytes'] * 0.9)
+
+		meminfo = HostStatsReader().read_meminfo() or {}
+		if 'MemAvailable' not in meminfo or 'MemTotal' not in meminfo:
+			return None
+		return int(rss + meminfo['MemAvailable'] - meminfo['MemTotal'] * 0.1)
+
+	def get_crash_loop(self) -> dict:
+		"""
+		Record the restart count and latest exit of this service and get its crash loop state, (see CrashLoopTracker.report)
+
 		:return:
 		"""
+		return self.game.get_crash_tracker().observe(self.service, self._get_state(), time.time())
+
+	def get_io_metrics(self) -> Union[dict, None]:
+		"""
+		Get the disk I/O of the game process, (see ProcessSampler.sample_io)
 
+		:return: None if not running
+		"""
+		pid = self.get_game_pid()
+
+		if pid == 0 or pid is None:
+			return None
+
+		return self.game.get_process_sampler().sample_io(pid)
+
+	def get_thread_metrics(self, top: int = 5) -> Union[dict, None]:
+		"""
+		Get the CPU usage of the busiest threads of the game process, (see ProcessSampler.sample_threads)
+
+		:param top: Number of threads to list
+		:return: None if not running
+		"""
 		pid = self.get_game_pid()
 
 		if pid == 0 or pid is None:
+			return None
+
+		return self.game.get_process_sampler().sample_threads(pid, top)
+
+	def get_cgroup_metrics(self) -> Union[dict, None]:
+		"""
+		Get the resource usage of the whole service, (every process in its cgroup), or None if not available
+
+		Includes all values from CgroupReader.read along with rates since the previous sample:
+
+		* cpu_percent - float: CPU usage of the service, (100 = one full core)
+		* io_read_bytes_per_sec - float: Block device read rate
+		* io_write_bytes_per_sec - float: Block device write rate
+
+		:return:
+		"""
+		state = self._get_state()
+		control_group = state['ControlGroup'] or CgroupReader.unit_control_group(self.service)
+		stats = CgroupReader().read(control_group)
+		if stats is None:
+			return None
+
+		# The cgroup is recreated (and its counters reset) each time the service starts
+		sampler = self.game.get_process_sampler()
+		uptime = sampler.get_uptime()
+		start = state['ActiveEnterTimestamp'] or 0
+		stats['cpu_percent'] = None
+		stats['io_read_bytes_per_sec'] = None
+		stats['io_write_bytes_per_sec'] = None
+		if stats['cpu_usage_usec'] is not None:
+			rate = sampler.rate('cgroup_cpu:%s' % self.service, stats['cpu_usage_usec'], start, uptime)
+			stats['cpu_percent'] = None if rate is None else round(rate / 10000, 2)
+		if stats['io_read_bytes'] is not None:
+			stats['io_read_bytes_per_sec'] = sampler.rate('cgroup_io_read:%s' % self.service, stats['io_read_bytes'], start, uptime)
+			stats['io_write_bytes_per_sec'] = sampler.rate('cgroup_io_write:%s' % self.service, stats['io_write_bytes'], start, uptime)
+
+		return stats
+
+	def get_resource_limits(self, cgroup: Union[dict, None] = None) -> Union[dict, None]:
+		"""
+		Get the effective resource limits of the service, (see CgroupReader.read_limits), next to its usage
+
+		* memory_current_bytes - int: Memory charged to the service
+		* memory_percent - float|None: Memory usage as a share of memory_max_bytes
+		* cpu_percent - float|None: CPU usage since the previous sample, (compare against cpu_quota_percent)
+		* pids_current - int: Number of tasks
+
+		:param cgroup: Result of get_cgroup_metrics when already sampled
+		:return: None if the service is not running or the host does not use cgroup v2
+		"""
+		control_group = self._get_state()['ControlGroup'] or CgroupReader.unit_control_group(self.service)
+		limits = CgroupReader().read_limits(control_group)
+		if limits is None:
+			return None
+
+		if cgroup is None:
+			cgroup = self.get_cgroup_metrics() or {}
+		limits['memory_current_bytes'] = cgroup.get('memory_current_bytes')
+		limits['memory_percent'] = None
+		if limits['memory_max_bytes'] and limits['memory_current_bytes'] is not None:
+			limits['memory_percent'] = round(limits['memory_current_bytes'] / limits['memory_max_bytes'] * 100, 2)
+		limits['cpu_percent'] = cgroup.get('cpu_percent')
+		limits['pids_current'] = cgroup.get('pids_current')
+		return limits
+
+	def get_pressure(self) -> Union[dict, None]:
+		"""
+		Get the pressure stall information of the service, (see CgroupReader.read_pressure)
+
+		Shows how much of the time the game was stalled waiting for CPU, memory reclaim or IO.
+		:return: None if the service is not running or the kernel does not provide PSI
+		"""
+		control_group = self._get_state()['ControlGroup'] or CgroupReader.unit_control_group(self.service)
+		return CgroupReader().read_pressure(control_group)
+
+	def get_memory_usage(self) -> str:
+		"""
+		Get the formatted memory usage of the service, or N/A if not running
+		:return:
+		"""
+		metrics = self.get_process_metrics()
+		if metrics is None:
 			return 'N/A'
 
-		cpu = subprocess.run([
-			'ps', 'h', '-p', str(pid), '-o', '%cpu'
-		], stdout=subprocess.PIPE).stdout.decode().strip()
+		return format_bytes(metrics['rss_bytes'])
 
-		if cpu.replace('.', '', 1).isdigit():
-			return '%.0f%%' % float(cpu)
-		else:
+	def get_cpu_usage(self) -> str:
+		"""
+		Get the formatted CPU usage of the service, or N/A if not running
+		:return:
+		"""
+		metrics = self.get_process_metrics()
+		if metrics is None or metrics['cpu_percent'] is None:
 			return 'N/A'
 
+		return '%.0f%%' % metrics['cpu_percent']
+
 	def get_exec_start_status(self) -> Union[dict, None]:
 		"""
 		Get the ExecStart status of the service
@@ -345,49 +714,15 @@ class BaseService:
 		:return:
 		"""
 
-		output = subprocess.run([
-			'systemctl', 'show', '-p', lookup, self.service
-		], stdout=subprocess.PIPE).stdout.decode().strip()[len(lookup)+1:]
-		if output == '':
+		exec_status = self._get_state()[lookup]
+		if exec_status is None:
 			return None
 
-		output = output[1:-1]  # Remove surrounding {}
-		parts = output.split(' ; ')
-		result = {}
-		for part in parts:
-			if '=' not in part:
-				continue
-			key, val = part.split('=', 1)
-			key = key.strip()
-			val = val.strip()
-			if key == 'path':
-				result['path'] = val
-			elif key == 'argv[]':
-				result['arguments'] = val
-			elif key == 'start_time':
-				val = val[1:-1]  # Remove surrounding []
-				if val == 'n/a':
-					result['start_time'] = None
-				else:
-					result['start_time'] = datetime.datetime.strptime(val, '%a %Y-%m-%d %H:%M:%S %Z')
-			elif key == 'stop_time':
-				val = val[1:-1]
-				if val == 'n/a':
-					result['stop_time'] = None
-				else:
-					result['stop_time'] = datetime.datetime.strptime(val, '%a %Y-%m-%d %H:%M:%S %Z')
-			elif key == 'pid':
-				result['pid'] = int(val)
-			elif key == 'code':
-				if val == '(null)':
-					result['code'] = None
-				else:
-					result['code'] = val
-			elif key == 'status':
-				if '/' in val:
-					result['status'] = int(val.split('/')[0])
-				else:
-					result['status'] = int(val)
+		# Copy the parsed data so callers are free to modify the result
+		result = dict(exec_status)
+		for key in ('start_time', 'stop_time'):
+			if result[key] is not None:
+				result[key] = datetime.datetime.fromtimestamp(result[key])
 
 		if result['start_time'] and result['stop_time']:
 			delta = result['stop_time'] - result['start_time']
@@ -408,12 +743,7 @@ class BaseService:
 
 		:return:
 		"""
-		return subprocess.run(
-			['systemctl', 'is-enabled', self.service],
-			stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE,
-			check=False
-		).stdout.decode().strip()
+		return self._get_state()['UnitFileState']
 
 	def _is_active(self) -> str:
 		"""
@@ -428,12 +758,7 @@ class BaseService:
 
 		:return:
 		"""
-		return subprocess.run(
-			['systemctl', 'is-active', self.service],
-			stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE,
-			check=False
-		).stdout.decode().strip()
+		return self._get_state()['ActiveState']
 
 	def is_enabled(self) -> bool:
 		"""
@@ -463,6 +788,13 @@ class BaseService:
 		"""
 		return self._is_active() == 'deactivating'
 
+	def is_active(self) -> bool:
+		"""
+		Check if this service is currently running, starting or stopping
+		:return:
+		"""
+		return self._is_active() in ('active', 'reloading', 'activating', 'deactivating')
+
 	def is_api_enabled(self) -> bool:
 		"""
 		Check if an API is available for this service
@@ -478,7 +810,8 @@ class BaseService:
 		if os.geteuid() != 0:
 			print('ERROR - Unable to enable game service unless run with sudo', file=sys.stderr)
 			return
-		subprocess.run(['systemctl', 'enable', self.service])
+		get_systemd_backend().enable(self.service)
+		self.invalidate_state()
 
 	def disable(self):
 		"""
@@ -488,7 +821,8 @@ class BaseService:
 		if os.geteuid() != 0:
 			print('ERROR - Unable to disable game service unless run with sudo', file=sys.stderr)
 			return
-		subprocess.run(['systemctl', 'disable', self.service])
+		get_systemd_backend().disable(self.service)
+		self.invalidate_state()
 
 	def print_logs(self, lines: int = 20):
 		"""
@@ -509,6 +843,52 @@ class BaseService:
 			stdout=subprocess.PIPE
 		).stdout.decode()
 
+	def get_log_entries(
+		self,
+		after_cursor: Union[str, None] = None,
+		since: Union[str, None] = None,
+		until: Union[str, None] = None,
+		lines: int = 0,
+		max_bytes: int = 0
+	) -> dict:
+		"""
+		Get structured log entries from this service, (see JournalReader.read)
+
+		Pass the returned cursor as after_cursor to retrieve only entries logged since.
+
+		:param after_cursor: Only return entries logged after this journal cursor
+		:param since: Only return entries on or newer than this date
+		:param until: Only return entries on or older than this date
+		:param lines: Only return the latest N entries, (0 for no limit)
+		:param max_bytes: Maximum size of the returned messages, (0 for no limit)
+		:return:
+		"""
+		return JournalReader().read(self.service, after_cursor, since, until, lines, max_bytes)
+
+	def search_logs(
+		self,
+		pattern: Union[str, None] = None,
+		matches: Union[list, None] = None,
+		since: Union[str, None] = None,
+		until: Union[str, None] = None,
+		limit: int = 0,
+		context: int = 0,
+		ignore_case: bool = False
+	) -> Iterator[dict]:
+		"""
+		Search log entries of this service, (see JournalReader.search)
+
+		:param pattern: Regular expression the message must match
+		:param matches: Journal field matches, (ie: "PRIORITY=3")
+		:param since: Only search entries on or newer than this date
+		:param until: Only search entries on or older than this date
+		:param limit: Maximum number of matching entries, (0 for no limit)
+		:param context: Number of entries to include before and after each match
+		:param ignore_case: Match the pattern case-insensitively
+		:return:
+		"""
+		return JournalReader().search(self.service, pattern, matches, since, until, limit, context, ignore_case)
+
 	def send_message(self, message: str):
 		"""
 		Send a message to all players via the game API
@@ -538,86 +918,288 @@ class BaseService:
 		"""
 		pass
 
-	def start(self):
+	def get_ports(self) -> list:
+		"""
+		Get the resolved list of ports used by this service
+
+		Each entry contains:
+
+		* value - int: Port number
+		* config - str: Configuration option the port is set from, (None for static ports)
+		* protocol - str: 'UDP' or 'TCP'
+		* description - str: Description of the port purpose
+
+		:return:
+		"""
+		ports = []
+		for port_dat in (self.get_port_definitions() or []):
+			port_def = {}
+			if isinstance(port_dat[0], int):
+				# Port statically assigned and cannot be changed
+				port_def['value'] = port_dat[0]
+				port_def['config'] = None
+			else:
+				port_def['value'] = self.get_option_value(port_dat[0])
+				port_def['config'] = port_dat[0]
+
+			port_def['protocol'] = port_dat[1]
+			port_def['description'] = port_dat[2]
+			ports.append(port_def)
+		return ports
+
+	def get_network_metrics(self, sockets: Union[dict, None] = None) -> list:
 		"""
-		Start this service in systemd
+		Get the socket queues and drop counters of each port of this service
+
+		Each entry contains:
+
+		* port - int: Port number
+		* protocol - str: 'UDP' or 'TCP'
+		* description - str: Description of the port purpose
+		* sockets - int: Number of sockets bound to the port, (0 if not running)
+		* rx_queue_bytes - int: Bytes received but not yet read by the game, (growing = server overloaded)
+		* tx_queue_bytes - int: Bytes waiting to be sent
+		* drops - int: Datagrams dropped by the kernel since the socket was created, (UDP only)
+		* drops_per_sec - float: Drop rate since the previous sample, (UDP only)
+
+		:param sockets: Pre-read sockets as a dict of 'udp' and 'tcp' to ProcNetReader.read_sockets, (read if None)
 		:return:
 		"""
+		if sockets is None:
+			net = ProcNetReader()
+			sockets = {'udp': net.read_sockets('udp'), 'tcp': net.read_sockets('tcp')}
+
+		sampler = self.game.get_process_sampler()
+		uptime = sampler.get_uptime()
+		result = []
+		for port_def in self.get_ports():
+			protocol = port_def['protocol'].lower()
+			try:
+				port = int(port_def['value'])
+			except (TypeError, ValueError):
+				continue
+			if protocol not in sockets:
+				continue
+
+			stats = ProcNetReader.summarise_port(sockets[protocol], port)
+			drops = None
+			drops_per_sec = None
+			if protocol == 'udp':
+				drops = stats['drops']
+				if stats['sockets'] > 0:
+					# Counters restart from zero when the game recreates its sockets
+					drops_per_sec = sampler.rate('udp_drops:%s:%d' % (self.service, port), drops, stats['inode'], uptime)
+
+			result.append({
+				'port': port,
+				'protocol': port_def['protocol'],
+				'description': port_def['description'],
+				'sockets': stats['sockets'],
+				'rx_queue_bytes': stats['rx_queue_bytes'],
+				'tx_queue_bytes': stats['tx_queue_bytes'],
+				'drops': drops,
+				'drops_per_sec': drops_per_sec,
+			})
+		return result
+
+	def is_ready(self) -> Union[bool, None]:
+		"""
+		Check if the game server has finished starting and is ready for players
+
+		By default the game API is queried when available,
+		otherwise the primary port of the service must be bound.
+		Games with a more reliable indicator should override this.
+
+		:return: True/False, or None if readiness cannot be determined for this game
+		"""
+		if self.is_api_enabled():
+			return self.get_player_count() is not None
+
+		port = self.get_port()
+		if port:
+			protocol = None
+			for port_def in self.get_ports():
+				if str(port_def['value']) == str(port):
+					protocol = port_def['protocol'].lower()
+					break
+			return ProcNetReader().is_port_bound(int(port), protocol)
+
+		return None
+
+	def get_query_port(self) -> Union[int, None]:
+		"""
+		Get the Steam query port of this service, (see SteamQuery)
+
+		Only available when the game sets `steam_query`, as not every port described as a query port speaks A2S.
+		By default the first UDP port whose description mentions "query" is used.
+		Games with a differently described query port should override this.
+
+		:return: None if the game has no Steam query port
+		"""
+		if not self.steam_query:
+			return None
+
+		for port_def in self.get_ports():
+			if port_def['protocol'].upper() == 'UDP' and 'query' in (port_def['description'] or '').lower() and port_def['value']:
+				return int(port_def['value'])
+		return None
+
+	def is_responsive(self, timeout: float = 5.0) -> Union[bool, None]:
+		"""
+		Check if the running game server still answers requests, (used by the hang watchdog)
+
+		A deadlocked server keeps its process and ports open, so only a request answered by the game itself is checked.
+		Games which set `steam_query` are sent a single A2S_INFO datagram to their query port, being the cheapest,
+		otherwise the game API is queried when enabled.  Games with a cheaper indicator should override this.
+
+		:param timeout: Seconds to wait for the query port to answer
+		:return: True/False, or None if responsiveness cannot be determined for this game
+		"""
+		port = self.get_query_port()
+		if port:
+			return SteamQuery('127.0.0.1', port, timeout).ping() is not None
+
+		if self.is_api_enabled():
+			return self.get_player_count() is not None
+
+		return None
+
+	def begin_start(self) -> Union[UnitWatcher, None]:
+		"""
+		Issue the start of this service in systemd without waiting for it to complete
+
+		:return: Watcher to pass to wait_until_ready, or None if the service could not be started
+		"""
 		if self.is_running():
 			print('Game is currently running!', file=sys.stderr)
-			return
+			return None
 
 		if self.is_starting():
 			print('Game is currently starting!', file=sys.stderr)
-			return
+			return None
 
 		if os.geteuid() != 0:
-			print('ERROR - Unable to stop game service unless run with sudo', file=sys.stderr)
+			print('ERROR - Unable to start game service unless run with sudo', file=sys.stderr)
+			return None
 
-		try:
-			print('Starting game via systemd, please wait a minute...')
-			start_timer = time.time()
-			subprocess.Popen(['systemctl', 'start', self.service])
-			time.sleep(10)
+		# Read the game files ahead so the server does not wait on the disk while loading
+		self.game.prewarm()
 
-			ready = False
-			counter = 0
-			print('loading...')
-			while counter < 240:
-				counter += 1
-				pid = self.get_pid()
-				exec_status = self.get_process_status()
+		backend = get_systemd_backend()
+		# Watch before starting so no state change is missed
+		watcher = backend.watch(self.service)
+		if not backend.start(self.service):
+			watcher.close()
+			print('Unable to start %s via systemd!' % self.service, file=sys.stderr)
+			return None
+		self.invalidate_state()
+		return watcher
 
-				if exec_status != 0:
-					self.print_logs()
-					print('Game failed to start, ExecMainStatus: %s' % str(exec_status), file=sys.stderr)
-					return
+	def wait_until_ready(self, watcher: UnitWatcher, start_timer: float, progress: bool = True) -> dict:
+		"""
+		Wait for a service started with begin_start to become ready, or to fail
 
-				if pid == 0:
-					self.print_logs()
-					print('Game failed to start, no PID found.', file=sys.stderr)
-					return
+		Woken by systemd as soon as the unit changes state, (or polled when notifications are unavailable),
+		and checks is_ready every `ready_check_interval` seconds.
 
-				memory = self.get_memory_usage()
-				cpu = self.get_cpu_usage()
-				seconds_elapsed = round(time.time() - start_timer)
-				since_minutes = str(seconds_elapsed // 60)
-				since_seconds = seconds_elapsed % 60
-				if since_seconds < 10:
-					since_seconds = '0' + str(since_seconds)
-				else:
-					since_seconds = str(since_seconds)
-
-				if self.is_api_enabled():
-					players = self.get_player_count()
-					if players is not None:
-						ready = True
-						api_status = 'CONNECTED'
-					else:
-						api_status = 'waiting'
-				else:
-					api_status = 'not enabled'
-					# API is not enabled so just assume ready after some time
-					if seconds_elapsed >= 60:
-						ready = True
-
-				print(
-					'\033[1A\033[K Time: %s, PID: %s, CPU: %s, Memory: %s, API: %s' % (
-						since_minutes + ':' + since_seconds,
-						str(pid),
-						cpu,
-						memory,
-						api_status
-					)
-				)
-
-				if ready:
-					print('Game has started successfully!')
-					time.sleep(5)
+		The result contains:
+
+		* service - str: Service name
+		* status - str: 'ready', 'failed' or 'timeout'
+		* seconds - float: Time elapsed since start_timer
+		* exit_status - int: ExecMainStatus of the service
+
+		:param watcher: Watcher returned from begin_start
+		:param start_timer: time.time() of when the start was issued
+		:param progress: Print progress while waiting
+		:return:
+		"""
+		status = 'timeout'
+		was_active = False
+		next_check = 0.0
+		# systemd records monotonic timestamps in microseconds, (CLOCK_MONOTONIC, the same as time.monotonic)
+		issued = int((time.monotonic() - (time.time() - start_timer)) * 1000000)
+		try:
+			while time.time() - start_timer < self.start_timeout:
+				self.invalidate_state()
+				state = self._get_state()
+				active = state['ActiveState']
+				was_active = was_active or active in ('activating', 'active')
+				# A main process started by this start has exited, (even if the transition was not observed).
+				# The unit may still be inactive from a preceding stop until the start job runs.
+				started = state['ExecMainStartTimestampMonotonic']
+				exited = started >= issued and state['ExecMainExitTimestampMonotonic'] > started
+
+				if (
+					watcher.job_result not in (None, 'done') or
+					active == 'failed' or
+					state['SubState'] == 'auto-restart' or
+					(active == 'inactive' and (was_active or exited or watcher.job_result == 'done'))
+				):
+					status = 'failed'
 					break
-				time.sleep(1)
+
+				if active == 'active' and state['MainPID'] and time.time() >= next_check:
+					next_check = time.time() + self.ready_check_interval
+					ready = self.is_ready()
+					if progress:
+						print(
+							'\033[1A\033[K Time: %s, PID: %s, CPU: %s, Memory: %s, Ready: %s' % (
+								'%d:%02d' % divmod(round(time.time() - start_timer), 60),
+								str(state['MainPID']),
+								self.get_cpu_usage(),
+								self.get_memory_usage(),
+								'unknown' if ready is None else ('yes' if ready else 'waiting')
+							)
+						)
+					if ready is None or ready:
+						status = 'ready'
+						break
+
+				watcher.wait(max(0.1, min(1.0, next_check - time.time())))
+		finally:
+			watcher.close()
+
+		return {
+			'service': self.service,
+			'status': status,
+			'seconds': round(time.time() - start_timer, 2),
+			'exit_status': self._get_state()['ExecMainStatus'],
+		}
+
+	def start(self, progress: bool = True) -> Union[dict, None]:
+		"""
+		Start this service in systemd and wait for it to be ready
+
+		:param progress: Print progress while waiting
+		:return: Result from wait_until_ready, status 'already_running' if already running or starting, or None if it could not be started
+		"""
+		if self.is_running() or self.is_starting():
+			print('%s is already %s!' % (self.service, 'running' if self.is_running() else 'starting'), file=sys.stderr)
+			return {'service': self.service, 'status': 'already_running'}
+
+		start_timer = time.time()
+		watcher = self.begin_start()
+		if watcher is None:
+			return None
+		print('Starting game via systemd, please wait...')
+
+		try:
+			if progress:
+				print('loading...')
+			result = self.wait_until_ready(watcher, start_timer, progress)
 		except KeyboardInterrupt:
 			print('Cancelled startup wait check, (game is probably still started)')
+			return None
+
+		if result['status'] == 'ready':
+			print('Game has started successfully in %.1f seconds!' % result['seconds'])
+		elif result['status'] == 'failed':
+			self.print_logs()
+			print('Game failed to start after %.1f seconds, ExecMainStatus: %s' % (result['seconds'], str(result['exit_status'])), file=sys.stderr)
+		else:
+			print('Game did not become ready within %s seconds!' % str(self.start_timeout), file=sys.stderr)
+		return result
 
 	def pre_stop(self) -> bool:
 		"""
@@ -702,28 +1284,103 @@ class BaseService:
 			# API not available, so nothing to check.
 			return True
 
-	def stop(self):
+	def begin_stop(self) -> Union[PidWaiter, None]:
 		"""
-		Stop this service in systemd
-		:return:
+		Issue the stop of this service in systemd without waiting for it to complete
+
+		:return: Waiter to pass to wait_until_stopped, or None if the service could not be stopped
 		"""
 		if os.geteuid() != 0:
 			print('ERROR - Unable to stop game service unless run with sudo', file=sys.stderr)
-			return
+			return None
+
+		# Open the main process before stopping so its exit cannot be missed
+		waiter = PidWaiter([self.get_pid()])
+		if not get_systemd_backend().stop(self.service):
+			waiter.close()
+			print('Unable to stop %s via systemd!' % self.service, file=sys.stderr)
+			return None
+		self.invalidate_state()
+		return waiter
+
+	def wait_until_stopped(self, waiter: PidWaiter, stop_timer: float) -> dict:
+		"""
+		Wait for a service stopped with begin_stop to finish stopping
+
+		Woken as soon as the main process exits, then waits for systemd to mark the unit inactive,
+		(ExecStopPost and any remaining processes in the unit).
+
+		The result contains:
+
+		* service - str: Service name
+		* status - str: 'stopped' or 'timeout'
+		* seconds - float: Time elapsed since stop_timer
+		* exit_code - str: How the main process exited, (ie: 'exited', 'killed'), None if unknown
+		* exit_status - int: Exit status or signal number of the main process
+
+		:param waiter: Waiter returned from begin_stop
+		:param stop_timer: time.time() of when the stop was issued
+		:return:
+		"""
+		status = 'timeout'
+		try:
+			waiter.wait(max(0.0, self.stop_timeout - (time.time() - stop_timer)))
+		finally:
+			waiter.close()
+
+		watcher = get_systemd_backend().watch(self.service)
+		try:
+			while time.time() - stop_timer < self.stop_timeout:
+				self.invalidate_state()
+				if self._is_active() in ('inactive', 'failed'):
+					status = 'stopped'
+					break
+				watcher.wait(0.5)
+		finally:
+			watcher.close()
+
+		state = self._get_state()
+		return {
+			'service': self.service,
+			'status': status,
+			'seconds': round(time.time() - stop_timer, 2),
+			'exit_code': ServiceStateSnapshot.EXIT_CODES.get(state['ExecMainCode']),
+			'exit_status': state['ExecMainStatus'],
+		}
+
+	def stop(self) -> Union[dict, None]:
+		"""
+		Stop this service in systemd and wait for it to exit
+
+		:return: Result from wait_until_stopped, or None if the service was not stopped
+		"""
+		stop_timer = time.time()
+		waiter = self.begin_stop()
+		if waiter is None:
+			return None
 
 		print('Stopping server, please wait...')
-		subprocess.Popen(['systemctl', 'stop', self.service])
-		time.sleep(10)
+		result = self.wait_until_stopped(waiter, stop_timer)
+		if result['status'] == 'stopped':
+			print('%s stopped in %.1f seconds (%s, status %s)' % (self.service, result['seconds'], str(result['exit_code']), str(result['exit_status'])))
+		else:
+			print('%s did not stop within %s seconds!' % (self.service, str(self.stop_timeout)), file=sys.stderr)
+		return result
 
-	def restart(self):
+	def restart(self, progress: bool = True) -> Union[dict, None]:
 		"""
 		Restart this service in systemd
-		:return:
+
+		:param progress: Print progress while waiting for the game to start
+		:return: Result from start, the result from stop if it did not stop, status 'not_running' if it was not running, or None if it could not be stopped or started
 		"""
 		if not self.is_running():
 			print('%s is not currently running!' % self.service, file=sys.stderr)
-			return
-
-		self.stop()
-		self.start()
-
+			return {'service': self.service, 'status': 'not_running'}
+
+		result = self.stop()
+		if result is None or result['status'] != 'stopped':
+			# Starting now would race the stop still in progress
+			print('Not starting %s as it has not stopped' % self.service, file=sys.stderr)
+			return result
+		return self.start(progress)
@@ -0,0 +1,182 @@
+import os
+from typing import Union
+from scriptlets.warlock.host_stats import *
+
+
+class CgroupReader:
+	"""
+	Reads resource accounting of a systemd unit from its cgroup (v2)
+
+	Covers every process in the unit, including wrappers and their children,
+	without needing to know which process is the actual game server.
+	"""
+
+	def __init__(self, root: str = '/sys/fs/cgroup'):
+		self.root = root
+		"""
+		:type str:
+		Mount point of the unified cgroup hierarchy
+		"""
+
+	@classmethod
+	def unit_control_group(cls, unit: str) -> str:
+		"""
+		Get the default control group of a system service, (used if systemd does not report one)
+
+		:param unit:
+		:return:
+		"""
+		if not unit.endswith('.service'):
+			unit += '.service'
+		return '/system.slice/' + unit
+
+	def get_path(self, control_group: str) -> str:
+		"""
+		Get the filesystem path of a control group, (ie: "/system.slice/my-game.service")
+
+		:param control_group:
+		:return:
+		"""
+		return os.path.join(self.root, control_group.lstrip('/'))
+
+	def _read(self, control_group: str, filename: str) -> Union[str, None]:
+		try:
+			with open(os.path.join(self.get_path(control_group), filename), 'r') as f:
+				return f.read().strip()
+		except OSError:
+			return None
+
+	def _read_int(self, control_group: str, filename: str) -> Union[int, None]:
+		data = self._read(control_group, filename)
+		if data is None or not data.isdigit():
+			return None
+		return int(data)
+
+	def _read_keyed(self, control_group: str, filename: str) -> Union[dict, None]:
+		"""
+		Read a flat keyed file, (ie: cpu.stat "usage_usec 1234" lines)
+
+		:param control_group:
+		:param filename:
+		:return:
+		"""
+		data = self._read(control_group, filename)
+		if data is None:
+			return None
+		result = {}
+		for line in data.split('\n'):
+			parts = line.split()
+			if len(parts) == 2 and parts[1].isdigit():
+				result[parts[0]] = int(parts[1])
+		return result
+
+	def read_io(self, control_group: str) -> Union[dict, None]:
+		"""
+		Read io.stat, summed across all devices
+
+		:param control_group:
+		:return: dict of rbytes, wbytes, rios and wios
+		"""
+		data = self._read(control_group, 'io.stat')
+		if data is None:
+			return None
+		result = {'rbytes': 0, 'wbytes': 0, 'rios': 0, 'wios': 0}
+		for line in data.split('\n'):
+			# "8:0 rbytes=1024 wbytes=0 rios=1 wios=0 dbytes=0 dios=0"
+			for part in line.split()[1:]:
+				if '=' not in part:
+					continue
+				key, val = part.split('=', 1)
+				if key in result and val.isdigit():
+					result[key] += int(val)
+		return result
+
+	def read(self, control_group: str) -> Union[dict, None]:
+		"""
+		Read the resource usage of a control group
+
+		* memory_current_bytes - int: Memory currently charged to the group, (including page cache)
+		* memory_peak_bytes - int: Highest memory usage recorded, (None on kernels before 5.19)
+		* cpu_usage_usec - int: Total CPU time consumed
+		* cpu_user_usec - int: User CPU time consumed
+		* cpu_system_usec - int: System CPU time consumed
+		* cpu_throttled_usec - int: Time spent throttled by a CPU quota
+		* io_read_bytes - int: Bytes read from block devices
+		* io_write_bytes - int: Bytes written to block devices
+		* pids_current - int: Number of tasks in the group
+
+		:param control_group:
+		:return: None if the group does not exist, (unit not running or cgroup v1 host)
+		"""
+		if not os.path.exists(os.path.join(self.get_path(control_group), 'cgroup.procs')):
+			return None
+
+		cpu = self._read_keyed(control_group, 'cpu.stat') or {}
+		io = self.read_io(control_group) or {}
+		return {
+			'memory_current_bytes': self._read_int(control_group, 'memory.current'),
+			'memory_peak_bytes': self._read_int(control_group, 'memory.peak'),
+			'cpu_usage_usec': cpu.get('usage_usec'),
+			'cpu_user_usec': cpu.get('user_usec'),
+			'cpu_system_usec': cpu.get('system_usec'),
+			'cpu_throttled_usec': cpu.get('throttled_usec'),
+			'io_read_bytes': io.get('rbytes'),
+			'io_write_bytes': io.get('wbytes'),
+			'pids_current': self._read_int(control_group, 'pids.current'),
+		}
+
+	def read_limits(self, control_group: str) -> Union[dict, None]:
+		"""
+		Read the effective resource limits of a control group
+
+		* memory_max_bytes - int|None: Hard memory limit, (MemoryMax=)
+		* memory_high_bytes - int|None: Memory usage above which the group is throttled and reclaimed, (MemoryHigh=)
+		* cpu_quota_percent - float|None: CPU time allowed, (CPUQuota=, 100 = one full core)
+		* io_weight - int|None: Relative share of IO, (IOWeight=, 100 by default)
+		* pids_max - int|None: Maximum number of tasks, (TasksMax=)
+
+		Limits which are not set are None.
+
+		:param control_group:
+		:return: None if the group does not exist
+		"""
+		if not os.path.exists(os.path.join(self.get_path(control_group), 'cgroup.procs')):
+			return None
+
+		cpu_quota = None
+		cpu_max = self._read(control_group, 'cpu.max')
+		if cpu_max is not None:
+			# "max 100000" or "200000 100000", (quota and period in microseconds)
+			parts = cpu_max.split()
+			if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit() and int(parts[1]) > 0:
+				cpu_quota = round(int(parts[0]) / int(parts[1]) * 100, 2)
+
+		io_weight = None
+		for line in (self._read(control_group, 'io.weight') or '').split('\n'):
+			# "default 100" followed by any per-device weights
+			parts = line.split()
+			if len(parts) == 2 and parts[0] == 'default' and parts[1].isdigit():
+				io_weight = int(parts[1])
+
+		return {
+			'memory_max_bytes': self._read_int(control_group, 'memory.max'),
+			'memory_high_bytes': self._read_int(control_group, 'memory.high'),
+			'cpu_quota_percent': cpu_quota,
+			'io_weight': io_weight,
+			'pids_max': self._read_int(control_group, 'pids.max'),
+		}
+
+	def read_pressure(self, control_group: str) -> Union[dict, None]:
+		"""
+		Read the pressure stall information of a control group, (time its tasks spent waiting on a resource)
+
+		:param control_group:
+		:return: dict of cpu, memory and io, (each as HostStatsReader.parse_pressure), None if not available
+		"""
+		result = {}
+		for resource in ('cpu', 'memory', 'io'):
+			data = self._read(control_group, '%s.pressure' % resource)
+			result[resource] = None if data is None else HostStatsReader.parse_pressure(data)
+		if all(val is None for val in result.values()):
+			return None
+		return result
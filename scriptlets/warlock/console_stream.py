@@ -0,0 +1,225 @@
+import json
+import os
+import re
+import select
+import subprocess
+import time
+from typing import Union
+from scriptlets.warlock.journal_reader import *
+
+
+class ConsoleStream:
+	"""
+	Streams the live journal of one or more units to an output with batching, filtering and rate limiting
+
+	Output is read from journalctl in large chunks and written out whenever `flush_interval` has passed
+	or `flush_bytes` have been buffered, instead of flushing once per line.
+	"""
+
+	def __init__(
+		self,
+		out,
+		include: Union[str, None] = None,
+		exclude: Union[str, None] = None,
+		max_rate: int = 0,
+		prefix: bool = False
+	):
+		self.out = out
+		"""
+		:type BinaryIO:
+		Binary stream to write output to, (ie: sys.stdout.buffer)
+		"""
+
+		self.include = re.compile(include.encode('utf-8')) if include else None
+		"""
+		:type re.Pattern|None:
+		Only lines matching this expression are written
+		"""
+
+		self.exclude = re.compile(exclude.encode('utf-8')) if exclude else None
+		"""
+		:type re.Pattern|None:
+		Lines matching this expression are not written
+		"""
+
+		self.max_rate = max_rate
+		"""
+		:type int:
+		Maximum lines written per second, (0 for no limit), the number dropped is summarised once per second
+		"""
+
+		self.prefix = prefix
+		"""
+		:type bool:
+		Read the journal as JSON and prefix each line with its unit, (for interleaving multiple units)
+		"""
+
+		self.flush_interval = 0.1
+		"""
+		:type float:
+		Maximum seconds output is held in the buffer
+		"""
+
+		self.flush_bytes = 64 * 1024
+		"""
+		:type int:
+		Buffered size at which output is written immediately
+		"""
+
+		self.read_size = 64 * 1024
+		"""
+		:type int:
+		Maximum bytes read from journalctl at once
+		"""
+
+		self._partial = b''
+		self._buffer = []
+		self._buffered = 0
+		self._last_flush = 0.0
+		self._window = 0
+		self._window_lines = 0
+		self._dropped = 0
+
+	def build_command(self, units: list, lines: int = 50, journalctl: str = 'journalctl') -> list:
+		"""
+		Build the journalctl command to follow the given units
+
+		:param units: Unit names
+		:param lines: Number of previous lines to show first
+		:param journalctl: Path of the journalctl binary
+		:return:
+		"""
+		cmd = [journalctl, '-f', '-n', str(lines), '--no-pager']
+		for unit in units:
+			cmd += ['-u', unit]
+		if self.prefix:
+			cmd += ['-o', 'json', '--output-fields=MESSAGE,_SYSTEMD_UNIT']
+		return cmd
+
+	def _format(self, line: bytes) -> Union[bytes, None]:
+		"""
+		Convert a line of journalctl output into the line to display
+
+		:param line:
+		:return: None if the line is not to be displayed
+		"""
+		if not self.prefix:
+			return line + b'\n'
+
+		try:
+			data = json.loads(line)
+		except ValueError:
+			return None
+		if not isinstance(data, dict):
+			return None
+		unit = JournalReader._field(data.get('_SYSTEMD_UNIT')) or ''
+		if unit.endswith('.service'):
+			unit = unit[:-8]
+		message = JournalReader._field(data.get('MESSAGE')) or ''
+		return ('[%s] %s\n' % (unit, message)).encode('utf-8', errors='replace')
+
+	def _admit(self, now: float) -> bool:
+		"""
+		Check a line against the rate limit
+
+		:param now:
+		:return:
+		"""
+		if self.max_rate <= 0:
+			return True
+
+		window = int(now)
+		if window != self._window:
+			self._summarise_dropped()
+			self._window = window
+			self._window_lines = 0
+
+		if self._window_lines >= self.max_rate:
+			self._dropped += 1
+			return False
+		self._window_lines += 1
+		return True
+
+	def _summarise_dropped(self):
+		if self._dropped > 0:
+			self._write(b'[... %d lines dropped, over %d lines per second ...]\n' % (self._dropped, self.max_rate))
+			self._dropped = 0
+
+	def _write(self, data: bytes):
+		self._buffer.append(data)
+		self._buffered += len(data)
+
+	def feed(self, data: bytes, now: float):
+		"""
+		Process a chunk of journalctl output
+
+		:param data: Raw output, (lines may be split across chunks)
+		:param now: Current time.monotonic()
+		:return:
+		"""
+		lines = (self._partial + data).split(b'\n')
+		self._partial = lines.pop()
+
+		for line in lines:
+			formatted = self._format(line)
+			if formatted is None:
+				continue
+			if self.include is not None and self.include.search(formatted) is None:
+				continue
+			if self.exclude is not None and self.exclude.search(formatted) is not None:
+				continue
+			if self._admit(now):
+				self._write(formatted)
+
+		if self._buffered >= self.flush_bytes:
+			self.flush(now)
+
+	def tick(self, now: float):
+		"""
+		Write out anything due, (call periodically while no output arrives)
+
+		:param now: Current time.monotonic()
+		:return:
+		"""
+		if self.max_rate > 0 and int(now) != self._window:
+			self._summarise_dropped()
+		if self._buffered > 0 and now - self._last_flush >= self.flush_interval:
+			self.flush(now)
+
+	def flush(self, now: float):
+		"""
+		Write all buffered output
+
+		:param now: Current time.monotonic()
+		:return:
+		"""
+		if self._buffered > 0:
+			self.out.write(b''.join(self._buffer))
+			self.out.flush()
+			self._buffer = []
+			self._buffered = 0
+		self._last_flush = now
+
+	def run(self, proc: subprocess.Popen):
+		"""
+		Stream the output of a running journalctl until it exits
+
+		:param proc: journalctl started with stdout=subprocess.PIPE, (binary)
+		:return:
+		"""
+		fd = proc.stdout.fileno()
+		self._last_flush = time.monotonic()
+		while True:
+			readable, _, _ = select.select([fd], [], [], self.flush_interval)
+			now = time.monotonic()
+			if readable:
+				data = os.read(fd, self.read_size)
+				if not data:
+					break
+				self.feed(data, now)
+			self.tick(now)
+
+		if self._partial:
+			self.feed(b'\n', time.monotonic())
+		self._summarise_dropped()
+		self.flush(time.monotonic())
@@ -0,0 +1,202 @@
+import os
+from typing import Union
+
+
+def parse_cpulist(cpulist: str) -> list:
+	"""
+	Parse a kernel/systemd CPU list, (ie: "0-3,8,10-11")
+
+	:param cpulist:
+	:return: Sorted list of CPU numbers
+	"""
+	cpus = set()
+	for part in cpulist.replace(' ', ',').split(','):
+		part = part.strip()
+		if part == '':
+			continue
+		if '-' in part:
+			first, _, last = part.partition('-')
+			cpus.update(range(int(first), int(last) + 1))
+		else:
+			cpus.add(int(part))
+	return sorted(cpus)
+
+
+def format_cpulist(cpus: list) -> str:
+	"""
+	Format CPU numbers as a compact CPU list, (ie: "0-3,8")
+
+	:param cpus:
+	:return:
+	"""
+	ranges = []
+	for cpu in sorted(set(cpus)):
+		if len(ranges) and ranges[-1][1] == cpu - 1:
+			ranges[-1][1] = cpu
+		else:
+			ranges.append([cpu, cpu])
+	return ','.join(str(first) if first == last else '%d-%d' % (first, last) for first, last in ranges)
+
+
+class CpuTopology:
+	"""
+	Reads the NUMA node and core layout of the host, and assigns instances disjoint sets of cores
+
+	Hyperthread siblings are kept together, so two instances never share a physical core,
+	and each instance is kept within a single NUMA node whenever its share of cores fits in one.
+	"""
+
+	def __init__(self, sys_root: str = '/sys/devices/system'):
+		self.sys_root = sys_root
+
+		self._nodes = None
+		"""
+		:type dict<int, list<list<int>>>|None:
+		Cores of each NUMA node, (each core as the list of its hyperthread CPUs)
+		"""
+
+	def _read(self, *path) -> Union[str, None]:
+		try:
+			with open(os.path.join(self.sys_root, *path), 'r') as f:
+				return f.read().strip()
+		except OSError:
+			return None
+
+	def get_nodes(self) -> dict:
+		"""
+		Get the cores of each NUMA node
+
+		Hosts without NUMA information are treated as a single node 0.
+
+		:return: dict of node number to a list of cores, each a list of CPU numbers
+		"""
+		if self._nodes is not None:
+			return self._nodes
+
+		node_cpus = {}
+		try:
+			entries = os.listdir(os.path.join(self.sys_root, 'node'))
+		except OSError:
+			entries = []
+		for entry in entries:
+			if entry.startswith('node') and entry[4:].isdigit():
+				cpulist = self._read('node', entry, 'cpulist')
+				if cpulist:
+					node_cpus[int(entry[4:])] = parse_cpulist(cpulist)
+
+		if len(node_cpus) == 0:
+			online = self._read('cpu', 'online')
+			node_cpus[0] = parse_cpulist(online) if online else list(range(os.cpu_count() or 1))
+
+		self._nodes = {}
+		for node in sorted(node_cpus):
+			cores = []
+			seen = set()
+			for cpu in node_cpus[node]:
+				if cpu in seen:
+					continue
+				siblings = self._read('cpu', 'cpu%d' % cpu, 'topology', 'thread_siblings_list')
+				core = [c for c in parse_cpulist(siblings) if c in node_cpus[node]] if siblings else [cpu]
+				if cpu not in core:
+					core = [cpu]
+				seen.update(core)
+				cores.append(core)
+			self._nodes[node] = cores
+		return self._nodes
+
+	def get_cpu_nodes(self, cpus: list) -> list:
+		"""
+		Get the NUMA nodes a set of CPUs belong to
+
+		:param cpus:
+		:return:
+		"""
+		nodes = []
+		for node, cores in self.get_nodes().items():
+			if any(cpu in core for core in cores for cpu in cpus):
+				nodes.append(node)
+		return nodes
+
+	def get_numa_policy(self, nodes: list) -> dict:
+		"""
+		Get the NUMA memory policy for an instance running on the given nodes
+
+		:param nodes:
+		:return: dict of numa_policy and numa_mask, (both None on hosts with a single node)
+		"""
+		if len(self.get_nodes()) < 2 or len(nodes) == 0:
+			return {'numa_policy': None, 'numa_mask': None}
+		return {
+			# Allocate locally, but fall back to other nodes rather than OOM when the node is full
+			'numa_policy': 'preferred' if len(nodes) == 1 else 'interleave',
+			'numa_mask': format_cpulist(nodes),
+		}
+
+	def plan(self, services: list, pinned: Union[dict, None] = None) -> dict:
+		"""
+		Assign each service a disjoint set of cores
+
+		Every service receives the same number of cores, taken from the node with the most free cores;
+		leftover cores are left to the host.  Cores with any CPU of a pinned service, (including hyperthread siblings),
+		are not handed out to others.
+		When there are more services than cores, services have to share single cores.
+
+		Each result contains:
+
+		* cpus - list: CPUs assigned
+		* cpu_affinity - str: The CPUs as a CPUAffinity= list
+		* nodes - list: NUMA nodes of the CPUs
+		* numa_policy - str|None: NUMAPolicy= to apply
+		* numa_mask - str|None: NUMAMask= to apply
+		* source - str: 'manual' if pinned, otherwise 'auto'
+
+		:param services: Service names, in the order to assign them
+		:param pinned: dict of service name to a manually assigned CPU list
+		:return: dict of service name to its placement
+		"""
+		pinned = pinned or {}
+		reserved = set()
+		for cpulist in pinned.values():
+			reserved.update(parse_cpulist(cpulist))
+
+		free = {}
+		for node, cores in self.get_nodes().items():
+			free[node] = [core for core in cores if not any(c in reserved for c in core)]
+
+		auto = [svc for svc in services if svc not in pinned]
+		total = sum(len(cores) for cores in free.values())
+		share = max(1, total // len(auto)) if len(auto) else 0
+
+		result = {}
+		all_cores = [core for cores in free.values() for core in cores]
+		for index, svc in enumerate(services):
+			if svc in pinned:
+				cpus = parse_cpulist(pinned[svc])
+				source = 'manual'
+			elif total < len(auto):
+				# Not enough cores for everyone, share them out in turn
+				cpus = list(all_cores[index % len(all_cores)]) if len(all_cores) else []
+				source = 'auto'
+			else:
+				cpus = []
+				needed = share
+				while needed > 0:
+					# Prefer the node with the most free cores, to keep the instance on a single node
+					node = max(free, key=lambda n: len(free[n]))
+					taken = free[node][:needed]
+					free[node] = free[node][needed:]
+					needed -= len(taken)
+					for core in taken:
+						cpus.extend(core)
+				source = 'auto'
+
+			nodes = self.get_cpu_nodes(cpus)
+			placement = {
+				'cpus': sorted(cpus),
+				'cpu_affinity': format_cpulist(cpus),
+				'nodes': nodes,
+				'source': source,
+			}
+			placement.update(self.get_numa_policy(nodes))
+			result[svc] = placement
+		return result
@@ -0,0 +1,303 @@
+from typing import Union
+from scriptlets.warlock.json_state import *
+from scriptlets.warlock.service_state_snapshot import *
+
+
+class CrashLoopTracker:
+	"""
+	Tracks the automatic restarts and exit statuses of each instance, and holds back instances caught in a crash loop
+
+	systemd restarts a crashing instance every few seconds indefinitely, (ie: after a broken mod or update),
+	so an instance with too many crashes within WINDOW is stopped for a backoff which doubles with each
+	further loop, and quarantined, (left stopped until started manually), once LEVEL_QUARANTINE loops are reached.
+
+	History is persisted between invocations, (ie: every --get-metrics poll adds to it).
+	"""
+
+	WINDOW = 600
+	"""
+	:type int:
+	Seconds of history crashes are counted over
+	"""
+
+	MAX_CRASHES = 5
+	"""
+	:type int:
+	Number of crashes within WINDOW which is considered a crash loop
+	"""
+
+	BACKOFF = 300
+	"""
+	:type int:
+	Seconds an instance is held stopped after its first crash loop, (doubled for each further loop)
+	"""
+
+	BACKOFF_MAX = 4 * 3600
+	"""
+	:type int:
+	Longest backoff
+	"""
+
+	LEVEL_QUARANTINE = 4
+	"""
+	:type int:
+	Number of successive crash loops after which an instance is quarantined instead of backed off
+	"""
+
+	STABLE = 3600
+	"""
+	:type int:
+	Seconds without crashes after which the backoff is reset to the first level
+	"""
+
+	HISTORY = 20
+	"""
+	:type int:
+	Number of failed exits kept for each instance
+	"""
+
+	CLEAN_SIGNALS = (1, 2, 15)
+	"""
+	:type tuple<int>:
+	Signals a process is expected to be stopped with, (SIGHUP, SIGINT and SIGTERM are not crashes)
+	"""
+
+	def __init__(self, state_file: Union[str, None] = None):
+		self.state_file = state_file
+		"""
+		:type str|None:
+		JSON file to persist the history to, (None to keep it in memory only)
+		"""
+
+		self._history = None
+		"""
+		:type dict<str, dict>|None:
+		Restart counts, failed exits and backoff state of each key, loaded lazily from the state file
+		"""
+
+		self._changed = False
+
+		self._touched = set()
+		"""
+		:type set<str>:
+		Keys changed since the last save
+		"""
+
+	def _load(self):
+		if self._history is not None:
+			return
+
+		self._history = load_json_state(self.state_file) if self.state_file else {}
+
+	def save(self):
+		"""
+		Persist the history so it continues on the next invocation
+
+		:return:
+		"""
+		if not self.state_file or not self._changed:
+			return
+
+		def merge(data: dict) -> dict:
+			# Only write back the keys changed here, others may have been updated by a concurrent invocation
+			for key in self._touched:
+				data[key] = self._history[key]
+			return data
+
+		update_json_state(self.state_file, merge)
+		self._touched = set()
+		self._changed = False
+
+	def _get(self, key: str) -> dict:
+		self._load()
+		if key not in self._history:
+			self._history[key] = {
+				'restarts': [],
+				'exits': [],
+				'last_exit': None,
+				'last_crash': None,
+				'reset': 0,
+				'state': 'ok',
+				'level': 0,
+				'until': None,
+			}
+		return self._history[key]
+
+	@classmethod
+	def is_failure(cls, code: str, status: int) -> bool:
+		"""
+		Check if the exit of a main process was a crash
+
+		:param code: How the process exited, (see ServiceStateSnapshot.EXIT_CODES)
+		:param status: Exit status or signal number
+		:return:
+		"""
+		if code == 'exited':
+			return status != 0
+		if code == 'killed':
+			return status not in cls.CLEAN_SIGNALS
+		return code in ('dumped', 'trapped')
+
+	def observe(self, key: str, state: dict, now: float) -> dict:
+		"""
+		Record the restart count and latest exit of an instance, and get its crash loop state
+
+		:param key: Unique key of the instance, (ie: the service name)
+		:param state: systemd state as retrieved in a ServiceStateSnapshot
+		:param now: Current time.time()
+		:return: See report
+		"""
+		entry = self._get(key)
+		restarts = state.get('NRestarts') or 0
+		exit_time = state.get('ExecMainExitTimestamp')
+		samples = entry['restarts']
+		if len(samples) and restarts == samples[-1][1] and exit_time == entry['last_exit'] and now - samples[-1][0] < self.WINDOW:
+			# Nothing happened since the previous poll
+			return self.report(key, now)
+
+		self._touched.add(key)
+		if len(samples) and restarts < samples[-1][1]:
+			# The counter is reset whenever the unit is started manually
+			samples = []
+		if len(samples) == 0 or restarts != samples[-1][1]:
+			if len(samples):
+				entry['last_crash'] = now
+			samples.append([now, restarts])
+			self._changed = True
+		# Keep the newest sample from before the window as the baseline to count from
+		old = [s for s in samples if now - s[0] > self.WINDOW]
+		entry['restarts'] = old[-1:] + [s for s in samples if now - s[0] <= self.WINDOW]
+
+		code = state.get('ExecMainCode') or 0
+		if exit_time and code != 0 and exit_time != entry['last_exit']:
+			name = ServiceStateSnapshot.EXIT_CODES.get(code, str(code))
+			entry['last_exit'] = exit_time
+			if self.is_failure(name, state.get('ExecMainStatus')):
+				entry['exits'] = (entry['exits'] + [[exit_time, name, state.get('ExecMainStatus')]])[-self.HISTORY:]
+				entry['last_crash'] = max(entry['last_crash'] or 0, exit_time)
+			self._changed = True
+
+		return self.report(key, now)
+
+	def count_crashes(self, key: str, now: float) -> int:
+		"""
+		Count the crashes of an instance within WINDOW
+
+		Exits are only seen when a poll happens to catch them, so the automatic restarts counted by systemd
+		are used when higher.
+
+		:param key:
+		:param now: Current time.time()
+		:return:
+		"""
+		entry = self._get(key)
+		since = max(now - self.WINDOW, entry['reset'])
+		failures = len([e for e in entry['exits'] if e[0] > since])
+		samples = entry['restarts']
+		if len(samples) == 0:
+			return failures
+		# Count from the latest sample taken before the window, (or the oldest known)
+		before = [s for s in samples if s[0] <= since]
+		baseline = before[-1] if len(before) else samples[0]
+		restarts = samples[-1][1] - baseline[1]
+		return max(failures, restarts)
+
+	def report(self, key: str, now: float) -> dict:
+		"""
+		Get the crash loop state of an instance
+
+		* state - str: 'ok', 'backoff' (held stopped until `until`) or 'quarantined' (held stopped until started manually)
+		* level - int: Number of successive crash loops
+		* restarts - int: Automatic restarts by systemd since the instance was last started manually
+		* crashes_in_window - int: Crashes within the last `window_seconds`
+		* window_seconds - int: WINDOW
+		* looping - bool: True if the instance is crashing too often
+		* until - float|None: End of the backoff
+		* last_crash - float|None: Time of the latest crash seen
+		* exits - list: Latest failed exits, each with `time`, `code` and `status`
+
+		:param key:
+		:param now: Current time.time()
+		:return:
+		"""
+		entry = self._get(key)
+		crashes = self.count_crashes(key, now)
+		return {
+			'state': entry['state'],
+			'level': entry['level'],
+			'restarts': entry['restarts'][-1][1] if len(entry['restarts']) else 0,
+			'crashes_in_window': crashes,
+			'window_seconds': self.WINDOW,
+			'looping': crashes >= self.MAX_CRASHES,
+			'until': entry['until'],
+			'last_crash': entry['last_crash'],
+			'exits': [{'time': e[0], 'code': e[1], 'status': e[2]} for e in entry['exits'][-5:]],
+		}
+
+	def get_backoff(self, level: int) -> int:
+		"""
+		Get the backoff of a crash loop level
+
+		:param level: 1 for the first loop
+		:return: Seconds
+		"""
+		return min(self.BACKOFF * 2 ** (level - 1), self.BACKOFF_MAX)
+
+	def decide(self, key: str, active: bool, now: float) -> dict:
+		"""
+		Advance the crash loop state of an instance, (after observe)
+
+		* action - str: 'none', 'stop' (crash loop detected) or 'start' (backoff over)
+		* reason - str: Why
+
+		:param key:
+		:param active: Whether the unit is currently active, starting or restarting
+		:param now: Current time.time()
+		:return:
+		"""
+		entry = self._get(key)
+		self._touched.add(key)
+		state = entry['state']
+		if state in ('backoff', 'quarantined'):
+			if active:
+				# Started by other means, respect the operator; another loop resumes at the next level
+				self.release(key, now)
+				return {'action': 'none', 'reason': 'started manually'}
+			if state == 'backoff' and now >= entry['until']:
+				self.release(key, now)
+				return {'action': 'start', 'reason': 'backoff over'}
+			return {'action': 'none', 'reason': state}
+
+		if self.count_crashes(key, now) >= self.MAX_CRASHES:
+			entry['level'] += 1
+			entry['reset'] = now
+			if entry['level'] >= self.LEVEL_QUARANTINE:
+				entry['state'] = 'quarantined'
+				entry['until'] = None
+				reason = 'crash loop, quarantined'
+			else:
+				entry['state'] = 'backoff'
+				entry['until'] = now + self.get_backoff(entry['level'])
+				reason = 'crash loop, backing off for %d seconds' % self.get_backoff(entry['level'])
+			self._changed = True
+			return {'action': 'stop' if active else 'none', 'reason': reason}
+
+		if entry['level'] > 0 and now - (entry['last_crash'] or 0) >= self.STABLE:
+			entry['level'] = 0
+			self._changed = True
+		return {'action': 'none', 'reason': 'ok'}
+
+	def release(self, key: str, now: float):
+		"""
+		Lift the backoff or quarantine of an instance, (crashes before now are no longer counted)
+
+		:param key:
+		:param now: Current time.time()
+		:return:
+		"""
+		entry = self._get(key)
+		self._touched.add(key)
+		entry['state'] = 'ok'
+		entry['until'] = None
+		entry['reset'] = now
+		self._changed = True
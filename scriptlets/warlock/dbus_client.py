@@ -0,0 +1,536 @@
+import os
+import select
+import socket
+import struct
+import time
+from typing import Union
+
+
+class DBusError(Exception):
+	"""
+	Error reply received from the bus, (or a failure to communicate with it)
+	"""
+	def __init__(self, name: str, message: str = ''):
+		super().__init__('%s: %s' % (name, message) if message else name)
+		self.name = name
+		self.message = message
+
+
+class DBusMessage:
+	"""
+	Single message on the D-Bus wire protocol
+
+	Only the subset of the protocol required to talk to systemd is implemented;
+	file descriptor passing is not supported.
+	"""
+
+	METHOD_CALL = 1
+	METHOD_RETURN = 2
+	ERROR = 3
+	SIGNAL = 4
+
+	FLAG_NO_REPLY_EXPECTED = 0x1
+
+	FIELD_PATH = 1
+	FIELD_INTERFACE = 2
+	FIELD_MEMBER = 3
+	FIELD_ERROR_NAME = 4
+	FIELD_REPLY_SERIAL = 5
+	FIELD_DESTINATION = 6
+	FIELD_SENDER = 7
+	FIELD_SIGNATURE = 8
+
+	FIELD_TYPES = {
+		FIELD_PATH: 'o',
+		FIELD_INTERFACE: 's',
+		FIELD_MEMBER: 's',
+		FIELD_ERROR_NAME: 's',
+		FIELD_REPLY_SERIAL: 'u',
+		FIELD_DESTINATION: 's',
+		FIELD_SENDER: 's',
+		FIELD_SIGNATURE: 'g',
+	}
+
+	def __init__(self, msg_type: int, fields: dict = None, signature: str = '', body: list = None, flags: int = 0):
+		self.type = msg_type
+		self.flags = flags
+		self.serial = 0
+		self.fields = fields or {}
+		"""
+		:type dict<int, mixed>:
+		Header fields of this message, keyed by the FIELD_* code
+		"""
+		self.signature = signature
+		self.body = body or []
+
+	@property
+	def path(self) -> Union[str, None]:
+		return self.fields.get(self.FIELD_PATH)
+
+	@property
+	def interface(self) -> Union[str, None]:
+		return self.fields.get(self.FIELD_INTERFACE)
+
+	@property
+	def member(self) -> Union[str, None]:
+		return self.fields.get(self.FIELD_MEMBER)
+
+	@property
+	def reply_serial(self) -> Union[int, None]:
+		return self.fields.get(self.FIELD_REPLY_SERIAL)
+
+	@property
+	def error_name(self) -> Union[str, None]:
+		return self.fields.get(self.FIELD_ERROR_NAME)
+
+	def encode(self) -> bytes:
+		"""
+		Encode this message to its wire format, (little endian)
+
+		:return:
+		"""
+		fields = dict(self.fields)
+		if self.signature:
+			fields[self.FIELD_SIGNATURE] = self.signature
+
+		body = Marshaller()
+		if self.signature:
+			body.write(self.signature, self.body)
+
+		header = Marshaller()
+		header.write('yyyyuua(yv)', [
+			ord('l'),
+			self.type,
+			self.flags,
+			1,
+			len(body.data),
+			self.serial,
+			[(code, (self.FIELD_TYPES[code], val)) for code, val in sorted(fields.items())]
+		])
+		header.align(8)
+		return bytes(header.data) + bytes(body.data)
+
+	@classmethod
+	def decode(cls, data: bytes) -> 'DBusMessage':
+		"""
+		Decode a complete message from its wire format
+
+		:param data:
+		:raises DBusError: If the message is malformed
+		:return:
+		"""
+		try:
+			reader = Unmarshaller(data, '<' if data[0:1] == b'l' else '>')
+			_, msg_type, flags, _, body_len, serial, fields = reader.read('yyyyuua(yv)')
+			reader.align(8)
+
+			msg = cls(msg_type, flags=flags)
+			msg.serial = serial
+			msg.fields = {code: val for code, val in fields}
+			msg.signature = msg.fields.pop(cls.FIELD_SIGNATURE, '')
+			if msg.signature:
+				msg.body = reader.read(msg.signature)
+		except (struct.error, IndexError, KeyError, TypeError, ValueError) as e:
+			# UnicodeDecodeError is a ValueError
+			raise DBusError('org.freedesktop.DBus.Error.InvalidArgs', 'Malformed message: %s' % str(e))
+		return msg
+
+	@classmethod
+	def message_length(cls, data: bytes) -> Union[int, None]:
+		"""
+		Get the total length of the message at the start of the buffer, or None if not enough data is available
+
+		:param data:
+		:return:
+		"""
+		if len(data) < 16:
+			return None
+		endian = '<' if data[0:1] == b'l' else '>'
+		body_len, _, fields_len = struct.unpack(endian + 'III', data[4:16])
+		header_len = 16 + fields_len
+		header_len += (8 - header_len % 8) % 8
+		return header_len + body_len
+
+
+def split_signature(signature: str) -> list:
+	"""
+	Split a signature into its list of complete types, (ie: "sa{sv}u" -> ["s", "a{sv}", "u"])
+
+	:param signature:
+	:return:
+	"""
+	types = []
+	pos = 0
+	while pos < len(signature):
+		end = _complete_type_end(signature, pos)
+		types.append(signature[pos:end])
+		pos = end
+	return types
+
+
+def _complete_type_end(signature: str, pos: int) -> int:
+	"""
+	Get the index immediately after the complete type starting at pos
+
+	:param signature:
+	:param pos:
+	:return:
+	"""
+	char = signature[pos]
+	if char == 'a':
+		return _complete_type_end(signature, pos + 1)
+	if char in '({':
+		close = ')' if char == '(' else '}'
+		pos += 1
+		while signature[pos] != close:
+			pos = _complete_type_end(signature, pos)
+		return pos + 1
+	return pos + 1
+
+
+class Marshaller:
+	"""
+	Serialises values according to a D-Bus signature, (little endian)
+	"""
+
+	FIXED = {
+		'y': ('B', 1),
+		'b': ('I', 4),
+		'n': ('h', 2),
+		'q': ('H', 2),
+		'i': ('i', 4),
+		'u': ('I', 4),
+		'x': ('q', 8),
+		't': ('Q', 8),
+		'd': ('d', 8),
+		'h': ('I', 4),
+	}
+
+	def __init__(self):
+		self.data = bytearray()
+
+	def align(self, alignment: int):
+		self.data.extend(b'\0' * ((alignment - len(self.data) % alignment) % alignment))
+
+	def write(self, signature: str, values: list):
+		for sig, val in zip(split_signature(signature), values):
+			self.write_value(sig, val)
+
+	def write_value(self, sig: str, val):
+		char = sig[0]
+		if char in self.FIXED:
+			fmt, size = self.FIXED[char]
+			self.align(size)
+			self.data.extend(struct.pack('<' + fmt, int(val) if char == 'b' else val))
+		elif char in 'so':
+			encoded = val.encode('utf-8')
+			self.align(4)
+			self.data.extend(struct.pack('<I', len(encoded)) + encoded + b'\0')
+		elif char == 'g':
+			encoded = val.encode('ascii')
+			self.data.extend(struct.pack('<B', len(encoded)) + encoded + b'\0')
+		elif char == 'v':
+			# Variants are passed as a tuple of (signature, value)
+			self.write_value('g', val[0])
+			self.write_value(val[0], val[1])
+		elif char == '(':
+			self.align(8)
+			self.write(sig[1:-1], val)
+		elif char == 'a':
+			element = sig[1:]
+			self.align(4)
+			length_pos = len(self.data)
+			self.data.extend(b'\0\0\0\0')
+			# Padding to the first element is not included in the array length
+			self.align(8 if element[0] in '({xtd' else 4 if element[0] in 'biuhaso' else 2 if element[0] in 'nq' else 1)
+			start = len(self.data)
+			if element[0] == '{':
+				key_sig, val_sig = split_signature(element[1:-1])
+				for key, item in val.items():
+					self.align(8)
+					self.write_value(key_sig, key)
+					self.write_value(val_sig, item)
+			else:
+				for item in val:
+					self.write_value(element, item)
+			struct.pack_into('<I', self.data, length_pos, len(self.data) - start)
+		else:
+			raise DBusError('org.freedesktop.DBus.Error.InvalidSignature', 'Unsupported type %s' % char)
+
+
+class Unmarshaller:
+	"""
+	Deserialises values according to a D-Bus signature
+	"""
+
+	def __init__(self, data: bytes, endian: str = '<'):
+		self.data = data
+		self.endian = endian
+		self.pos = 0
+
+	def align(self, alignment: int):
+		self.pos += (alignment - self.pos % alignment) % alignment
+
+	def read(self, signature: str) -> list:
+		return [self.read_value(sig) for sig in split_signature(signature)]
+
+	def _check_length(self, length: int):
+		if self.pos + length > len(self.data):
+			raise DBusError('org.freedesktop.DBus.Error.InvalidArgs', 'Value runs past the end of the message')
+
+	def read_value(self, sig: str):
+		char = sig[0]
+		if char in Marshaller.FIXED:
+			fmt, size = Marshaller.FIXED[char]
+			self.align(size)
+			val = struct.unpack_from(self.endian + fmt, self.data, self.pos)[0]
+			self.pos += size
+			return bool(val) if char == 'b' else val
+		elif char in 'so':
+			self.align(4)
+			length = struct.unpack_from(self.endian + 'I', self.data, self.pos)[0]
+			self.pos += 4
+			self._check_length(length + 1)
+			val = self.data[self.pos:self.pos + length].decode('utf-8', errors='replace')
+			self.pos += length + 1
+			return val
+		elif char == 'g':
+			length = self.data[self.pos]
+			self._check_length(length + 2)
+			val = self.data[self.pos + 1:self.pos + 1 + length].decode('ascii')
+			self.pos += length + 2
+			return val
+		elif char == 'v':
+			return self.read_value(self.read_value('g'))
+		elif char == '(':
+			self.align(8)
+			return tuple(self.read(sig[1:-1]))
+		elif char == 'a':
+			element = sig[1:]
+			self.align(4)
+			length = struct.unpack_from(self.endian + 'I', self.data, self.pos)[0]
+			self.pos += 4
+			self.align(8 if element[0] in '({xtd' else 4 if element[0] in 'biuhaso' else 2 if element[0] in 'nq' else 1)
+			self._check_length(length)
+			end = self.pos + length
+			if element[0] == '{':
+				key_sig, val_sig = split_signature(element[1:-1])
+				result = {}
+				while self.pos < end:
+					self.align(8)
+					key = self.read_value(key_sig)
+					result[key] = self.read_value(val_sig)
+				return result
+			result = []
+			while self.pos < end:
+				result.append(self.read_value(element))
+			return result
+		else:
+			raise DBusError('org.freedesktop.DBus.Error.InvalidSignature', 'Unsupported type %s' % char)
+
+
+class DBusConnection:
+	"""
+	Minimal blocking client connection to a D-Bus message bus over its unix socket
+	"""
+
+	SYSTEM_BUS_PATH = '/run/dbus/system_bus_socket'
+
+	def __init__(self, path: str = None, timeout: float = 5.0):
+		self.path = path or self.SYSTEM_BUS_PATH
+		self.timeout = timeout
+		self.unique_name = None
+		self._sock = None
+		self._buffer = b''
+		self._serial = 0
+		self._replies = {}
+		"""
+		:type dict<int, DBusMessage>:
+		Replies received while waiting for a different message
+		"""
+		self._signals = []
+		"""
+		:type list<DBusMessage>:
+		Signals received while waiting for method replies
+		"""
+
+	def connect(self) -> 'DBusConnection':
+		"""
+		Connect and authenticate to the bus
+
+		:return:
+		"""
+		self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._sock.settimeout(self.timeout)
+		try:
+			self._sock.connect(self.path)
+			uid = str(os.geteuid()).encode('ascii').hex()
+			self._sock.sendall(b'\0AUTH EXTERNAL ' + uid.encode('ascii') + b'\r\n')
+			line = self._read_line()
+			if not line.startswith(b'OK'):
+				raise DBusError('org.freedesktop.DBus.Error.AuthFailed', line.decode('ascii', errors='replace'))
+			self._sock.sendall(b'BEGIN\r\n')
+			self.unique_name = self.call(
+				'org.freedesktop.DBus', '/org/freedesktop/DBus', 'org.freedesktop.DBus', 'Hello'
+			)[0]
+		except (OSError, DBusError):
+			self.close()
+			raise
+		return self
+
+	@property
+	def connected(self) -> bool:
+		return self._sock is not None
+
+	def close(self):
+		if self._sock is not None:
+			self._sock.close()
+			self._sock = None
+		self._buffer = b''
+
+	def _read_line(self) -> bytes:
+		while b'\r\n' not in self._buffer:
+			if self._sock is None:
+				raise DBusError('org.freedesktop.DBus.Error.Disconnected', 'Not connected')
+			chunk = self._sock.recv(4096)
+			if not chunk:
+				raise DBusError('org.freedesktop.DBus.Error.Disconnected', 'Connection closed during authentication')
+			self._buffer += chunk
+		line, self._buffer = self._buffer.split(b'\r\n', 1)
+		return line
+
+	def send(self, msg: DBusMessage) -> int:
+		"""
+		Send a message on the bus and return its serial
+
+		:param msg:
+		:return:
+		"""
+		if self._sock is None:
+			raise DBusError('org.freedesktop.DBus.Error.Disconnected', 'Not connected')
+		self._serial += 1
+		msg.serial = self._serial
+		self._sock.sendall(msg.encode())
+		return msg.serial
+
+	def read_message(self, timeout: Union[float, None] = None) -> Union[DBusMessage, None]:
+		"""
+		Read the next message from the bus, or None if the timeout elapsed first
+
+		:param timeout: Seconds to wait, (None to use the connection timeout)
+		:return:
+		"""
+		if timeout is None:
+			timeout = self.timeout
+		deadline = time.monotonic() + timeout
+		while True:
+			length = DBusMessage.message_length(self._buffer)
+			if length is not None and len(self._buffer) >= length:
+				data, self._buffer = self._buffer[:length], self._buffer[length:]
+				try:
+					return DBusMessage.decode(data)
+				except DBusError:
+					# The stream cannot be trusted past a malformed message
+					self.close()
+					raise
+
+			if self._sock is None:
+				raise DBusError('org.freedesktop.DBus.Error.Disconnected', 'Not connected')
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				return None
+			ready, _, _ = select.select([self._sock], [], [], remaining)
+			if not ready:
+				return None
+			chunk = self._sock.recv(65536)
+			if not chunk:
+				self.close()
+				raise DBusError('org.freedesktop.DBus.Error.Disconnected', 'Connection closed by the bus')
+			self._buffer += chunk
+
+	def read_signal(self, timeout: Union[float, None] = None) -> Union[DBusMessage, None]:
+		"""
+		Read the next signal from the bus, or None if the timeout elapsed first
+
+		:param timeout:
+		:return:
+		"""
+		if len(self._signals):
+			return self._signals.pop(0)
+
+		deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+		while True:
+			msg = self.read_message(max(0.0, deadline - time.monotonic()))
+			if msg is None:
+				return None
+			if msg.type == DBusMessage.SIGNAL:
+				return msg
+			if msg.reply_serial is not None:
+				self._replies[msg.reply_serial] = msg
+
+	def _wait_reply(self, serial: int) -> DBusMessage:
+		deadline = time.monotonic() + self.timeout
+		while serial not in self._replies:
+			msg = self.read_message(max(0.0, deadline - time.monotonic()))
+			if msg is None:
+				raise DBusError('org.freedesktop.DBus.Error.Timeout', 'No reply within %s seconds' % self.timeout)
+			if msg.type == DBusMessage.SIGNAL:
+				self._signals.append(msg)
+			elif msg.reply_serial is not None:
+				self._replies[msg.reply_serial] = msg
+		return self._replies.pop(serial)
+
+	@classmethod
+	def method_call(cls, destination: str, path: str, interface: str, member: str, signature: str = '', args: list = None) -> DBusMessage:
+		return DBusMessage(
+			DBusMessage.METHOD_CALL,
+			{
+				DBusMessage.FIELD_PATH: path,
+				DBusMessage.FIELD_INTERFACE: interface,
+				DBusMessage.FIELD_MEMBER: member,
+				DBusMessage.FIELD_DESTINATION: destination,
+			},
+			signature,
+			list(args or [])
+		)
+
+	def call(self, destination: str, path: str, interface: str, member: str, signature: str = '', args: list = None) -> list:
+		"""
+		Call a method on the bus and wait for its reply
+
+		:raises DBusError: If the bus returns an error or does not reply
+		:return: List of values from the reply body
+		"""
+		return self.call_many([(destination, path, interface, member, signature, args)])[0]
+
+	def call_many(self, calls: list, raise_errors: bool = True) -> list:
+		"""
+		Send multiple method calls at once and wait for all replies
+
+		Pipelining the calls avoids waiting for a round trip on each.
+
+		:param calls: List of (destination, path, interface, member, signature, args)
+		:param raise_errors: Raise on the first error reply, (otherwise DBusError instances are returned in place)
+		:return: List of reply bodies, in the same order as the calls
+		"""
+		serials = [self.send(self.method_call(*call)) for call in calls]
+		results = []
+		for serial in serials:
+			reply = self._wait_reply(serial)
+			if reply.type == DBusMessage.ERROR:
+				err = DBusError(reply.error_name, reply.body[0] if len(reply.body) else '')
+				if raise_errors:
+					raise err
+				results.append(err)
+			else:
+				results.append(reply.body)
+		return results
+
+	def add_match(self, rule: str):
+		"""
+		Subscribe to signals matching the given rule
+
+		:param rule: ie: "type='signal',interface='org.freedesktop.systemd1.Manager'"
+		:return:
+		"""
+		self.call('org.freedesktop.DBus', '/org/freedesktop/DBus', 'org.freedesktop.DBus', 'AddMatch', 's', [rule])
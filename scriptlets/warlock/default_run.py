@@ -4,7 +4,19 @@ import sys
 import time
 import os
 import logging
+import re
+import subprocess
+import threading
 from scriptlets._common.get_wan_ip import *
+from scriptlets.warlock.console_stream import *
+from scriptlets.warlock.hang_watchdog import *
+from scriptlets.warlock.hibernation import *
+from scriptlets.warlock.host_stats import *
+from scriptlets.warlock.journal_reader import *
+from scriptlets.warlock.memory_trend import *
+from scriptlets.warlock.proc_net import *
+from scriptlets.warlock.service_executor import *
+from scriptlets.warlock.start_scheduler import *
 
 
 def menu_delayed_action_game(game, action):
@@ -93,16 +105,16 @@ def menu_delayed_action(service, action):
 
 	:param service:
 	:param action:
-	:return:
+	:return: Result of BaseService.stop or restart, None if it was not performed
 	"""
 
 	if not action in ['stop', 'restart']:
 		print('ERROR - Invalid action for delayed action: %s' % action, file=sys.stderr)
-		return
+		return None
 
 	if os.geteuid() != 0:
 		print('ERROR - Unable to stop game service unless run with sudo', file=sys.stderr)
-		return
+		return None
 
 	start = round(time.time())
 	msg = service.game.get_option_value('%s_delayed' % action)
@@ -135,9 +147,9 @@ def menu_delayed_action(service, action):
 		time.sleep(60)
 
 	if action == 'stop':
-		service.stop()
+		return service.stop()
 	else:
-		service.restart()
+		return service.restart()
 
 
 def menu_get_services(game):
@@ -149,6 +161,8 @@ def menu_get_services(game):
 	"""
 	services = game.get_services()
 	stats = {}
+	# Retrieve the systemd state of all instances in one call
+	game.load_service_states()
 	for svc in services:
 		svc_stats = {
 			'service': svc.service,
@@ -157,20 +171,29 @@ def menu_get_services(game):
 			'port': svc.get_port(),
 			'enabled': svc.is_enabled(),
 			'max_players': svc.get_player_max(),
+			'placement': svc.get_cpu_placement(),
 		}
 		stats[svc.service] = svc_stats
 	print(json.dumps(stats))
 
 
-def menu_get_metrics(game):
+def get_metrics(game, threads: int = 0) -> dict:
 	"""
-	Get performance metrics for all services for this game in JSON format
+	Get performance metrics for all services for this game
 
 	:param game:
-	:return:
+	:param threads: Number of the busiest threads of each game process to include, (0 to skip sampling threads)
+	:return: dict of service name to its metrics
 	"""
 	services = game.get_services()
 	stats = {}
+	# Retrieve the systemd state of all instances in one call
+	game.load_service_states()
+
+	# Socket tables are shared by all instances, so only read them once
+	net = ProcNetReader()
+	sockets = {'udp': net.read_sockets('udp'), 'tcp': net.read_sockets('tcp')}
+
 	for svc in services:
 		if svc.is_starting():
 			status = 'starting'
@@ -192,6 +215,9 @@ def menu_get_metrics(game):
 		if start_exec and start_exec['stop_time']:
 			start_exec['stop_time'] = int(start_exec['stop_time'].timestamp())
 
+		process = svc.get_process_metrics() or {}
+		cgroup = svc.get_cgroup_metrics()
+
 		players = svc.get_players()
 		# Some games may not support getting a full player list
 		if players is None:
@@ -212,13 +238,270 @@ def menu_get_metrics(game):
 			'max_players': svc.get_player_max(),
 			'memory_usage': svc.get_memory_usage(),
 			'cpu_usage': svc.get_cpu_usage(),
+			'memory_bytes': process.get('rss_bytes'),
+			'memory_pss_bytes': process.get('pss_bytes'),
+			'memory_trend': svc.get_memory_trend(process) if process else None,
+			'cpu_percent': process.get('cpu_percent'),
 			'game_pid': svc.get_game_pid(),
 			'service_pid': svc.get_pid(),
 			'pre_exec': pre_exec,
 			'start_exec': start_exec,
+			'crash_loop': svc.get_crash_loop(),
+			'cgroup': cgroup,
+			'limits': svc.get_resource_limits(cgroup),
+			'pressure': svc.get_pressure(),
+			'io': svc.get_io_metrics(),
+			'network': svc.get_network_metrics(sockets),
 		}
+		if threads > 0:
+			svc_stats['threads'] = svc.get_thread_metrics(threads)
 		stats[svc.service] = svc_stats
-	print(json.dumps(stats))
+	return stats
+
+
+def menu_get_metrics(game, threads: int = 0):
+	"""
+	Get performance metrics for all services for this game in JSON format
+
+	:param game:
+	:param threads: Number of the busiest threads of each game process to include, (0 to skip sampling threads)
+	:return:
+	"""
+	print(json.dumps(get_metrics(game, threads)))
+
+
+def get_host_metrics(game) -> dict:
+	"""
+	Get host-wide metrics, along with those shared by all services of this game
+
+	:param game:
+	:return: dict of HostStatsReader.collect with udp and save_directory added
+	"""
+	here = os.path.dirname(os.path.realpath(__file__))
+	sampler = game.get_process_sampler()
+	host = HostStatsReader().collect(here, sampler)
+
+	udp = ProcNetReader().read_snmp().get('Udp')
+	if udp is not None:
+		uptime = sampler.get_uptime()
+		for counter in ('InErrors', 'RcvbufErrors', 'SndbufErrors'):
+			if counter in udp:
+				udp[counter + '_per_sec'] = sampler.rate('host_udp:' + counter, udp[counter], 0, uptime)
+	host['udp'] = udp
+	host['save_directory'] = game.get_save_directory_size()
+	return host
+
+
+def menu_get_host_metrics(game, services: bool = False, threads: int = 0):
+	"""
+	Get host-wide load, memory, CPU, network and disk usage in JSON format
+
+	:param game:
+	:param services: Include the metrics of all services, (as --get-metrics), in the same document
+	:param threads: Number of the busiest threads of each game process to include, (see menu_get_metrics)
+	:return:
+	"""
+	host = get_host_metrics(game)
+	if services:
+		print(json.dumps({'host': host, 'services': get_metrics(game, threads)}))
+	else:
+		print(json.dumps(host))
+
+
+def menu_hibernate(services: list, idle_minutes: float):
+	"""
+	Hibernate the given services whenever they are empty, until interrupted
+
+	:param services:
+	:param idle_minutes: Minutes without players before an instance is stopped
+	:return:
+	"""
+	if os.geteuid() != 0:
+		print('ERROR - Unable to stop game service unless run with sudo', file=sys.stderr)
+		sys.exit(1)
+
+	stop_event = threading.Event()
+	threads = []
+	for svc in services:
+		if svc.is_running() and svc.get_player_count() is None:
+			print('WARNING: Player count of %s is not available, it will not be hibernated.' % svc.service, file=sys.stderr)
+		hibernator = Hibernator(svc, idle_minutes)
+		thread = threading.Thread(target=hibernator.run, args=(stop_event, ), daemon=True)
+		thread.start()
+		threads.append(thread)
+
+	print('Hibernating %s after %s minutes without players, press Ctrl+C to stop.' % (
+		', '.join(svc.service for svc in services), str(idle_minutes)
+	))
+	try:
+		while any(thread.is_alive() for thread in threads):
+			time.sleep(1)
+	except KeyboardInterrupt:
+		# Release any game ports being listened on
+		stop_event.set()
+		for thread in threads:
+			thread.join(5)
+
+
+def menu_watchdog(services: list, interval: float, failures: int, timeout: float):
+	"""
+	Restart the given services whenever they stop responding, (see HangWatchdog), until interrupted
+
+	:param services:
+	:param interval: Seconds between probes of a responding instance
+	:param failures: Number of failed probes in a row before an instance is restarted
+	:param timeout: Seconds each probe waits for an answer
+	:return:
+	"""
+	if os.geteuid() != 0:
+		print('ERROR - Unable to restart game service unless run with sudo', file=sys.stderr)
+		sys.exit(1)
+
+	stop_event = threading.Event()
+	threads = []
+	for svc in services:
+		if svc.is_running() and svc.is_responsive(timeout) is None:
+			print('WARNING: %s has no query port or API to probe, it will not be watched.' % svc.service, file=sys.stderr)
+		watchdog = HangWatchdog(svc, interval, failures, timeout)
+		thread = threading.Thread(target=watchdog.run, args=(stop_event, ), daemon=True)
+		thread.start()
+		threads.append(thread)
+
+	print('Watching %s every %s seconds, restarting after %d failed probes, press Ctrl+C to stop.' % (
+		', '.join(svc.service for svc in services), str(interval), failures
+	))
+	try:
+		while any(thread.is_alive() for thread in threads):
+			time.sleep(1)
+	except KeyboardInterrupt:
+		stop_event.set()
+
+
+def menu_memory_policy(game, services: list, threshold: int = 0, concurrency: int = 0) -> bool:
+	"""
+	Restart instances whose memory is predicted to reach their threshold, (see MemoryRestartPolicy)
+
+	Expected to be run periodically, each run adds a memory sample of every running instance.
+	Instances with a restart already underway, (ie: a delayed restart from a previous run still warning players),
+	are skipped.  A JSON report of the decision for each instance is printed as the final line of output.
+
+	:param game:
+	:param services:
+	:param threshold: Memory in bytes instances should stay below, (0 to use BaseService.get_memory_threshold)
+	:param concurrency: Maximum number of instances to restart at once, (0 for all)
+	:return: True if every restart succeeded
+	"""
+	policy = MemoryRestartPolicy()
+	trend = game.get_memory_trend()
+	game.load_service_states()
+	decisions = {}
+	for svc in services:
+		if not svc.is_running():
+			continue
+		process = svc.get_process_metrics()
+		if process is None:
+			continue
+		limit = threshold or svc.get_memory_threshold(process['rss_bytes'])
+		fit = svc.get_memory_trend(process)
+		if trend.has_pending_restart(svc.service, time.time()):
+			decision = {'action': 'none', 'reason': 'restart already pending', 'seconds_to_threshold': None}
+		elif limit is None:
+			decision = {'action': 'none', 'reason': 'no threshold', 'seconds_to_threshold': None}
+		else:
+			decision = policy.decide(fit, limit, svc.get_player_count())
+		decision['threshold_bytes'] = limit
+		decision['trend'] = fit
+		decisions[svc.service] = decision
+
+	# Persist the samples now, the restarts below may take up to an hour
+	trend.save()
+
+	restarts = [svc for svc in services if svc.service in decisions and decisions[svc.service]['action'] in ('restart', 'delayed_restart')]
+	success = True
+	if len(restarts):
+		def restart(svc):
+			print('Restarting %s, memory is predicted to reach %s (%s)' % (
+				svc.service, format_bytes(decisions[svc.service]['threshold_bytes']), decisions[svc.service]['reason']
+			))
+			trend.set_pending_restart(svc.service, time.time())
+			try:
+				if decisions[svc.service]['action'] == 'restart':
+					return svc.restart(False)
+				# Warns players for up to an hour first
+				return menu_delayed_action(svc, 'restart')
+			finally:
+				trend.clear_pending_restart(svc.service)
+
+		report = ServiceExecutor(concurrency).run('restart', restarts, restart, lambda r: r is not None and r['status'] == 'ready')
+		success = report['success']
+	print(json.dumps(decisions))
+	return success
+
+
+def menu_crash_guard(game, services: list, concurrency: int = 0) -> bool:
+	"""
+	Stop instances caught in a crash loop, and start them again once their backoff is over, (see CrashLoopTracker)
+
+	Expected to be run periodically, each run records the restart count and latest exit of every instance.
+	A JSON report of the crash loop state of each instance is printed as the final line of output.
+
+	:param game:
+	:param services:
+	:param concurrency: Maximum number of instances to start at once, (0 for all)
+	:return: True if every stop and start succeeded
+	"""
+	tracker = game.get_crash_tracker()
+	game.load_service_states()
+	now = time.time()
+	decisions = {}
+	for svc in services:
+		svc.get_crash_loop()
+		decision = tracker.decide(svc.service, svc.is_active(), now)
+		decision.update(tracker.report(svc.service, now))
+		decisions[svc.service] = decision
+
+	success = True
+	for svc in services:
+		if decisions[svc.service]['action'] == 'stop':
+			print('%s is crash looping (%d crashes in %d seconds), stopping it: %s' % (
+				svc.service,
+				decisions[svc.service]['crashes_in_window'],
+				decisions[svc.service]['window_seconds'],
+				decisions[svc.service]['reason']
+			))
+			result = svc.stop()
+			success = success and result is not None and result['status'] == 'stopped'
+
+	starts = [svc for svc in services if decisions[svc.service]['action'] == 'start']
+	if len(starts):
+		def start(svc):
+			print('Backoff of %s is over, starting it again' % svc.service)
+			return svc.start(False)
+
+		report = ServiceExecutor(concurrency).run('start', starts, start, lambda r: r is not None and r['status'] in ('ready', 'already_running'))
+		success = success and report['success']
+	print(json.dumps(decisions))
+	return success
+
+
+def menu_run_concurrently(action: str, services: list, concurrency: int, func, success) -> bool:
+	"""
+	Run an action across all given services concurrently
+
+	When more than one service is involved, a JSON report of the per-instance results is printed
+	as the final line of output.
+
+	:param action: Name of the action, (for the report)
+	:param services: List of services to act on
+	:param concurrency: Maximum number of services to act on at once, (0 for all)
+	:param func: Callable taking a service and returning its result
+	:param success: Callable taking a result and returning whether it succeeded
+	:return: True if the action succeeded on every service
+	"""
+	report = ServiceExecutor(concurrency).run(action, services, func, success)
+	if len(services) > 1:
+		print(json.dumps(report))
+	return report['success']
 
 
 def run_manager(game):
@@ -245,9 +528,10 @@ def run_manager(game):
 	# Service specification - some options can only be performed on a given service
 	parser.add_argument(
 		'--service',
-		help='Specify the service instance to manage (default: ALL)',
+		help='Specify the service instance to manage, can be given multiple times (default: ALL)',
 		type=str,
-		default='ALL',
+		action='append',
+		default=None,
 		metavar='service-name'
 	)
 
@@ -277,6 +561,36 @@ def run_manager(game):
 		help='Send a 1-hour warning to players before restarting the game server or specific instance when used with --service',
 		action='store_true'
 	)
+	parser.add_argument(
+		'--concurrency',
+		help='Maximum number of instances to stop or restart at once (default: 0 = all), expected to be used with --stop, --restart or --pre-stop',
+		type=int,
+		default=0
+	)
+	parser.add_argument(
+		'--start-max-load',
+		help='When starting all instances, start the next one early while the 1-minute load per CPU is below this (default: 0.8, 0 = ignore)',
+		type=float,
+		default=0.8
+	)
+	parser.add_argument(
+		'--start-max-pressure',
+		help='When starting all instances, start the next one early while CPU, memory and IO pressure are below this percentage (default: 20, 0 = ignore)',
+		type=float,
+		default=20.0
+	)
+	parser.add_argument(
+		'--start-min-memory',
+		help='When starting all instances, start the next one early while at least this many MB of memory are available (default: 2048, 0 = ignore)',
+		type=int,
+		default=2048
+	)
+	parser.add_argument(
+		'--stop-timeout',
+		help='Maximum number of seconds to wait for each instance to stop, expected to be used with --stop or --restart',
+		type=int,
+		default=0
+	)
 	game_actions.add_argument(
 		'--update',
 		help='Update the game server to the latest version',
@@ -373,6 +687,122 @@ def run_manager(game):
 		help='Get performance metrics from the game server (JSON encoded)',
 		action='store_true'
 	)
+	game_actions.add_argument(
+		'--get-host-metrics',
+		help='Get load, pressure, memory, CPU, network and disk usage of the host, along with its UDP counters and the size of the save directory (JSON encoded), combine with --get-metrics to include both in one document',
+		action='store_true'
+	)
+	game_actions.add_argument(
+		'--apply-placement',
+		help='Assign each instance its own CPU cores within a NUMA node via systemd drop-ins (JSON encoded), applied on the next start',
+		action='store_true'
+	)
+	game_actions.add_argument(
+		'--clear-placement',
+		help='Remove the CPU placement written by --apply-placement, (manually pinned instances are not affected)',
+		action='store_true'
+	)
+	game_actions.add_argument(
+		'--prewarm',
+		help='Read the game files into the page cache ahead of starting (JSON encoded), (also done automatically by --start)',
+		action='store_true'
+	)
+	service_actions.add_argument(
+		'--get-logs',
+		help='Get log entries of the game server instance with a cursor to continue from (JSON encoded, requires --service)',
+		action='store_true'
+	)
+	parser.add_argument(
+		'--after-cursor',
+		help='Only get log entries after this journal cursor, (the "cursor" returned by a previous --get-logs)',
+		type=str,
+		default='',
+		metavar='cursor'
+	)
+	parser.add_argument(
+		'--since',
+		help='Only get log entries on or newer than this date, (ie: "2024-01-31 12:00:00", "-1h" or "today")',
+		type=str,
+		default='',
+		metavar='date'
+	)
+	parser.add_argument(
+		'--until',
+		help='Only get log entries on or older than this date',
+		type=str,
+		default='',
+		metavar='date'
+	)
+	parser.add_argument(
+		'--lines',
+		help='Only get the latest N log entries (default: 100 when neither --after-cursor nor --since are used)',
+		type=int,
+		default=0
+	)
+	parser.add_argument(
+		'--max-bytes',
+		help='Maximum total size of returned log messages, the rest can be retrieved with the returned cursor (default: 0 = unlimited)',
+		type=int,
+		default=0
+	)
+	service_actions.add_argument(
+		'--search-logs',
+		help='Search log entries of the game server instance by regular expression (NDJSON encoded, requires --service)',
+		type=str,
+		default=None,
+		metavar='pattern'
+	)
+	parser.add_argument(
+		'--match',
+		help='Only search log entries with this journal field value, can be given multiple times, expected to be used with --search-logs',
+		type=str,
+		action='append',
+		default=[],
+		metavar='FIELD=value'
+	)
+	parser.add_argument(
+		'--limit',
+		help='Maximum number of matching log entries to return (default: 100, 0 = unlimited), expected to be used with --search-logs',
+		type=int,
+		default=100
+	)
+	parser.add_argument(
+		'--context',
+		help='Number of log entries to include before and after each match (default: 0), expected to be used with --search-logs',
+		type=int,
+		default=0
+	)
+	parser.add_argument(
+		'--ignore-case',
+		help='Match the --search-logs pattern case-insensitively',
+		action='store_true'
+	)
+	parser.add_argument(
+		'--include',
+		help='Only show console lines matching this regular expression, expected to be used with --console-attach',
+		type=str,
+		default=None,
+		metavar='pattern'
+	)
+	parser.add_argument(
+		'--exclude',
+		help='Hide console lines matching this regular expression, expected to be used with --console-attach',
+		type=str,
+		default=None,
+		metavar='pattern'
+	)
+	parser.add_argument(
+		'--max-rate',
+		help='Maximum console lines shown per second, the number of lines dropped is summarised (default: 0 = unlimited), expected to be used with --console-attach',
+		type=int,
+		default=0
+	)
+	parser.add_argument(
+		'--threads',
+		help='Include the N busiest threads of each game process (default: 0 = none), expected to be used with --get-metrics',
+		type=int,
+		default=0
+	)
 	service_actions.add_argument(
 		'--rcon',
 		help='Send an RCON command to the game server instance (requires --service)',
@@ -380,9 +810,59 @@ def run_manager(game):
 		default='',
 		metavar='command'
 	)
+	service_actions.add_argument(
+		'--hibernate',
+		help='Keep running and stop instances once empty for --idle-minutes, starting them again when a player connects to their ports',
+		action='store_true'
+	)
+	parser.add_argument(
+		'--idle-minutes',
+		help='Minutes without players before an instance is hibernated (default: 30), expected to be used with --hibernate',
+		type=float,
+		default=30
+	)
+	service_actions.add_argument(
+		'--watchdog',
+		help='Keep running and restart instances which stop answering probes of their query port or API, saving a thread dump and log tail first',
+		action='store_true'
+	)
+	parser.add_argument(
+		'--watchdog-interval',
+		help='Seconds between probes of a responding instance (default: 60), expected to be used with --watchdog',
+		type=float,
+		default=60
+	)
+	parser.add_argument(
+		'--watchdog-failures',
+		help='Number of failed probes in a row before an instance is restarted (default: 3), expected to be used with --watchdog',
+		type=int,
+		default=3
+	)
+	parser.add_argument(
+		'--watchdog-timeout',
+		help='Seconds each probe waits for an answer (default: 5), expected to be used with --watchdog',
+		type=float,
+		default=5
+	)
+	shared_actions.add_argument(
+		'--memory-policy',
+		help='Record the memory of each instance and restart those predicted to reach --memory-threshold soon, preferably while empty (JSON encoded), expected to be run periodically',
+		action='store_true'
+	)
+	parser.add_argument(
+		'--memory-threshold',
+		help='Memory in MB instances should stay below (default: 0 = 90%% of MemoryMax, or until the host has 10%% available), expected to be used with --memory-policy',
+		type=int,
+		default=0
+	)
+	shared_actions.add_argument(
+		'--crash-guard',
+		help='Record the restarts of each instance, stopping those caught in a crash loop for an increasing backoff and starting them again once it is over (JSON encoded), expected to be run periodically',
+		action='store_true'
+	)
 	service_actions.add_argument(
 		'--console-attach',
-		help='Attach to the live console output of the game server instance (requires --service)',
+		help='Attach to the live console output of the game server instances, (interleaved when --service is given multiple times)',
 		action='store_true'
 	)
 	args = parser.parse_args()
@@ -392,24 +872,31 @@ def run_manager(game):
 
 	services = game.get_services()
 
-	if args.service != 'ALL':
-		# User opted to manage only a single game instance
-		svc = None
-		for service in services:
-			if service.service == args.service:
-				svc = service
-				break
-		if svc is None:
-			print('Service instance %s not found!' % args.service, file=sys.stderr)
-			sys.exit(1)
-		services = [svc]
+	if args.service is None or 'ALL' in args.service:
+		args.service = 'ALL'
+	else:
+		# User opted to manage only specific game instances
+		selected = []
+		for name in args.service:
+			svc = None
+			for service in services:
+				if service.service == name:
+					svc = service
+					break
+			if svc is None:
+				print('Service instance %s not found!' % name, file=sys.stderr)
+				sys.exit(1)
+			if svc not in selected:
+				selected.append(svc)
+		services = selected
+
+	if args.stop_timeout > 0:
+		for svc in services:
+			svc.stop_timeout = args.stop_timeout
 
 	if args.pre_stop:
-		if len(services) > 1:
-			print('ERROR: --pre-stop can only be used with a single service instance at a time.', file=sys.stderr)
-			sys.exit(1)
-		svc = services[0]
-		sys.exit(0 if svc.pre_stop() else 1)
+		success = menu_run_concurrently('pre-stop', services, args.concurrency, lambda svc: svc.pre_stop(), lambda r: r)
+		sys.exit(0 if success else 1)
 	elif args.post_start:
 		if len(services) > 1:
 			print('ERROR: --post-start can only be used with a single service instance at a time.', file=sys.stderr)
@@ -417,23 +904,44 @@ def run_manager(game):
 		svc = services[0]
 		sys.exit(0 if svc.post_start() else 1)
 	elif args.stop:
-		for svc in services:
-			svc.stop()
-		sys.exit(0)
+		game.load_service_states()
+		success = menu_run_concurrently(
+			'stop',
+			services,
+			args.concurrency,
+			lambda svc: svc.stop(),
+			lambda r: r is not None and r['status'] == 'stopped'
+		)
+		sys.exit(0 if success else 1)
 	elif args.start:
 		if len(services) > 1:
-			# Start any enabled instance
+			# Start the requested instances, (or any enabled one when managing all of them),
+			# admitting each one as the host has capacity for it
+			game.load_service_states()
+			selected = []
 			for svc in services:
-				if svc.is_enabled():
-					svc.start()
+				if args.service != 'ALL' or svc.is_enabled():
+					selected.append(svc)
 				else:
 					print('Skipping %s as it is not enabled for auto-start.' % svc.service)
+			scheduler = StartScheduler(args.start_max_load, args.start_max_pressure, args.start_min_memory * 1024 * 1024)
+			report = scheduler.run(selected)
+			print(json.dumps(report))
+			sys.exit(0 if report['success'] else 1)
 		else:
-			for svc in services:
-				svc.start()
+			result = services[0].start()
+			sys.exit(0 if result is not None and result['status'] in ('ready', 'already_running') else 1)
 	elif args.restart:
-		for svc in services:
-			svc.restart()
+		game.load_service_states()
+		success = menu_run_concurrently(
+			'restart',
+			services,
+			args.concurrency,
+			# Progress lines of concurrent starts would overwrite each other
+			lambda svc: svc.restart(len(services) == 1),
+			lambda r: r is not None and r['status'] in ('ready', 'not_running')
+		)
+		sys.exit(0 if success else 1)
 	elif args.backup:
 		sys.exit(0 if game.backup(args.max_backups) else 1)
 	elif args.restore != '':
@@ -444,9 +952,27 @@ def run_manager(game):
 		sys.exit(0 if game.update() else 1)
 	elif args.get_services:
 		menu_get_services(game)
+	elif args.apply_placement or args.clear_placement:
+		if os.geteuid() != 0:
+			print('ERROR - Unable to change the CPU placement unless run with sudo', file=sys.stderr)
+			sys.exit(1)
+		placement = game.apply_cpu_placement(args.apply_placement)
+		if args.apply_placement:
+			print(json.dumps(placement))
+	elif args.prewarm:
+		result = game.prewarm(False)
+		if result is None:
+			print('This game has no files to prewarm', file=sys.stderr)
+			sys.exit(1)
+		print(json.dumps(result))
+	elif args.get_host_metrics:
+		menu_get_host_metrics(game, args.get_metrics, args.threads)
 	elif args.get_metrics:
-		menu_get_metrics(game)
+		menu_get_metrics(game, args.threads)
 	elif args.get_configs:
+		if args.service != 'ALL' and len(services) > 1:
+			print('ERROR: --get-configs can only be used with a single service instance.', file=sys.stderr)
+			sys.exit(1)
 		opts = []
 		if args.service == 'ALL':
 			source = game
@@ -467,26 +993,15 @@ def run_manager(game):
 	elif args.get_ports:
 		ports = []
 		for svc in services:
-			if not getattr(svc, 'get_port_definitions', None):
-				continue
-
-			for port_dat in svc.get_port_definitions():
-				port_def = {}
-				if isinstance(port_dat[0], int):
-					# Port statically assigned and cannot be changed
-					port_def['value'] = port_dat[0]
-					port_def['config'] = None
-				else:
-					port_def['value'] = svc.get_option_value(port_dat[0])
-					port_def['config'] = port_dat[0]
-
+			for port_def in svc.get_ports():
 				port_def['service'] = svc.service
-				port_def['protocol'] = port_dat[1]
-				port_def['description'] = port_dat[2]
 				ports.append(port_def)
 		print(json.dumps(ports))
 		sys.exit(0)
 	elif args.set_config != None:
+		if args.service != 'ALL' and len(services) > 1:
+			print('ERROR: --set-config can only be used with a single service instance.', file=sys.stderr)
+			sys.exit(1)
 		option, value = args.set_config
 		if args.service == 'ALL':
 			game.set_option(option, value)
@@ -508,17 +1023,25 @@ def run_manager(game):
 		sys.exit(0 if has_players else 1)
 	elif args.is_running:
 		is_running = False
+		if len(services) > 1:
+			game.load_service_states()
 		for svc in services:
 			if svc.is_running():
 				is_running = True
 				break
 		sys.exit(0 if is_running else 1)
 	elif args.delayed_stop:
+		if args.service != 'ALL' and len(services) > 1:
+			print('ERROR: --delayed-stop can only be used with a single service instance or all of them.', file=sys.stderr)
+			sys.exit(1)
 		if len(services) > 1:
 			menu_delayed_action_game(game, 'stop')
 		else:
 			menu_delayed_action(services[0], 'stop')
 	elif args.delayed_restart:
+		if args.service != 'ALL' and len(services) > 1:
+			print('ERROR: --delayed-restart can only be used with a single service instance or all of them.', file=sys.stderr)
+			sys.exit(1)
 		if len(services) > 1:
 			menu_delayed_action_game(game, 'restart')
 		else:
@@ -528,6 +1051,39 @@ def run_manager(game):
 			print('ERROR: --delayed-update can only be used when managing all service instances.', file=sys.stderr)
 			sys.exit(1)
 		menu_delayed_action_game(game, 'update')
+	elif args.get_logs:
+		if len(services) > 1:
+			print('ERROR: --get-logs can only be used with a single service instance.', file=sys.stderr)
+			sys.exit(1)
+		lines = args.lines
+		if lines == 0 and args.after_cursor == '' and args.since == '':
+			lines = 100
+		result = services[0].get_log_entries(args.after_cursor, args.since, args.until, lines, args.max_bytes)
+		print(json.dumps(result))
+		sys.exit(0 if result['error'] is None else 1)
+	elif args.search_logs is not None:
+		if len(services) > 1:
+			print('ERROR: --search-logs can only be used with a single service instance.', file=sys.stderr)
+			sys.exit(1)
+		for match in args.match:
+			if '=' not in match:
+				print('ERROR: --match must be in the format FIELD=value', file=sys.stderr)
+				sys.exit(1)
+		try:
+			for entry in services[0].search_logs(
+				args.search_logs,
+				args.match,
+				args.since,
+				args.until,
+				args.limit,
+				args.context,
+				args.ignore_case
+			):
+				print(json.dumps(entry))
+		except (JournalError, re.error) as e:
+			print('ERROR: Unable to search logs: %s' % str(e), file=sys.stderr)
+			sys.exit(1)
+		sys.exit(0)
 	elif args.rcon != '':
 		if len(services) > 1:
 			print('ERROR: --rcon can only be used with a single service instance.', file=sys.stderr)
@@ -542,39 +1098,54 @@ def run_manager(game):
 			sys.exit(0)
 		else:
 			sys.exit(1)
-	elif args.console_attach:
-		if len(services) > 1:
-			print('ERROR: --console-attach can only be used with a single service instance.', file=sys.stderr)
+	elif args.memory_policy:
+		if os.geteuid() != 0:
+			print('ERROR - Unable to restart game service unless run with sudo', file=sys.stderr)
 			sys.exit(1)
-		svc = services[0]
-		if not svc.is_running():
-			print('ERROR: Service %s is not running. Cannot attach to console.' % svc.service, file=sys.stderr)
+		success = menu_memory_policy(game, services, args.memory_threshold * 1024 * 1024, args.concurrency)
+		sys.exit(0 if success else 1)
+	elif args.crash_guard:
+		if os.geteuid() != 0:
+			print('ERROR - Unable to stop game service unless run with sudo', file=sys.stderr)
 			sys.exit(1)
-		
-		# Use journalctl to stream the live console output
-		import subprocess
+		success = menu_crash_guard(game, services, args.concurrency)
+		sys.exit(0 if success else 1)
+	elif args.hibernate:
+		menu_hibernate(services, args.idle_minutes)
+	elif args.watchdog:
+		menu_watchdog(services, args.watchdog_interval, args.watchdog_failures, args.watchdog_timeout)
+	elif args.console_attach:
+		running = []
+		for svc in services:
+			if svc.is_running():
+				running.append(svc)
+			else:
+				print('WARNING: Service %s is not running, not attaching to its console.' % svc.service, file=sys.stderr)
+		if len(running) == 0:
+			print('ERROR: No selected service is running. Cannot attach to console.', file=sys.stderr)
+			sys.exit(1)
+
+		# Stream the systemd journal of the services, prefixing each line with its instance when there are several
+		stream = ConsoleStream(sys.stdout.buffer, args.include, args.exclude, args.max_rate, len(running) > 1)
+		proc = None
 		try:
-			# Stream the systemd journal output for this service
 			proc = subprocess.Popen(
-				['journalctl', '-u', f'{svc.service}.service', '-f', '-n', '50', '--no-pager'],
-				stdout=subprocess.PIPE,
-				stderr=subprocess.STDOUT,
-				text=True,
-				bufsize=1
+				stream.build_command([svc.service for svc in running], args.lines or 50),
+				stdout=subprocess.PIPE
 			)
-			
-			# Stream output line by line
-			for line in iter(proc.stdout.readline, ''):
-				if line:
-					print(line, end='', flush=True)
+			stream.run(proc)
 		except KeyboardInterrupt:
-			proc.terminate()
-			proc.wait()
+			if proc is not None:
+				proc.terminate()
+				proc.wait()
 			sys.exit(0)
-		except Exception as e:
+		except (OSError, re.error) as e:
 			print(f'ERROR: Failed to attach to console: {str(e)}', file=sys.stderr)
 			sys.exit(1)
 	else:
+		if args.service != 'ALL' and len(services) > 1:
+			print('ERROR: The interactive menu can only be used with a single service instance or all of them.', file=sys.stderr)
+			sys.exit(1)
 		if len(services) > 1:
 			if not callable(getattr(sys.modules[__name__], 'menu_main', None)):
 				print('This game does not have any manageable interface, please use Warlock.', file=sys.stderr)
@@ -0,0 +1,165 @@
+import os
+import time
+from typing import Union
+from scriptlets.warlock.json_state import *
+
+
+class DirectorySizeTracker:
+	"""
+	Tracks the total size of a directory tree without walking all of it on every call
+
+	A manifest of each directory's mtime and the summed size of its files is kept between invocations.
+	Only directories whose mtime changed, (files added, removed or renamed), are scanned again.
+	As files rewritten in place do not change their directory's mtime, the whole tree is rescanned
+	every FULL_SCAN_INTERVAL seconds to pick those up.
+	"""
+
+	FULL_SCAN_INTERVAL = 3600
+	"""
+	:type int:
+	Seconds between complete rescans of the tree
+	"""
+
+	MIN_INTERVAL = 60
+	"""
+	:type int:
+	Seconds a measurement is reused for when polled frequently, (see measure)
+	"""
+
+	def __init__(self, state_file: Union[str, None] = None):
+		self.state_file = state_file
+		"""
+		:type str|None:
+		JSON file to persist the manifests to, (None to keep them in memory only)
+		"""
+
+		self._manifests = None
+		"""
+		:type dict<str, dict>|None:
+		Manifest of each tracked root, loaded lazily from the state file
+		"""
+
+		self._changed = False
+
+		self._touched = set()
+		"""
+		:type set<str>:
+		Keys changed since the last save
+		"""
+
+	def _load(self):
+		if self._manifests is not None:
+			return
+
+		self._manifests = load_json_state(self.state_file) if self.state_file else {}
+
+	def save(self):
+		"""
+		Persist the manifests so the next invocation only needs to scan what changed
+
+		:return:
+		"""
+		if not self.state_file or not self._changed:
+			return
+
+		def merge(data: dict) -> dict:
+			# Only write back the keys changed here, others may have been updated by a concurrent invocation
+			for key in self._touched:
+				data[key] = self._manifests[key]
+			return data
+
+		update_json_state(self.state_file, merge)
+		self._touched = set()
+		self._changed = False
+
+	def _scan(self, path: str, mtime_ns: int) -> dict:
+		"""
+		Scan the entries of a single directory
+
+		:param path:
+		:param mtime_ns: mtime of the directory, (taken before scanning so changes during the scan are seen next time)
+		:return: Manifest entry of mtime_ns, bytes, files and dirs
+		"""
+		entry = {'mtime_ns': mtime_ns, 'bytes': 0, 'files': 0, 'dirs': []}
+		try:
+			with os.scandir(path) as it:
+				for item in it:
+					try:
+						if item.is_dir(follow_symlinks=False):
+							entry['dirs'].append(item.name)
+						elif item.is_file(follow_symlinks=False):
+							entry['bytes'] += item.stat(follow_symlinks=False).st_size
+							entry['files'] += 1
+					except OSError:
+						# Removed during the scan
+						continue
+		except OSError:
+			pass
+		return entry
+
+	def measure(self, root: str, max_age: float = 0) -> Union[dict, None]:
+		"""
+		Get the total size of a directory tree
+
+		* path - str: The measured directory
+		* bytes - int: Total size of all files
+		* files - int: Number of files
+		* bytes_per_hour - float: Growth since the previous measurement, (None on the first one or if it shrank)
+		* scanned - int: Number of directories which had to be scanned, (the rest were unchanged)
+		* seconds - float: Time taken
+		* measured_at - float: Time of the measurement
+
+		:param root:
+		:param max_age: Return the previous measurement instead when it is younger than this many seconds
+		:return: None if the directory does not exist
+		"""
+		if not os.path.isdir(root):
+			return None
+
+		timer = time.time()
+		self._load()
+		manifest = self._manifests.get(root)
+		last = manifest.get('result') if manifest is not None else None
+		if last is not None and timer - last['measured_at'] < max_age:
+			return dict(last)
+		if manifest is None or timer - manifest['scanned_at'] >= self.FULL_SCAN_INTERVAL:
+			manifest = {'scanned_at': timer, 'dirs': {}}
+		previous = manifest['dirs']
+
+		dirs = {}
+		scanned = 0
+		queue = ['']
+		while len(queue):
+			rel = queue.pop()
+			path = os.path.join(root, rel) if rel else root
+			try:
+				mtime_ns = os.stat(path).st_mtime_ns
+			except OSError:
+				continue
+
+			entry = previous.get(rel)
+			if entry is None or entry['mtime_ns'] != mtime_ns:
+				entry = self._scan(path, mtime_ns)
+				scanned += 1
+			dirs[rel] = entry
+			queue.extend(os.path.join(rel, name) if rel else name for name in entry['dirs'])
+
+		total = sum(d['bytes'] for d in dirs.values())
+		growth = None
+		if last is not None and total >= last['bytes'] and timer > last['measured_at']:
+			growth = round((total - last['bytes']) / (timer - last['measured_at']) * 3600)
+
+		manifest['dirs'] = dirs
+		manifest['result'] = {
+			'path': root,
+			'bytes': total,
+			'files': sum(d['files'] for d in dirs.values()),
+			'bytes_per_hour': growth,
+			'scanned': scanned,
+			'seconds': round(time.time() - timer, 3),
+			'measured_at': timer,
+		}
+		self._manifests[root] = manifest
+		self._touched.add(root)
+		self._changed = True
+		return dict(manifest['result'])
@@ -0,0 +1,191 @@
+import datetime
+import json
+import sys
+import threading
+import time
+from typing import Union
+from scriptlets.warlock.process_sampler import *
+
+
+class HangWatchdog:
+	"""
+	Restarts an instance whose process is still running but no longer answers requests, (ie: a deadlocked main loop)
+
+	A healthy instance is probed once every `interval` seconds.  After a failed probe it is probed again every
+	`retry_interval` seconds, and restarted once `failures` probes in a row have failed,
+	so a hang is acted on within about interval + failures * retry_interval seconds.
+	A thread dump and the tail of the log are saved before restarting.
+	"""
+
+	def __init__(self, service, interval: float = 60, failures: int = 3, timeout: float = 5):
+		self.service = service
+		"""
+		:type BaseService:
+		"""
+
+		self.interval = interval
+		"""
+		:type float:
+		Seconds between probes while the instance is responding
+		"""
+
+		self.failures = failures
+		"""
+		:type int:
+		Number of failed probes in a row after which the instance is considered hung
+		"""
+
+		self.timeout = timeout
+		"""
+		:type float:
+		Seconds a probe waits for an answer
+		"""
+
+		self.retry_interval = min(interval, 10.0)
+		"""
+		:type float:
+		Seconds between probes once a probe has failed
+		"""
+
+		self.log_lines = 200
+		"""
+		:type int:
+		Number of log entries included in the diagnostics
+		"""
+
+		self.failed = 0
+		"""
+		:type int:
+		Number of failed probes in a row
+		"""
+
+		self._answered_start = None
+		"""
+		:type int|None:
+		Start time of the process which last answered a probe, (a server still loading has not answered yet)
+		"""
+
+	def probe(self) -> Union[bool, None]:
+		"""
+		Probe the instance once, (see BaseService.is_responsive)
+
+		:return: None if the game cannot be probed
+		"""
+		try:
+			return self.service.is_responsive(self.timeout)
+		except Exception as e:
+			print('Probe of %s failed: %s' % (self.service.service, str(e)), file=sys.stderr)
+			return False
+
+	def check(self) -> str:
+		"""
+		Probe the instance and track consecutive failures
+
+		* healthy - The instance answered
+		* starting - The instance has not answered since it was started, (failures only count once it has)
+		* failing - The probe failed, but fewer than `failures` times in a row
+		* hung - The probe failed `failures` times in a row
+		* skipped - The instance is not running or cannot be probed
+
+		:return:
+		"""
+		self.service.invalidate_state()
+		if not self.service.is_running():
+			self.failed = 0
+			return 'skipped'
+
+		result = self.probe()
+		if result is None:
+			return 'skipped'
+
+		start = self.service.get_start_time()
+		if result:
+			self.failed = 0
+			self._answered_start = start
+			return 'healthy'
+
+		if start is None or self._answered_start != start:
+			# Large servers take minutes to load before they answer anything,
+			# and a probe which never succeeded may simply not suit this game
+			self.failed = 0
+			return 'starting'
+
+		self.failed += 1
+		return 'hung' if self.failed >= self.failures else 'failing'
+
+	def capture_diagnostics(self) -> dict:
+		"""
+		Capture the state of the hung instance
+
+		* service - str: Service name
+		* time - float: Time of the capture
+		* pid - int: PID of the game process
+		* failures - int: Number of failed probes in a row
+		* threads - list: State, kernel wait channel and stack of each thread, (see ProcessSampler.read_threads)
+		* cpu - dict: CPU usage of the busiest threads over one second, (a deadlock idles, a busy loop saturates a thread)
+		* logs - dict: The latest log entries, (see BaseService.get_log_entries)
+
+		:return:
+		"""
+		pid = self.service.get_game_pid()
+		sampler = ProcessSampler()
+		sampler.sample_threads(pid)
+		time.sleep(1)
+		return {
+			'service': self.service.service,
+			'time': time.time(),
+			'pid': pid,
+			'failures': self.failed,
+			'threads': sampler.read_threads(pid),
+			'cpu': sampler.sample_threads(pid, 10),
+			'logs': self.service.get_log_entries(lines=self.log_lines),
+		}
+
+	def save_diagnostics(self, diagnostics: dict) -> Union[str, None]:
+		"""
+		Save diagnostics to the cache directory of the game
+
+		:param diagnostics: Result of capture_diagnostics
+		:return: Path of the saved file, or None if it could not be written
+		"""
+		path = self.service.game.get_cache_path('hang_%s_%s.json' % (
+			self.service.service, datetime.datetime.fromtimestamp(diagnostics['time']).strftime('%Y%m%d-%H%M%S')
+		))
+		try:
+			with open(path, 'w') as f:
+				json.dump(diagnostics, f, indent=1)
+		except OSError as e:
+			print('Unable to save diagnostics of %s: %s' % (self.service.service, e), file=sys.stderr)
+			return None
+		return path
+
+	def recover(self) -> Union[dict, None]:
+		"""
+		Save diagnostics and restart the hung instance
+
+		:return: Result of BaseService.restart
+		"""
+		path = self.save_diagnostics(self.capture_diagnostics())
+		if path is not None:
+			print('Diagnostics of %s saved to %s' % (self.service.service, path))
+		self.failed = 0
+		return self.service.restart(False)
+
+	def run(self, stop_event: Union[threading.Event, None] = None):
+		"""
+		Monitor the instance until stop_event is set
+
+		:param stop_event:
+		:return:
+		"""
+		stop_event = stop_event or threading.Event()
+		while not stop_event.is_set():
+			status = self.check()
+			if status == 'hung':
+				print('%s did not respond to %d probes in a row, restarting' % (self.service.service, self.failed))
+				self.recover()
+			elif status == 'failing':
+				print('%s did not respond (%d of %d)' % (self.service.service, self.failed, self.failures), file=sys.stderr)
+				stop_event.wait(self.retry_interval)
+				continue
+			stop_event.wait(self.interval)
@@ -0,0 +1,208 @@
+import select
+import socket
+import sys
+import threading
+import time
+from typing import Union
+
+
+class WakeListener:
+	"""
+	Listens on the game ports of a stopped instance, to start it again as soon as a player tries to connect
+
+	The first connection attempt is consumed, (game clients retry until the server responds).
+	"""
+
+	def __init__(self, ports: list, host: str = ''):
+		self.ports = ports
+		"""
+		:type list<tuple<int, str>>:
+		Port number and protocol, ('UDP' or 'TCP'), of each port to listen on
+		"""
+
+		self.host = host
+		self._sockets = {}
+
+	def open(self):
+		"""
+		Bind every port
+
+		:raises OSError: If a port cannot be bound, (ie: still in use by the game)
+		:return:
+		"""
+		try:
+			for port, protocol in self.ports:
+				if protocol.upper() == 'TCP':
+					sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+					sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+					sock.bind((self.host, port))
+					sock.listen(8)
+				else:
+					sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+					sock.bind((self.host, port))
+				self._sockets[sock] = (port, protocol.upper())
+		except OSError:
+			self.close()
+			raise
+
+	def wait(self, timeout: Union[float, None] = None) -> Union[dict, None]:
+		"""
+		Wait for a connection attempt on any port
+
+		:param timeout: Seconds to wait, (None to wait indefinitely)
+		:return: dict of port, protocol and address of the client, or None on timeout
+		"""
+		if len(self._sockets) == 0:
+			return None
+
+		ready, _, _ = select.select(list(self._sockets.keys()), [], [], timeout)
+		for sock in ready:
+			port, protocol = self._sockets[sock]
+			try:
+				if protocol == 'TCP':
+					conn, address = sock.accept()
+					conn.close()
+				else:
+					_, address = sock.recvfrom(65535)
+			except OSError:
+				continue
+			return {'port': port, 'protocol': protocol, 'address': address[0]}
+		return None
+
+	def close(self):
+		"""
+		Release every port, (must be done before the game is started)
+
+		:return:
+		"""
+		for sock in self._sockets:
+			sock.close()
+		self._sockets = {}
+
+
+class Hibernator:
+	"""
+	Stops an instance once it has had no players for a while, and starts it again when someone tries to connect
+
+	Only instances stopped by the hibernator itself are woken; instances stopped by other means are left alone.
+	"""
+
+	def __init__(self, service, idle_minutes: float = 30):
+		self.service = service
+		"""
+		:type BaseService:
+		"""
+
+		self.idle_minutes = idle_minutes
+		"""
+		:type float:
+		Minutes without players before the instance is stopped
+		"""
+
+		self.check_interval = 60.0
+		"""
+		:type float:
+		Seconds between player count checks while the instance is running
+		"""
+
+		self.poll_interval = 1.0
+		"""
+		:type float:
+		Seconds between checks that the instance has not been started by other means while hibernating
+		"""
+
+		self.idle_since = None
+		"""
+		:type float|None:
+		Time the instance was first seen without players, None while players are online
+		"""
+
+		self.hibernating = False
+
+	def check_idle(self, now: float) -> bool:
+		"""
+		Check the player count, and whether the instance has been empty for long enough to hibernate
+
+		:param now: Current time.time()
+		:return:
+		"""
+		players = self.service.get_player_count()
+		if players is None or players > 0:
+			# Unknown counts are treated as occupied, so an unreachable API never hibernates the instance
+			self.idle_since = None
+			return False
+
+		if self.idle_since is None:
+			self.idle_since = now
+		return now - self.idle_since >= self.idle_minutes * 60
+
+	def hibernate(self) -> bool:
+		"""
+		Stop the instance
+
+		:return:
+		"""
+		print('No players on %s for %s minutes, hibernating' % (self.service.service, str(self.idle_minutes)))
+		result = self.service.stop()
+		self.idle_since = None
+		self.hibernating = result is not None and result['status'] == 'stopped'
+		return self.hibernating
+
+	def get_listener(self) -> WakeListener:
+		"""
+		Get a listener for the game ports of the instance
+
+		:return:
+		"""
+		ports = [(int(p['value']), p['protocol']) for p in self.service.get_ports() if p['value']]
+		return WakeListener(ports)
+
+	def run(self, stop_event: Union[threading.Event, None] = None):
+		"""
+		Monitor the instance until stop_event is set
+
+		:param stop_event:
+		:return:
+		"""
+		stop_event = stop_event or threading.Event()
+		listener = None
+		try:
+			while not stop_event.is_set():
+				if not self.hibernating:
+					if self.service.is_running() and self.check_idle(time.time()):
+						self.hibernate()
+					else:
+						stop_event.wait(self.check_interval)
+					continue
+
+				if self.service.is_active():
+					# Started by other means, release the ports for the game
+					print('%s was started, no longer hibernating' % self.service.service)
+					if listener is not None:
+						listener.close()
+						listener = None
+					self.hibernating = False
+					continue
+
+				if listener is None:
+					listener = self.get_listener()
+					try:
+						listener.open()
+					except OSError as e:
+						print('Unable to listen on the ports of %s: %s' % (self.service.service, e), file=sys.stderr)
+						listener = None
+						stop_event.wait(self.check_interval)
+						continue
+
+				event = listener.wait(self.poll_interval)
+				if event is not None:
+					print('Connection to %s from %s on %s/%d, waking' % (
+						self.service.service, event['address'], event['protocol'], event['port']
+					))
+					listener.close()
+					listener = None
+					self.hibernating = False
+					self.service.start()
+		finally:
+			if listener is not None:
+				listener.close()
@@ -0,0 +1,230 @@
+import os
+from typing import Union
+
+
+class HostStatsReader:
+	"""
+	Reads host-wide load and resource availability from /proc
+	"""
+
+	def __init__(self, proc_root: str = '/proc'):
+		self.proc_root = proc_root
+
+		self.cpu_count = os.cpu_count() or 1
+		"""
+		:type int:
+		Number of CPUs on the host, (used to scale load averages)
+		"""
+
+		self.clock_ticks = os.sysconf('SC_CLK_TCK')
+
+	def _read(self, *path) -> Union[str, None]:
+		try:
+			with open(os.path.join(self.proc_root, *path), 'r') as f:
+				return f.read()
+		except OSError:
+			return None
+
+	def read_loadavg(self) -> Union[dict, None]:
+		"""
+		Read the load averages, both raw and per CPU
+
+		:return: dict of load1, load5, load15 and load1_per_cpu
+		"""
+		data = self._read('loadavg')
+		if data is None:
+			return None
+		# "0.52 0.58 0.59 1/1234 5678"
+		fields = data.split()
+		return {
+			'load1': float(fields[0]),
+			'load5': float(fields[1]),
+			'load15': float(fields[2]),
+			'load1_per_cpu': round(float(fields[0]) / self.cpu_count, 2),
+		}
+
+	@classmethod
+	def parse_pressure(cls, data: str) -> dict:
+		"""
+		Parse a PSI file, (/proc/pressure/* or a cgroup *.pressure file)
+
+		"some" is the share of time at least one task was stalled, "full" all tasks at once,
+		(not reported for CPU on older kernels).
+
+		:param data: Contents of the file
+		:return: dict of some_avg10, some_avg60, full_avg10 and full_avg60 as percentages
+		"""
+		result = {'some_avg10': None, 'some_avg60': None, 'full_avg10': None, 'full_avg60': None}
+		for line in data.split('\n'):
+			# "some avg10=0.00 avg60=0.00 avg300=0.00 total=0"
+			parts = line.split()
+			if len(parts) == 0 or parts[0] not in ('some', 'full'):
+				continue
+			for part in parts[1:]:
+				key, _, val = part.partition('=')
+				if key in ('avg10', 'avg60'):
+					result['%s_%s' % (parts[0], key)] = float(val)
+		return result
+
+	def read_pressure(self, resource: str) -> Union[dict, None]:
+		"""
+		Read host pressure stall information for a resource
+
+		:param resource: 'cpu', 'memory' or 'io'
+		:return: None if the kernel does not provide PSI
+		"""
+		data = self._read('pressure', resource)
+		if data is None:
+			return None
+		return self.parse_pressure(data)
+
+	def read_pressures(self) -> Union[dict, None]:
+		"""
+		Read host pressure stall information for CPU, memory and IO
+
+		:return: dict of cpu, memory and io, (each as read_pressure), None if the kernel does not provide PSI
+		"""
+		result = {resource: self.read_pressure(resource) for resource in ('cpu', 'memory', 'io')}
+		if all(val is None for val in result.values()):
+			return None
+		return result
+
+	def read_meminfo(self) -> Union[dict, None]:
+		"""
+		Read /proc/meminfo
+
+		:return: dict of field name to value in bytes, (or count for the few fields without a unit)
+		"""
+		data = self._read('meminfo')
+		if data is None:
+			return None
+		result = {}
+		for line in data.split('\n'):
+			# "MemAvailable:   12345678 kB"
+			key, _, val = line.partition(':')
+			parts = val.split()
+			if len(parts) == 0 or not parts[0].isdigit():
+				continue
+			result[key] = int(parts[0]) * (1024 if len(parts) > 1 and parts[1] == 'kB' else 1)
+		return result
+
+	def read_cpu(self) -> Union[dict, None]:
+		"""
+		Read the host-wide CPU counters from /proc/stat
+
+		:return: dict of user, nice, system, idle, iowait, irq, softirq and steal (in clock ticks since boot),
+			ctxt, procs_running, procs_blocked and btime, (boot time as a unix timestamp)
+		"""
+		data = self._read('stat')
+		if data is None:
+			return None
+		result = {}
+		for line in data.split('\n'):
+			parts = line.split()
+			if len(parts) == 0:
+				continue
+			if parts[0] == 'cpu':
+				# "cpu  user nice system idle iowait irq softirq steal guest guest_nice"
+				names = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+				for name, val in zip(names, parts[1:]):
+					result[name] = int(val)
+			elif parts[0] in ('ctxt', 'procs_running', 'procs_blocked', 'btime'):
+				result[parts[0]] = int(parts[1])
+		return result
+
+	def read_net_dev(self) -> Union[dict, None]:
+		"""
+		Read the traffic counters of each network interface from /proc/net/dev
+
+		:return: dict of interface name to rx/tx bytes, packets, errs and drop
+		"""
+		data = self._read('net', 'dev')
+		if data is None:
+			return None
+		result = {}
+		# First two lines are headers
+		for line in data.split('\n')[2:]:
+			iface, _, counters = line.partition(':')
+			fields = counters.split()
+			if len(fields) < 16:
+				continue
+			result[iface.strip()] = {
+				'rx_bytes': int(fields[0]),
+				'rx_packets': int(fields[1]),
+				'rx_errs': int(fields[2]),
+				'rx_drop': int(fields[3]),
+				'tx_bytes': int(fields[8]),
+				'tx_packets': int(fields[9]),
+				'tx_errs': int(fields[10]),
+				'tx_drop': int(fields[11]),
+			}
+		return result
+
+	@classmethod
+	def read_disk(cls, path: str) -> Union[dict, None]:
+		"""
+		Get the usage of the filesystem a path is stored on
+
+		:param path:
+		:return: dict of path, total_bytes, used_bytes, available_bytes, used_percent, inodes_total and inodes_available
+		"""
+		try:
+			st = os.statvfs(path)
+		except OSError:
+			return None
+		total = st.f_blocks * st.f_frsize
+		# Reserved blocks are neither used nor available to the game user
+		used = (st.f_blocks - st.f_bfree) * st.f_frsize
+		available = st.f_bavail * st.f_frsize
+		return {
+			'path': path,
+			'total_bytes': total,
+			'used_bytes': used,
+			'available_bytes': available,
+			'used_percent': round(used / (used + available) * 100, 2) if used + available else None,
+			'inodes_total': st.f_files,
+			'inodes_available': st.f_favail,
+		}
+
+	def collect(self, path: str, sampler=None) -> dict:
+		"""
+		Read all host metrics in a single pass
+
+		When a sampler is given, (see ProcessSampler.rate), CPU usage percentages and network throughput
+		are calculated over the interval since the previous call.
+
+		:param path: Directory to report the filesystem usage of, (ie: the install directory)
+		:param sampler: ProcessSampler to calculate rates with
+		:return: dict of cpu_count, loadavg, pressure, memory, cpu, network and disk
+		"""
+		cpu = self.read_cpu()
+		network = self.read_net_dev()
+		if sampler is not None:
+			uptime = sampler.get_uptime()
+			# Counters reset on reboot
+			boot = cpu.get('btime', 0) if cpu else 0
+			if cpu is not None:
+				total = sum(cpu.get(name, 0) for name in ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal'))
+				counters = {
+					'busy': total - cpu.get('idle', 0) - cpu.get('iowait', 0),
+					'iowait': cpu.get('iowait', 0),
+					'steal': cpu.get('steal', 0),
+				}
+				for name, val in counters.items():
+					rate = sampler.rate('host_cpu:' + name, val, boot, uptime)
+					# 100% = every CPU of the host fully used
+					cpu[name + '_percent'] = None if rate is None else round(rate / self.clock_ticks / self.cpu_count * 100, 2)
+			if network is not None:
+				for iface, counters in network.items():
+					for name in ('rx_bytes', 'tx_bytes'):
+						counters[name + '_per_sec'] = sampler.rate('host_net:%s:%s' % (iface, name), counters[name], boot, uptime)
+
+		return {
+			'cpu_count': self.cpu_count,
+			'loadavg': self.read_loadavg(),
+			'pressure': self.read_pressures(),
+			'memory': self.read_meminfo(),
+			'cpu': cpu,
+			'network': network,
+			'disk': self.read_disk(path),
+		}
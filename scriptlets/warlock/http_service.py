@@ -13,7 +13,7 @@ class HTTPService(BaseService):
 	def _api_cmd(self, cmd: str, method: str = 'GET', data: dict = None):
 		method = method.upper()
 
-		if not (self.is_running() or self.is_starting() or self.is_stopping()):
+		if not self.is_active():
 			# If service is not running, don't even try to connect.
 			return None
 
@@ -0,0 +1,263 @@
+import collections
+import json
+import re
+import subprocess
+from typing import Iterator, Union
+
+
+class JournalError(Exception):
+	"""
+	Raised when journalctl fails, (ie: an invalid cursor or date)
+	"""
+	pass
+
+
+class JournalReader:
+	"""
+	Reads structured entries of a unit from the systemd journal via `journalctl -o json`
+
+	Entries are identified by their journal cursor, so a caller can ask for only what was
+	logged after the last entry it has already seen.
+	"""
+
+	FIELDS = ('MESSAGE', 'PRIORITY', '_PID')
+	"""
+	:type tuple<str>:
+	Journal fields requested for each entry, (__CURSOR and __REALTIME_TIMESTAMP are always included)
+	"""
+
+	def __init__(self, journalctl: str = 'journalctl'):
+		self.journalctl = journalctl
+		"""
+		:type str:
+		Path of the journalctl binary
+		"""
+
+	def build_command(
+		self,
+		unit: str,
+		after_cursor: Union[str, None] = None,
+		since: Union[str, None] = None,
+		until: Union[str, None] = None,
+		lines: int = 0,
+		follow: bool = False,
+		matches: Union[list, None] = None
+	) -> list:
+		"""
+		Build the journalctl command line for a query
+
+		:param unit: Unit name, (".service" is optional)
+		:param after_cursor: Only return entries logged after this cursor
+		:param since: Only return entries on or newer than this date, (any format journalctl accepts)
+		:param until: Only return entries on or older than this date
+		:param lines: Only return the latest N entries, (0 for no limit)
+		:param follow: Keep waiting for new entries
+		:param matches: Journal field matches, (ie: "PRIORITY=3"), evaluated by journald against its indexes
+		:return:
+		"""
+		cmd = [self.journalctl, '-q', '-u', unit, '-o', 'json', '--all', '--no-pager', '--output-fields=' + ','.join(self.FIELDS)]
+		if after_cursor:
+			cmd += ['--after-cursor', after_cursor]
+		if since:
+			cmd += ['--since', since]
+		if until:
+			cmd += ['--until', until]
+		if lines > 0:
+			cmd += ['-n', str(lines)]
+		if follow:
+			cmd.append('-f')
+		if matches:
+			# Matches on different fields must all apply, (matches on the same field are alternatives)
+			cmd += matches
+		return cmd
+
+	@classmethod
+	def _field(cls, value) -> Union[str, None]:
+		if value is None:
+			return None
+		if isinstance(value, list):
+			# Fields which are not valid UTF-8 are encoded as an array of bytes,
+			# (or as an array of values if the field occurs more than once)
+			if len(value) and isinstance(value[0], int):
+				return bytes(value).decode('utf-8', errors='replace')
+			return '\n'.join(cls._field(v) or '' for v in value)
+		return str(value)
+
+	@classmethod
+	def parse_entry(cls, line: str) -> Union[dict, None]:
+		"""
+		Parse a line of `journalctl -o json` output
+
+		The entry contains:
+
+		* cursor - str: Journal cursor of the entry
+		* timestamp - float: Unix time the entry was logged
+		* message - str: Logged message
+		* priority - int: Syslog priority, (0 = emergency ... 7 = debug)
+		* pid - int: PID of the logging process
+
+		:param line:
+		:return: None if the line is not a journal entry
+		"""
+		try:
+			data = json.loads(line)
+		except ValueError:
+			return None
+		if not isinstance(data, dict) or '__CURSOR' not in data:
+			return None
+
+		priority = cls._field(data.get('PRIORITY'))
+		pid = cls._field(data.get('_PID'))
+		timestamp = cls._field(data.get('__REALTIME_TIMESTAMP'))
+		return {
+			'cursor': data['__CURSOR'],
+			'timestamp': int(timestamp) / 1000000 if timestamp and timestamp.isdigit() else None,
+			'message': cls._field(data.get('MESSAGE')) or '',
+			'priority': int(priority) if priority and priority.isdigit() else None,
+			'pid': int(pid) if pid and pid.isdigit() else None,
+		}
+
+	def open(self, cmd: list) -> subprocess.Popen:
+		"""
+		Start a journalctl query
+
+		:param cmd: Command from build_command
+		:return:
+		:raises JournalError: If journalctl could not be run
+		"""
+		try:
+			return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace')
+		except OSError as e:
+			raise JournalError('Unable to run %s: %s' % (cmd[0], str(e)))
+
+	def read(
+		self,
+		unit: str,
+		after_cursor: Union[str, None] = None,
+		since: Union[str, None] = None,
+		until: Union[str, None] = None,
+		lines: int = 0,
+		max_bytes: int = 0
+	) -> dict:
+		"""
+		Read entries of a unit, oldest first
+
+		The result contains:
+
+		* entries - list: Entries as returned by parse_entry
+		* cursor - str: Cursor to pass as after_cursor to continue from, (after_cursor if there are no new entries)
+		* truncated - bool: True if max_bytes was reached before all entries were read
+		* error - str: Error reported by journalctl, (ie: invalid cursor), None on success
+
+		:param unit: Unit name
+		:param after_cursor: Only return entries logged after this cursor
+		:param since: Only return entries on or newer than this date
+		:param until: Only return entries on or older than this date
+		:param lines: Only return the latest N entries, (0 for no limit)
+		:param max_bytes: Stop once the returned messages total this many bytes, (0 for no limit)
+		:return:
+		"""
+		result = {'entries': [], 'cursor': after_cursor, 'truncated': False, 'error': None}
+		size = 0
+		try:
+			proc = self.open(self.build_command(unit, after_cursor, since, until, lines))
+		except JournalError as e:
+			result['error'] = str(e)
+			return result
+		try:
+			for line in proc.stdout:
+				entry = self.parse_entry(line)
+				if entry is None:
+					continue
+				entry_size = len(entry['message'].encode('utf-8'))
+				if max_bytes > 0 and size + entry_size > max_bytes and len(result['entries']) > 0:
+					# The rest is picked up by the next read from the returned cursor
+					result['truncated'] = True
+					break
+				size += entry_size
+				result['entries'].append(entry)
+				result['cursor'] = entry['cursor']
+		finally:
+			if result['truncated']:
+				proc.terminate()
+			proc.stdout.close()
+			stderr = proc.stderr.read().strip()
+			proc.stderr.close()
+			proc.wait()
+
+		if proc.returncode != 0 and not result['truncated']:
+			result['error'] = stderr or 'journalctl exited with status %d' % proc.returncode
+		return result
+
+	def search(
+		self,
+		unit: str,
+		pattern: Union[str, None] = None,
+		matches: Union[list, None] = None,
+		since: Union[str, None] = None,
+		until: Union[str, None] = None,
+		limit: int = 0,
+		context: int = 0,
+		ignore_case: bool = False
+	) -> Iterator[dict]:
+		"""
+		Search entries of a unit, oldest first, yielding only those matching (and their context)
+
+		The journal is streamed through the filter, so memory use does not depend on the range searched.
+		Each yielded entry is as returned by parse_entry, with `match` set to False for context entries.
+
+		:param unit: Unit name
+		:param pattern: Regular expression the message must match, (None for any message)
+		:param matches: Journal field matches, (ie: "PRIORITY=3")
+		:param since: Only search entries on or newer than this date
+		:param until: Only search entries on or older than this date
+		:param limit: Stop after this many matching entries, (0 for no limit)
+		:param context: Number of entries to include before and after each match
+		:param ignore_case: Match the pattern case-insensitively
+		:return:
+		:raises JournalError: If journalctl fails
+		:raises re.error: If the pattern is invalid
+		"""
+		regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0) if pattern else None
+		before = collections.deque(maxlen=context)
+		after = 0
+		found = 0
+		stopped = False
+		proc = self.open(self.build_command(unit, None, since, until, 0, False, matches))
+		try:
+			for line in proc.stdout:
+				entry = self.parse_entry(line)
+				if entry is None:
+					continue
+
+				entry['match'] = regex is None or regex.search(entry['message']) is not None
+				if entry['match'] and (limit == 0 or found < limit):
+					found += 1
+					while len(before):
+						yield before.popleft()
+					yield entry
+					after = context
+				elif after > 0:
+					entry['match'] = False
+					after -= 1
+					yield entry
+				elif limit > 0 and found >= limit:
+					stopped = True
+					break
+				else:
+					entry['match'] = False
+					before.append(entry)
+		except GeneratorExit:
+			# Caller stopped reading
+			stopped = True
+			raise
+		finally:
+			if stopped:
+				proc.terminate()
+			proc.stdout.close()
+			stderr = proc.stderr.read().strip()
+			proc.stderr.close()
+			proc.wait()
+
+		if proc.returncode != 0 and not stopped:
+			raise JournalError(stderr or 'journalctl exited with status %d' % proc.returncode)
@@ -0,0 +1,50 @@
+import fcntl
+import json
+import os
+
+
+def load_json_state(path: str) -> dict:
+	"""
+	Load a JSON state file, (ie: the caches under .cache/)
+
+	:param path:
+	:return: Empty dict if the file is missing or unreadable
+	"""
+	try:
+		with open(path, 'r') as f:
+			data = json.load(f)
+	except (OSError, ValueError):
+		return {}
+	return data if isinstance(data, dict) else {}
+
+
+def update_json_state(path: str, update) -> bool:
+	"""
+	Update a JSON state file which may be written by several invocations at once
+
+	The file is locked and read again, the data on disk is passed to `update` to merge its changes into,
+	and the result is written to a temporary file which then replaces the original.
+	Readers never see a partially written file and concurrent writers do not drop each other's keys.
+
+	:param path:
+	:param update: Callable receiving the dict currently on disk and returning the dict to write
+	:return: False if the file could not be written
+	"""
+	tmp = '%s.%d.tmp' % (path, os.getpid())
+	try:
+		with open(path + '.lock', 'a') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			data = update(load_json_state(path))
+			with open(tmp, 'w') as f:
+				json.dump(data, f)
+			if os.geteuid() == 0:
+				# Keep the files writable by the game user when ran via sudo
+				stat_info = os.stat(os.path.dirname(os.path.abspath(path)))
+				os.chown(tmp, stat_info.st_uid, stat_info.st_gid)
+				os.chown(path + '.lock', stat_info.st_uid, stat_info.st_gid)
+			os.replace(tmp, path)
+	except OSError:
+		if os.path.exists(tmp):
+			os.unlink(tmp)
+		return False
+	return True
@@ -0,0 +1,280 @@
+import os
+from typing import Union
+from scriptlets.warlock.json_state import *
+
+
+class MemoryTrend:
+	"""
+	Tracks the resident memory of game processes over time and fits its growth rate
+
+	Samples are persisted between invocations, (ie: every --get-metrics poll adds one),
+	and reset whenever the process is restarted.
+	"""
+
+	WINDOW = 6 * 3600
+	"""
+	:type int:
+	Seconds of history used to fit the growth rate
+	"""
+
+	MIN_SAMPLE_INTERVAL = 60
+	"""
+	:type int:
+	Minimum seconds between stored samples
+	"""
+
+	MIN_SPAN = 1800
+	"""
+	:type int:
+	Seconds of history required before a growth rate is reported, (startup allocations skew shorter spans)
+	"""
+
+	MIN_SAMPLES = 5
+	"""
+	:type int:
+	Number of samples required before a growth rate is reported
+	"""
+
+	PENDING_MAX_AGE = 2 * 3600
+	"""
+	:type int:
+	Seconds after which a pending restart is considered abandoned, (a delayed restart waits up to an hour)
+	"""
+
+	def __init__(self, state_file: Union[str, None] = None):
+		self.state_file = state_file
+		"""
+		:type str|None:
+		JSON file to persist the samples to, (None to keep them in memory only)
+		"""
+
+		self._history = None
+		"""
+		:type dict<str, dict>|None:
+		Process start and list of [time, rss_bytes] samples of each key, loaded lazily from the state file
+		"""
+
+		self._changed = False
+
+		self._touched = set()
+		"""
+		:type set<str>:
+		Keys changed since the last save
+		"""
+
+	def _load(self):
+		if self._history is not None:
+			return
+
+		self._history = load_json_state(self.state_file) if self.state_file else {}
+
+	def save(self):
+		"""
+		Persist the samples so the trend continues on the next invocation
+
+		:return:
+		"""
+		if not self.state_file or not self._changed:
+			return
+
+		def merge(data: dict) -> dict:
+			# Only write back the keys changed here, others may have been updated by a concurrent invocation
+			for key in self._touched:
+				data[key] = self._history[key]
+			return data
+
+		update_json_state(self.state_file, merge)
+		self._touched = set()
+		self._changed = False
+
+	def record(self, key: str, start: int, rss: int, now: float):
+		"""
+		Add a memory sample of a process
+
+		:param key: Unique key of the instance, (ie: the service name)
+		:param start: Start time of the process, (a different value discards the previous history)
+		:param rss: Resident memory in bytes
+		:param now: Current time.time()
+		:return:
+		"""
+		self._load()
+		history = self._history.get(key)
+		if history is None or history['start'] != start:
+			history = {'start': start, 'samples': []}
+			self._history[key] = history
+
+		samples = history['samples']
+		if len(samples) and now - samples[-1][0] < self.MIN_SAMPLE_INTERVAL:
+			return
+		samples.append([now, rss])
+		history['samples'] = [s for s in samples if now - s[0] <= self.WINDOW]
+		# Fitted once per sample, rather than on every poll in between
+		history['fit'] = self._fit(history['samples'])
+		self._touched.add(key)
+		self._changed = True
+
+	def fit(self, key: str) -> Union[dict, None]:
+		"""
+		Fit a straight line through the memory samples of an instance, (least squares)
+
+		* samples - int: Number of samples used
+		* span_seconds - float: Time covered by the samples
+		* rss_bytes - int: Latest sample
+		* bytes_per_hour - float: Growth rate
+		* r2 - float: How well the growth fits a straight line, (1 = perfectly steady growth)
+
+		:param key:
+		:return: None if there is not enough history yet
+		"""
+		self._load()
+		history = self._history.get(key)
+		if history is None:
+			return None
+		if 'fit' not in history:
+			history['fit'] = self._fit(history['samples'])
+		return history['fit']
+
+	def _fit(self, samples: list) -> Union[dict, None]:
+		if len(samples) < self.MIN_SAMPLES or samples[-1][0] - samples[0][0] < self.MIN_SPAN:
+			return None
+
+		count = len(samples)
+		mean_t = sum(s[0] for s in samples) / count
+		mean_m = sum(s[1] for s in samples) / count
+		var_t = sum((s[0] - mean_t) ** 2 for s in samples)
+		cov = sum((s[0] - mean_t) * (s[1] - mean_m) for s in samples)
+		slope = cov / var_t
+
+		var_m = sum((s[1] - mean_m) ** 2 for s in samples)
+		r2 = 1.0 if var_m == 0 else cov * cov / (var_t * var_m)
+		return {
+			'samples': count,
+			'span_seconds': round(samples[-1][0] - samples[0][0], 1),
+			'rss_bytes': samples[-1][1],
+			'bytes_per_hour': round(slope * 3600, 1),
+			'r2': round(r2, 3),
+		}
+
+	def has_pending_restart(self, key: str, now: float) -> bool:
+		"""
+		Check if a restart of an instance is already underway in another invocation, (see set_pending_restart)
+
+		:param key:
+		:param now: Current time.time()
+		:return:
+		"""
+		self._load()
+		pending = (self._history.get(key) or {}).get('pending_restart')
+		if pending is None or now - pending['since'] >= self.PENDING_MAX_AGE:
+			return False
+		# The invocation performing the restart exited without clearing it
+		return os.path.exists('/proc/%d' % pending['pid'])
+
+	def set_pending_restart(self, key: str, now: float):
+		"""
+		Record that this invocation is restarting an instance, written to disk straight away
+
+		The mark is dropped along with the rest of the history once the process is restarted.
+
+		:param key:
+		:param now: Current time.time()
+		:return:
+		"""
+		self._set_pending(key, {'pid': os.getpid(), 'since': now})
+
+	def clear_pending_restart(self, key: str):
+		"""
+		Remove the pending restart of an instance, (ie: once the restart is over or was abandoned)
+
+		:param key:
+		:return:
+		"""
+		self._set_pending(key, None)
+
+	def _set_pending(self, key: str, pending: Union[dict, None]):
+		self._load()
+
+		def apply(history: dict) -> dict:
+			if key in history:
+				if pending is None:
+					history[key].pop('pending_restart', None)
+				else:
+					history[key]['pending_restart'] = pending
+			return history
+
+		apply(self._history)
+		if self.state_file:
+			# Only this field is changed on disk, samples may have been added since by other invocations
+			update_json_state(self.state_file, apply)
+
+	@classmethod
+	def seconds_until(cls, fit: dict, threshold: int) -> Union[float, None]:
+		"""
+		Predict how long until the memory of an instance reaches a threshold
+
+		:param fit: Result of fit
+		:param threshold: Memory in bytes
+		:return: 0 if already reached, None if memory is not growing
+		"""
+		if fit['rss_bytes'] >= threshold:
+			return 0
+		if fit['bytes_per_hour'] <= 0:
+			return None
+		return round((threshold - fit['rss_bytes']) / fit['bytes_per_hour'] * 3600, 1)
+
+
+class MemoryRestartPolicy:
+	"""
+	Decides when a leaking instance should be restarted
+
+	A restart is only considered once the memory is predicted to reach the threshold within `horizon` seconds.
+	It is then restarted as soon as it is empty, or with the usual player warnings once the threshold
+	is less than `urgent` seconds away, (enough for the hour of warnings from a delayed restart).
+	"""
+
+	def __init__(self, horizon: float = 6 * 3600, urgent: float = 90 * 60, min_r2: float = 0.5):
+		self.horizon = horizon
+		"""
+		:type float:
+		Seconds ahead a crossing of the threshold is acted on
+		"""
+
+		self.urgent = urgent
+		"""
+		:type float:
+		Seconds before the predicted crossing at which players are warned and the instance restarted anyway
+		"""
+
+		self.min_r2 = min_r2
+		"""
+		:type float:
+		Minimum fit of the growth to a straight line, (noisy usage is not a leak)
+		"""
+
+	def decide(self, fit: Union[dict, None], threshold: int, players: Union[int, None]) -> dict:
+		"""
+		Decide what to do with an instance
+
+		* action - str: 'none', 'wait' (for the instance to empty), 'restart' or 'delayed_restart' (warn players first)
+		* reason - str: Why
+		* seconds_to_threshold - float|None: Predicted time until the threshold is reached
+
+		:param fit: Result of MemoryTrend.fit
+		:param threshold: Memory in bytes the instance should stay below
+		:param players: Number of players online, (None if unknown, treated as occupied)
+		:return:
+		"""
+		if fit is None:
+			return {'action': 'none', 'reason': 'not enough samples', 'seconds_to_threshold': None}
+
+		eta = MemoryTrend.seconds_until(fit, threshold)
+		if eta != 0 and (eta is None or fit['r2'] < self.min_r2):
+			return {'action': 'none', 'reason': 'memory not growing steadily', 'seconds_to_threshold': eta}
+		if eta > self.horizon:
+			return {'action': 'none', 'reason': 'threshold not reached within horizon', 'seconds_to_threshold': eta}
+
+		if players == 0:
+			return {'action': 'restart', 'reason': 'server empty', 'seconds_to_threshold': eta}
+		if eta <= self.urgent:
+			return {'action': 'delayed_restart', 'reason': 'threshold imminent', 'seconds_to_threshold': eta}
+		return {'action': 'wait', 'reason': 'waiting for the server to empty', 'seconds_to_threshold': eta}
@@ -0,0 +1,121 @@
+import glob
+import os
+import time
+from typing import Union
+from scriptlets.warlock.host_stats import *
+
+
+class PageCachePrewarmer:
+	"""
+	Pulls game files into the page cache ahead of starting a server
+
+	Large servers spend most of a cold start reading pak files from disk;
+	asking the kernel to read them ahead lets the server find them already in memory.
+	Files which do not fit within the memory budget are skipped rather than evicting other data.
+
+	The kernel performs the readahead asynchronously, (and may drop it under memory pressure),
+	so the result reports what was requested rather than what ended up cached.
+	"""
+
+	CHUNK_SIZE = 1024 * 1024
+	"""
+	:type int:
+	Read size used when posix_fadvise is not available
+	"""
+
+	def __init__(self, max_bytes: int = 0, memory_fraction: float = 0.5, host: Union[HostStatsReader, None] = None):
+		self.max_bytes = max_bytes
+		"""
+		:type int:
+		Maximum number of bytes to prewarm, (0 for no fixed limit)
+		"""
+
+		self.memory_fraction = memory_fraction
+		"""
+		:type float:
+		Maximum share of the host's available memory to prewarm
+		"""
+
+		self.host = host or HostStatsReader()
+
+	@classmethod
+	def expand(cls, root: str, patterns: list) -> list:
+		"""
+		Expand glob patterns relative to a directory into a list of files
+
+		Files are returned in the order of the patterns, (list the most important first),
+		and each file only once.
+
+		:param root:
+		:param patterns: Glob patterns, ('**' matches any number of directories)
+		:return:
+		"""
+		files = []
+		seen = set()
+		for pattern in patterns:
+			for path in sorted(glob.glob(os.path.join(root, pattern), recursive=True)):
+				if path not in seen and os.path.isfile(path):
+					seen.add(path)
+					files.append(path)
+		return files
+
+	def get_budget(self) -> int:
+		"""
+		Get the number of bytes which may be prewarmed
+
+		:return:
+		"""
+		meminfo = self.host.read_meminfo() or {}
+		budget = None
+		if 'MemAvailable' in meminfo:
+			budget = int(meminfo['MemAvailable'] * self.memory_fraction)
+		if self.max_bytes > 0:
+			budget = self.max_bytes if budget is None else min(budget, self.max_bytes)
+		# Without MemAvailable or a fixed limit there is nothing to guard against
+		return budget if budget is not None else 2 ** 63
+
+	def _warm(self, path: str, size: int):
+		"""
+		Request a file to be read into the page cache
+
+		:param path:
+		:param size:
+		:return:
+		"""
+		with open(path, 'rb', buffering=0) as f:
+			if hasattr(os, 'posix_fadvise'):
+				os.posix_fadvise(f.fileno(), 0, size, os.POSIX_FADV_WILLNEED)
+			else:
+				while f.read(self.CHUNK_SIZE):
+					pass
+
+	def prewarm(self, files: list) -> dict:
+		"""
+		Prewarm files into the page cache
+
+		* files - int: Number of files requested to be read ahead
+		* bytes_requested - int: Total size of those files
+		* skipped - list: Files which did not fit within the budget or could not be read
+		* budget_bytes - int: Memory budget the files had to fit within
+		* seconds_to_queue - float: Time taken to issue the requests, (not to complete the reads)
+
+		:param files: List of file paths, (see expand)
+		:return:
+		"""
+		timer = time.time()
+		budget = self.get_budget()
+		result = {'files': 0, 'bytes_requested': 0, 'skipped': [], 'budget_bytes': budget, 'seconds_to_queue': 0.0}
+		for path in files:
+			try:
+				size = os.path.getsize(path)
+				if result['bytes_requested'] + size > budget:
+					result['skipped'].append(path)
+					continue
+				self._warm(path, size)
+			except OSError:
+				result['skipped'].append(path)
+				continue
+			result['files'] += 1
+			result['bytes_requested'] += size
+		result['seconds_to_queue'] = round(time.time() - timer, 3)
+		return result
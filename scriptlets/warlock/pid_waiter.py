@@ -0,0 +1,104 @@
+import os
+import select
+import time
+
+
+class PidWaiter:
+	"""
+	Waits for one or more processes to exit
+
+	Uses pidfd_open and poll (Linux 5.3+) to be notified the moment a process exits,
+	falling back to checking the process periodically where pidfds are not available.
+	The processes do not need to be children of this one.
+	"""
+
+	POLL_INTERVAL = 0.1
+	"""
+	:type float:
+	Seconds between checks of processes which could not be opened as a pidfd
+	"""
+
+	def __init__(self, pids: list):
+		self.pids = [pid for pid in pids if pid]
+
+		self.exited = {}
+		"""
+		:type dict<int, float>:
+		Time each process was detected as exited
+		"""
+
+		self._fds = {}
+		"""
+		:type dict<int, int>:
+		Map of open pidfds to their PID
+		"""
+
+		self._polled = []
+		"""
+		:type list<int>:
+		PIDs without a pidfd which are checked periodically instead
+		"""
+
+		for pid in self.pids:
+			try:
+				self._fds[os.pidfd_open(pid)] = pid
+			except ProcessLookupError:
+				self.exited[pid] = time.time()
+			except (AttributeError, OSError):
+				# Python < 3.9 or kernel < 5.3
+				self._polled.append(pid)
+
+	@classmethod
+	def is_running(cls, pid: int) -> bool:
+		try:
+			os.kill(pid, 0)
+		except ProcessLookupError:
+			return False
+		except PermissionError:
+			# Exists, but owned by another user
+			pass
+		return True
+
+	def wait(self, timeout: float) -> bool:
+		"""
+		Wait for all processes to exit
+
+		:param timeout: Maximum number of seconds to wait
+		:return: True if all processes exited, False if the timeout elapsed first
+		"""
+		deadline = time.monotonic() + timeout
+		poller = select.poll()
+		for fd in self._fds:
+			poller.register(fd, select.POLLIN)
+
+		while len(self._fds) or len(self._polled):
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				return False
+
+			if len(self._polled):
+				remaining = min(remaining, self.POLL_INTERVAL)
+
+			for fd, _ in poller.poll(remaining * 1000):
+				# A pidfd becomes readable when its process exits
+				poller.unregister(fd)
+				os.close(fd)
+				self.exited[self._fds.pop(fd)] = time.time()
+
+			for pid in list(self._polled):
+				if not self.is_running(pid):
+					self._polled.remove(pid)
+					self.exited[pid] = time.time()
+
+		return True
+
+	def close(self):
+		"""
+		Release any open pidfds
+
+		:return:
+		"""
+		for fd in self._fds:
+			os.close(fd)
+		self._fds = {}
+		self._polled = []
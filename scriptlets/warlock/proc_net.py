@@ -0,0 +1,133 @@
+import os
+from typing import Union
+
+
+class ProcNetReader:
+	"""
+	Reads socket tables from /proc/net without forking `ss` or `netstat`
+	"""
+
+	TCP_LISTEN = '0A'
+	"""
+	:type str:
+	Hex state code of a listening TCP socket
+	"""
+
+	def __init__(self, proc_root: str = '/proc'):
+		self.proc_root = proc_root
+
+	def read_sockets(self, protocol: str) -> list:
+		"""
+		Read all IPv4 and IPv6 sockets of a given protocol
+
+		Each socket is a dict containing:
+
+		* port - int: Local port
+		* state - str: Hex state code, (see TCP_LISTEN)
+		* tx_queue - int: Bytes queued for transmission
+		* rx_queue - int: Bytes queued for receiving
+		* inode - int: Socket inode, (matches /proc/<pid>/fd/* links of "socket:[inode]")
+		* drops - int: Datagrams dropped, (UDP only, 0 for TCP)
+
+		:param protocol: 'tcp' or 'udp'
+		:return:
+		"""
+		sockets = []
+		for suffix in ('', '6'):
+			try:
+				with open(os.path.join(self.proc_root, 'net', protocol + suffix), 'r') as f:
+					lines = f.read().split('\n')[1:]
+			except OSError:
+				continue
+
+			for line in lines:
+				# sl local_address rem_address st tx_queue:rx_queue tr:tm->when retrnsmt uid timeout inode ... [drops]
+				fields = line.split()
+				if len(fields) < 10:
+					continue
+				tx_queue, rx_queue = fields[4].split(':')
+				sockets.append({
+					'port': int(fields[1].split(':')[1], 16),
+					'state': fields[3],
+					'tx_queue': int(tx_queue, 16),
+					'rx_queue': int(rx_queue, 16),
+					'inode': int(fields[9]),
+					'drops': int(fields[-1]) if protocol == 'udp' else 0,
+				})
+		return sockets
+
+	def get_bound_ports(self, protocol: str) -> set:
+		"""
+		Get the local ports with a bound socket, (listening only for TCP)
+
+		:param protocol: 'tcp' or 'udp'
+		:return:
+		"""
+		ports = set()
+		for sock in self.read_sockets(protocol):
+			if protocol == 'tcp' and sock['state'] != self.TCP_LISTEN:
+				continue
+			ports.add(sock['port'])
+		return ports
+
+	def is_port_bound(self, port: int, protocol: Union[str, None] = None) -> bool:
+		"""
+		Check if a local port is bound, (on either protocol when not specified)
+
+		:param port:
+		:param protocol: 'tcp', 'udp' or None
+		:return:
+		"""
+		for proto in ([protocol] if protocol else ['udp', 'tcp']):
+			if port in self.get_bound_ports(proto.lower()):
+				return True
+		return False
+
+	@classmethod
+	def summarise_port(cls, sockets: list, port: int) -> dict:
+		"""
+		Combine the sockets bound to a local port, (ie: its IPv4 and IPv6 sockets, or a TCP listener and its connections)
+
+		* sockets - int: Number of sockets on the port
+		* rx_queue_bytes - int: Bytes waiting to be read by the game
+		* tx_queue_bytes - int: Bytes waiting to be sent
+		* drops - int: Datagrams dropped, (ie: receive buffer full), since the sockets were created
+		* inode - int: Lowest socket inode, (changes when the sockets are recreated)
+
+		:param sockets: Sockets from read_sockets
+		:param port:
+		:return:
+		"""
+		result = {'sockets': 0, 'rx_queue_bytes': 0, 'tx_queue_bytes': 0, 'drops': 0, 'inode': None}
+		for sock in sockets:
+			if sock['port'] != port:
+				continue
+			result['sockets'] += 1
+			result['rx_queue_bytes'] += sock['rx_queue']
+			result['tx_queue_bytes'] += sock['tx_queue']
+			result['drops'] += sock['drops']
+			if result['inode'] is None or sock['inode'] < result['inode']:
+				result['inode'] = sock['inode']
+		return result
+
+	def read_snmp(self) -> dict:
+		"""
+		Read the host-wide protocol counters of /proc/net/snmp
+
+		:return: dict of protocol, (ie: 'Udp'), to a dict of counter name to value
+		"""
+		try:
+			with open(os.path.join(self.proc_root, 'net', 'snmp'), 'r') as f:
+				lines = f.read().split('\n')
+		except OSError:
+			return {}
+
+		# Each protocol is a line of counter names followed by a line of values
+		result = {}
+		for i in range(0, len(lines) - 1, 2):
+			names = lines[i].split()
+			values = lines[i + 1].split()
+			if len(names) < 2 or len(names) != len(values) or names[0] != values[0]:
+				continue
+			result[names[0].rstrip(':')] = {name: int(val) for name, val in zip(names[1:], values[1:])}
+		return result
@@ -0,0 +1,386 @@
+import os
+from typing import Union
+from scriptlets.warlock.json_state import *
+
+
+class ProcessSampler:
+	"""
+	Reads CPU and memory usage of processes directly from /proc
+
+	CPU usage is calculated over the interval since the previous sample of the same process,
+	(persisted to disk between invocations), rather than the lifetime average reported by `ps`.
+	100% is equivalent to one fully used core.
+	"""
+
+	MIN_INTERVAL = 0.25
+	"""
+	:type float:
+	Samples taken closer together than this (in seconds) reuse the previous result
+	"""
+
+	SATURATION_PERCENT = 90.0
+	"""
+	:type float:
+	CPU usage of a single thread (100 = one full core) at which it is considered saturated
+	"""
+
+	MAX_AGE = 3600
+	"""
+	:type int:
+	Persisted samples older than this (in seconds) are discarded
+	"""
+
+	def __init__(self, state_file: Union[str, None] = None, proc_root: str = '/proc'):
+		self.state_file = state_file
+		"""
+		:type str|None:
+		JSON file to persist the previous samples to, (None to keep them in memory only)
+		"""
+
+		self.proc_root = proc_root
+
+		self.clock_ticks = os.sysconf('SC_CLK_TCK')
+		self.page_size = os.sysconf('SC_PAGE_SIZE')
+
+		self._samples = None
+		"""
+		:type dict<str, dict>|None:
+		Previous sample of each PID, loaded lazily from the state file
+		"""
+
+		self._touched = set()
+		"""
+		:type set<str>:
+		Keys sampled since the last save
+		"""
+
+		self._results = {}
+		"""
+		:type dict<int, dict>:
+		Latest result of each PID calculated during this invocation
+		"""
+
+	def _read(self, *path) -> Union[str, None]:
+		try:
+			with open(os.path.join(self.proc_root, *path), 'r') as f:
+				return f.read()
+		except OSError:
+			return None
+
+	def get_uptime(self) -> float:
+		"""
+		Get the system uptime in seconds, (the same clock process start times are measured against)
+		:return:
+		"""
+		data = self._read('uptime')
+		return float(data.split()[0]) if data else 0.0
+
+	def read_stat(self, pid: int, tid: Union[int, None] = None) -> Union[dict, None]:
+		"""
+		Parse /proc/<pid>/stat, (or /proc/<pid>/task/<tid>/stat when a thread ID is given)
+
+		:param pid:
+		:param tid:
+		:return: dict of comm, state, ppid, ticks (utime + stime) and start (in clock ticks since boot)
+		"""
+		if tid is None:
+			data = self._read(str(pid), 'stat')
+		else:
+			data = self._read(str(pid), 'task', str(tid), 'stat')
+		if not data:
+			return None
+
+		# comm may contain spaces and parentheses, so split on the last closing parenthesis
+		comm = data[data.index('(') + 1:data.rindex(')')]
+		fields = data[data.rindex(')') + 2:].split()
+		return {
+			'comm': comm,
+			'state': fields[0],
+			'ppid': int(fields[1]),
+			'ticks': int(fields[11]) + int(fields[12]),
+			'start': int(fields[19]),
+		}
+
+	def read_memory(self, pid: int) -> Union[dict, None]:
+		"""
+		Get the resident memory of a process, in bytes
+
+		PSS requires access to smaps_rollup, (owner or root), and is None when not available.
+
+		:param pid:
+		:return: dict of rss_bytes and pss_bytes
+		"""
+		statm = self._read(str(pid), 'statm')
+		if not statm:
+			return None
+
+		result = {
+			'rss_bytes': int(statm.split()[1]) * self.page_size,
+			'pss_bytes': None,
+		}
+
+		rollup = self._read(str(pid), 'smaps_rollup')
+		if rollup:
+			for line in rollup.split('\n'):
+				if line.startswith('Pss:'):
+					result['pss_bytes'] = int(line.split()[1]) * 1024
+					break
+
+		return result
+
+	def read_io(self, pid: int) -> Union[dict, None]:
+		"""
+		Parse /proc/<pid>/io, (only readable by the owner of the process or root)
+
+		:param pid:
+		:return: dict of the counters, (ie: read_bytes and write_bytes of storage I/O, rchar and wchar of all reads/writes)
+		"""
+		data = self._read(str(pid), 'io')
+		if not data:
+			return None
+
+		result = {}
+		for line in data.split('\n'):
+			key, _, val = line.partition(':')
+			if val.strip().isdigit():
+				result[key] = int(val)
+		return result
+
+	def _load(self):
+		if self._samples is not None:
+			return
+
+		self._samples = load_json_state(self.state_file) if self.state_file else {}
+
+	def save(self):
+		"""
+		Persist the latest samples so the next invocation can calculate usage over the interval
+
+		:return:
+		"""
+		if not self.state_file or not len(self._touched):
+			return
+
+		now = self.get_uptime()
+
+		def merge(data: dict) -> dict:
+			# Only write back the keys sampled here, others may have been sampled by a concurrent invocation
+			for key in self._touched:
+				data[key] = self._samples[key]
+			return {key: val for key, val in data.items() if now - val.get('uptime', 0) < self.MAX_AGE}
+
+		update_json_state(self.state_file, merge)
+		self._touched = set()
+
+	def cpu_percent(self, key: str, ticks: int, start: int, uptime: float) -> Union[float, None]:
+		"""
+		Calculate CPU usage since the previous sample stored under key
+
+		The first sample of a process falls back to its lifetime average.
+		Samples closer than MIN_INTERVAL to the previous one report the previous interval again.
+
+		:param key: Unique key of the sampled process/thread
+		:param ticks: Total CPU time consumed, in clock ticks
+		:param start: Start time of the process/thread, in clock ticks since boot (to detect PID reuse)
+		:param uptime: Current system uptime
+		:return:
+		"""
+		self._load()
+		previous = self._samples.get(key)
+		if previous is not None and previous['start'] == start:
+			if uptime - previous['uptime'] < self.MIN_INTERVAL and 'percent' in previous:
+				# Too close to the previous sample to be meaningful, keep measuring from it
+				return previous['percent']
+			elapsed = uptime - previous['uptime']
+			used = ticks - previous['ticks']
+		else:
+			# New process, (or the PID was reused by a different process)
+			elapsed = uptime - start / self.clock_ticks
+			used = ticks
+
+		percent = round(used / self.clock_ticks / elapsed * 100, 2) if elapsed > 0 else None
+		self._samples[key] = {'ticks': ticks, 'start': start, 'uptime': uptime, 'percent': percent}
+		self._touched.add(key)
+		return percent
+
+	def rate(self, key: str, value: int, start: int, uptime: float) -> Union[float, None]:
+		"""
+		Calculate the per-second rate of a cumulative counter since the previous sample stored under key
+
+		:param key: Unique key of the sampled counter
+		:param value: Current value of the counter
+		:param start: Identifier of the counter's lifetime, (a changed value resets the baseline)
+		:param uptime: Current system uptime
+		:return: Rate per second, or None on the first sample
+		"""
+		self._load()
+		previous = self._samples.get(key)
+		if previous is not None and previous['start'] == start and uptime - previous['uptime'] < self.MIN_INTERVAL:
+			# Too close to the previous sample to be meaningful, keep measuring from it
+			return previous.get('rate')
+
+		result = None
+		if previous is not None and previous['start'] == start and value >= previous['value']:
+			result = round((value - previous['value']) / (uptime - previous['uptime']), 2)
+
+		self._samples[key] = {'value': value, 'start': start, 'uptime': uptime, 'rate': result}
+		self._touched.add(key)
+		return result
+
+	def sample(self, pid: int) -> Union[dict, None]:
+		"""
+		Sample the CPU and memory usage of a process
+
+		:param pid:
+		:return: dict of pid, cpu_percent, rss_bytes and pss_bytes, or None if the process is not running
+		"""
+		if not pid:
+			return None
+
+		uptime = self.get_uptime()
+		if pid in self._results and uptime - self._results[pid]['uptime'] < self.MIN_INTERVAL:
+			return self._results[pid]['result']
+
+		stat = self.read_stat(pid)
+		memory = self.read_memory(pid)
+		if stat is None or memory is None:
+			return None
+
+		result = {
+			'pid': pid,
+			'cpu_percent': self.cpu_percent(str(pid), stat['ticks'], stat['start'], uptime),
+			'rss_bytes': memory['rss_bytes'],
+			'pss_bytes': memory['pss_bytes'],
+		}
+		self._results[pid] = {'uptime': uptime, 'result': result}
+		return result
+
+	def sample_io(self, pid: int) -> Union[dict, None]:
+		"""
+		Sample the disk I/O of a process
+
+		* read_bytes - int: Bytes read from storage since the process started
+		* write_bytes - int: Bytes written to storage since the process started
+		* read_bytes_per_sec - float: Storage read rate since the previous sample
+		* write_bytes_per_sec - float: Storage write rate since the previous sample
+
+		:param pid:
+		:return: None if the process is not running or its I/O is not readable
+		"""
+		if not pid:
+			return None
+
+		stat = self.read_stat(pid)
+		io = self.read_io(pid)
+		if stat is None or io is None or 'read_bytes' not in io:
+			return None
+
+		uptime = self.get_uptime()
+		return {
+			'read_bytes': io['read_bytes'],
+			'write_bytes': io['write_bytes'],
+			'read_bytes_per_sec': self.rate('io_read:%d' % pid, io['read_bytes'], stat['start'], uptime),
+			'write_bytes_per_sec': self.rate('io_write:%d' % pid, io['write_bytes'], stat['start'], uptime),
+		}
+
+	def sample_threads(self, pid: int, top: int = 5) -> Union[dict, None]:
+		"""
+		Sample the CPU usage of each thread of a process
+
+		Most game servers are limited by a single main/tick thread, which can be saturated
+		while the process as a whole looks idle on a many-core host.
+
+		* count - int: Number of threads
+		* top - list: The `top` busiest threads, as dicts of tid, name and cpu_percent
+		* main_thread_percent - float: CPU usage of the process's initial thread, (tid == pid)
+		* busiest_thread_percent - float: CPU usage of the busiest thread, (the main game thread is not always the initial one)
+		* saturated - bool: True if the busiest thread is at or above SATURATION_PERCENT
+
+		:param pid:
+		:param top: Number of threads to list
+		:return: None if the process is not running
+		"""
+		if not pid:
+			return None
+		try:
+			tids = os.listdir(os.path.join(self.proc_root, str(pid), 'task'))
+		except OSError:
+			return None
+
+		uptime = self.get_uptime()
+		threads = []
+		for tid in tids:
+			stat = self.read_stat(pid, int(tid)) if tid.isdigit() else None
+			if stat is None:
+				# Exited since listing
+				continue
+			threads.append({
+				'tid': int(tid),
+				'name': stat['comm'],
+				'cpu_percent': self.cpu_percent('thread:%d:%s' % (pid, tid), stat['ticks'], stat['start'], uptime),
+			})
+
+		threads.sort(key=lambda t: t['cpu_percent'] or 0.0, reverse=True)
+		main = [t['cpu_percent'] for t in threads if t['tid'] == pid]
+		busiest = threads[0]['cpu_percent'] if len(threads) else None
+		return {
+			'count': len(threads),
+			'top': threads[:top],
+			'main_thread_percent': main[0] if len(main) else None,
+			'busiest_thread_percent': busiest,
+			'saturated': busiest is not None and busiest >= self.SATURATION_PERCENT,
+		}
+
+	def read_threads(self, pid: int) -> Union[list, None]:
+		"""
+		Dump what each thread of a process is doing, (ie: to tell a deadlock from a busy loop)
+
+		* tid - int: Thread ID
+		* name - str: Thread name
+		* state - str: 'R' running, 'S' sleeping, 'D' uninterruptible (usually waiting on the disk), 'Z' zombie, etc
+		* wchan - str|None: Kernel function the thread is waiting in, (ie: futex_wait_queue when blocked on a lock)
+		* stack - list|None: Kernel stack of the thread, (only readable by root)
+		* ticks - int: CPU time used by the thread, in clock ticks
+
+		:param pid:
+		:return: None if the process is not running
+		"""
+		if not pid:
+			return None
+		try:
+			tids = sorted(int(tid) for tid in os.listdir(os.path.join(self.proc_root, str(pid), 'task')) if tid.isdigit())
+		except OSError:
+			return None
+
+		threads = []
+		for tid in tids:
+			stat = self.read_stat(pid, tid)
+			if stat is None:
+				# Exited since listing
+				continue
+			wchan = (self._read(str(pid), 'task', str(tid), 'wchan') or '').strip()
+			stack = self._read(str(pid), 'task', str(tid), 'stack')
+			threads.append({
+				'tid': tid,
+				'name': stat['comm'],
+				'state': stat['state'],
+				'wchan': wchan if wchan not in ('', '0') else None,
+				# Lines are formatted as "[<0>] futex_wait_queue+0x69/0xa0"
+				'stack': [line.split('] ', 1)[-1] for line in stack.strip().split('\n')] if stack else None,
+				'ticks': stat['ticks'],
+			})
+		return threads
+
+
+def format_bytes(value: Union[int, None]) -> str:
+	"""
+	Format a memory size for display, (ie: "512 MB" or "1.23 GB")
+
+	:param value: Size in bytes
+	:return:
+	"""
+	if value is None:
+		return 'N/A'
+	if value >= 1024 * 1024 * 1024:
+		return '%.2f GB' % (value / (1024 * 1024 * 1024))
+	return '%.0f MB' % (value // (1024 * 1024))
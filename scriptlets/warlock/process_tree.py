@@ -0,0 +1,214 @@
+import os
+import re
+from typing import Union
+from scriptlets.warlock.json_state import *
+from scriptlets.warlock.process_sampler import *
+
+
+class ProcessTree:
+	"""
+	Finds the actual game server process among the descendants of a service's main process
+
+	Games launched through wrappers, (shell scripts, proton, wine), have a systemd MainPID which is not the server itself.
+	The discovered process is cached, (and persisted between invocations), until the MainPID changes or it exits.
+	"""
+
+	SETTLE_TIME = 300
+	"""
+	:type int:
+	Seconds a process found by its memory usage must have been running before it is cached,
+	(a launcher or updater can use more memory than the server while it is still loading)
+	"""
+
+	def __init__(self, state_file: Union[str, None] = None, proc_root: str = '/proc'):
+		self.state_file = state_file
+		"""
+		:type str|None:
+		JSON file to persist discovered processes to, (None to keep them in memory only)
+		"""
+
+		self.proc_root = proc_root
+		self.sampler = ProcessSampler(None, proc_root)
+
+		self._cache = None
+		"""
+		:type dict<str, dict>|None:
+		Discovered game process of each key, loaded lazily from the state file
+		"""
+
+		self._changed = False
+
+		self._touched = set()
+		"""
+		:type set<str>:
+		Keys changed since the last save
+		"""
+
+	def _read(self, *path) -> Union[str, None]:
+		try:
+			with open(os.path.join(self.proc_root, *path), 'r') as f:
+				return f.read()
+		except OSError:
+			return None
+
+	def get_children(self, pid: int) -> Union[list, None]:
+		"""
+		Get the direct children of a process from /proc/<pid>/task/*/children
+
+		:param pid:
+		:return: None if the kernel does not provide children lists, (CONFIG_PROC_CHILDREN)
+		"""
+		try:
+			tasks = os.listdir(os.path.join(self.proc_root, str(pid), 'task'))
+		except OSError:
+			return []
+
+		children = []
+		supported = False
+		for tid in tasks:
+			data = self._read(str(pid), 'task', tid, 'children')
+			if data is None:
+				continue
+			supported = True
+			children.extend(int(child) for child in data.split())
+		if not supported and len(tasks):
+			return None
+		return children
+
+	def _scan_children(self) -> dict:
+		"""
+		Build a map of parent PID to child PIDs by reading every process, (slow fallback)
+
+		:return:
+		"""
+		children = {}
+		for entry in os.listdir(self.proc_root):
+			if not entry.isdigit():
+				continue
+			stat = self.sampler.read_stat(int(entry))
+			if stat is not None:
+				children.setdefault(stat['ppid'], []).append(int(entry))
+		return children
+
+	def get_descendants(self, pid: int, cgroup_procs: Union[str, None] = None) -> list:
+		"""
+		Get a process and all its descendants, parents before their children
+
+		:param pid: Root process
+		:param cgroup_procs: Path of the cgroup.procs file of the unit, used when children lists are not available
+		:return:
+		"""
+		if cgroup_procs is not None and self.get_children(pid) is None:
+			try:
+				with open(cgroup_procs, 'r') as f:
+					pids = [int(p) for p in f.read().split()]
+				# Every process in the unit, keep the root first
+				return [pid] + [p for p in pids if p != pid]
+			except OSError:
+				pass
+
+		scanned = None
+		result = []
+		queue = [pid]
+		while len(queue):
+			current = queue.pop(0)
+			result.append(current)
+			children = self.get_children(current)
+			if children is None:
+				if scanned is None:
+					scanned = self._scan_children()
+				children = scanned.get(current, [])
+			queue.extend(child for child in children if child not in result)
+		return result
+
+	def describe(self, pid: int) -> str:
+		"""
+		Get the executable path and command line of a process, (as matched against patterns)
+
+		The executable is only readable by the owner of the process or root.
+
+		:param pid:
+		:return:
+		"""
+		try:
+			exe = os.readlink(os.path.join(self.proc_root, str(pid), 'exe'))
+		except OSError:
+			exe = ''
+		cmdline = (self._read(str(pid), 'cmdline') or '').replace('\0', ' ').strip()
+		return exe + '\n' + cmdline
+
+	def _load(self):
+		if self._cache is not None:
+			return
+
+		self._cache = load_json_state(self.state_file) if self.state_file else {}
+
+	def save(self):
+		"""
+		Persist discovered processes so the next invocation does not need to search again
+
+		:return:
+		"""
+		if not self.state_file or not self._changed:
+			return
+
+		def merge(data: dict) -> dict:
+			# Only write back the keys changed here, others may have been updated by a concurrent invocation
+			for key in self._touched:
+				data[key] = self._cache[key]
+			return data
+
+		update_json_state(self.state_file, merge)
+		self._touched = set()
+		self._changed = False
+
+	def find_game_pid(self, key: str, main_pid: int, pattern: Union[str, None] = None, cgroup_procs: Union[str, None] = None) -> int:
+		"""
+		Find the game server process started by a main process
+
+		With a pattern, the deepest process whose executable path or command line matches is used,
+		(wrappers such as "proton run Server.exe" often contain the name of the real executable too).
+		Without one, the process using the most memory is assumed to be the game server,
+		and the search is repeated until that process has been running for SETTLE_TIME.
+
+		:param key: Cache key, (ie: the service name)
+		:param main_pid: MainPID of the service
+		:param pattern: Regular expression matched against the executable path and command line
+		:param cgroup_procs: Path of the cgroup.procs file of the unit, used when children lists are not available
+		:return: 0 if no process was found
+		"""
+		if not main_pid:
+			return 0
+
+		self._load()
+		cached = self._cache.get(key)
+		if cached is not None and cached['main_pid'] == main_pid and cached.get('pattern') == pattern and cached.get('settled', True):
+			stat = self.sampler.read_stat(cached['game_pid'])
+			if stat is not None and stat['start'] == cached['game_start']:
+				return cached['game_pid']
+
+		candidates = self.get_descendants(main_pid, cgroup_procs)
+		found = 0
+		if pattern:
+			regex = re.compile(pattern)
+			for pid in candidates:
+				if regex.search(self.describe(pid)):
+					found = pid
+		else:
+			largest = -1
+			for pid in candidates:
+				memory = self.sampler.read_memory(pid)
+				if memory is not None and memory['rss_bytes'] > largest:
+					largest = memory['rss_bytes']
+					found = pid
+
+		stat = self.sampler.read_stat(found) if found else None
+		if stat is None:
+			# Not started yet, (or already exited), search again next time
+			return 0
+
+		settled = bool(pattern) or self.sampler.get_uptime() - stat['start'] / self.sampler.clock_ticks >= self.SETTLE_TIME
+		self._cache[key] = {'main_pid': main_pid, 'pattern': pattern, 'game_pid': found, 'game_start': stat['start'], 'settled': settled}
+		self._touched.add(key)
+		self._changed = True
+		return found
@@ -16,7 +16,7 @@ class RCONService(BaseService):
 		# Some game servers don't handle RCON very well, so try a few times before giving up.
 		retry = 6
 
-		if not (self.is_running() or self.is_starting() or self.is_stopping()):
+		if not self.is_active():
 			# If service is not running, don't even try to connect.
 			return None
 
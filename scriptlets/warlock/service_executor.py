@@ -0,0 +1,71 @@
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+class ServiceExecutor:
+	"""
+	Runs an action against multiple service instances concurrently
+
+	Stopping or restarting a cluster of instances then takes roughly as long as the slowest instance,
+	instead of the sum of all of them.
+	"""
+
+	def __init__(self, concurrency: int = 0):
+		self.concurrency = concurrency
+		"""
+		:type int:
+		Maximum number of instances acted on at once, (0 for all of them)
+		"""
+
+	def _run_one(self, service, action: Callable, success: Callable) -> dict:
+		timer = time.time()
+		try:
+			result = action(service)
+			error = None
+		except Exception as e:
+			result = None
+			error = '%s: %s' % (type(e).__name__, str(e))
+			traceback.print_exc()
+
+		return {
+			'service': service.service,
+			'success': error is None and success(result),
+			'seconds': round(time.time() - timer, 2),
+			'result': result,
+			'error': error,
+		}
+
+	def run(self, action_name: str, services: list, action: Callable, success: Callable) -> dict:
+		"""
+		Run an action on each service and collect a report of the results
+
+		The report contains:
+
+		* action - str: Name of the action performed
+		* success - bool: True if the action succeeded on every service
+		* seconds - float: Total time taken
+		* results - list: Per-service dicts of service, success, seconds, result and error,
+		  (in the same order as services)
+
+		:param action_name: Name of the action, (for the report)
+		:param services: List of BaseService instances
+		:param action: Callable taking a service and returning its result
+		:param success: Callable taking a result and returning whether it succeeded
+		:return:
+		"""
+		timer = time.time()
+		results = []
+		if len(services) > 0:
+			workers = len(services) if self.concurrency <= 0 else min(self.concurrency, len(services))
+			with ThreadPoolExecutor(max_workers=workers) as pool:
+				futures = [pool.submit(self._run_one, service, action, success) for service in services]
+				results = [future.result() for future in futures]
+
+		return {
+			'action': action_name,
+			'success': all(r['success'] for r in results),
+			'seconds': round(time.time() - timer, 2),
+			'results': results,
+		}
@@ -0,0 +1,280 @@
+import datetime
+import time
+from typing import Union
+
+
+class ServiceStateSnapshot:
+	"""
+	Point-in-time state of a set of systemd units, retrieved with a single query to systemd
+
+	Querying every property of every instance at once replaces the individual
+	`systemctl is-active`, `is-enabled` and `show -p` forks previously issued
+	by each state accessor on the service.
+
+	Parsing of `systemctl show --timestamp=unix` output is provided here for the systemctl backend.
+	"""
+
+	PROPERTIES = (
+		'Id',
+		'LoadState',
+		'ActiveState',
+		'SubState',
+		'UnitFileState',
+		'MainPID',
+		'ExecMainPID',
+		'ExecMainCode',
+		'ExecMainStatus',
+		'ExecMainStartTimestamp',
+		'ExecMainExitTimestamp',
+		'ExecMainStartTimestampMonotonic',
+		'ExecMainExitTimestampMonotonic',
+		'ActiveEnterTimestamp',
+		'InactiveEnterTimestamp',
+		'NRestarts',
+		'ControlGroup',
+		'ExecStartPre',
+		'ExecStart',
+	)
+	"""
+	:type tuple<str>:
+	Properties requested from systemd for each unit
+	"""
+
+	INT_PROPERTIES = (
+		'MainPID',
+		'ExecMainPID',
+		'ExecMainCode',
+		'ExecMainStatus',
+		'ExecMainStartTimestampMonotonic',
+		'ExecMainExitTimestampMonotonic',
+		'NRestarts',
+	)
+	"""
+	:type tuple<str>:
+	Properties which are converted to integers, (monotonic timestamps are kept in microseconds since boot)
+	"""
+
+	TIMESTAMP_PROPERTIES = (
+		'ExecMainStartTimestamp',
+		'ExecMainExitTimestamp',
+		'ActiveEnterTimestamp',
+		'InactiveEnterTimestamp',
+	)
+	"""
+	:type tuple<str>:
+	Properties which are converted to unix timestamps
+	"""
+
+	EXEC_PROPERTIES = ('ExecStartPre', 'ExecStart')
+	"""
+	:type tuple<str>:
+	Properties describing an executed command, (parsed into a dictionary)
+	"""
+
+	EXIT_CODES = {
+		1: 'exited',
+		2: 'killed',
+		3: 'dumped',
+		4: 'trapped',
+		5: 'stopped',
+		6: 'continued',
+	}
+	"""
+	:type dict<int, str>:
+	Map of si_code values to the names systemctl displays for them
+	"""
+
+	def __init__(self, units: list):
+		self.units = list(units)
+		"""
+		:type list<str>:
+		List of unit names included in this snapshot
+		"""
+
+		self.states = {}
+		"""
+		:type dict<str, dict>:
+		Parsed properties of each unit, keyed by the unit ID (ie: "my-game.service")
+		"""
+
+		self.timestamp = 0.0
+		"""
+		:type float:
+		Time the snapshot was last refreshed
+		"""
+
+	@classmethod
+	def unit_id(cls, unit: str) -> str:
+		"""
+		Get the full unit ID of a service name, as reported by systemd
+
+		:param unit:
+		:return:
+		"""
+		if unit.endswith('.service'):
+			return unit
+		return unit + '.service'
+
+	@classmethod
+	def empty_state(cls) -> dict:
+		"""
+		Get the state of a unit which could not be queried
+
+		:return:
+		"""
+		state = {}
+		for prop in cls.PROPERTIES:
+			if prop in cls.INT_PROPERTIES:
+				state[prop] = 0
+			elif prop in cls.TIMESTAMP_PROPERTIES or prop in cls.EXEC_PROPERTIES:
+				state[prop] = None
+			else:
+				state[prop] = ''
+		return state
+
+	def refresh(self, backend) -> 'ServiceStateSnapshot':
+		"""
+		Query systemd for the current state of all units in this snapshot
+
+		:param backend: SystemdBackend used to perform the query
+		:return:
+		"""
+		self.states = backend.get_states(self.units)
+		self.timestamp = time.time()
+		return self
+
+	def get(self, unit: str) -> dict:
+		"""
+		Get the parsed state of a given unit, (or an empty state if not available)
+
+		:param unit:
+		:return:
+		"""
+		return self.states.get(self.unit_id(unit), self.empty_state())
+
+	def has(self, unit: str) -> bool:
+		"""
+		Check if this snapshot contains the state of a given unit
+
+		:param unit:
+		:return:
+		"""
+		return self.unit_id(unit) in self.states
+
+	@classmethod
+	def parse(cls, output: str) -> dict:
+		"""
+		Parse the output of `systemctl show` for one or more units
+
+		Each unit is printed as a block of KEY=VALUE lines, separated by an empty line.
+
+		:param output:
+		:return:
+		"""
+		states = {}
+		state = None
+		for line in output.split('\n'):
+			line = line.strip()
+			if line == '':
+				state = None
+				continue
+
+			if '=' not in line:
+				continue
+
+			if state is None:
+				state = cls.empty_state()
+
+			key, val = line.split('=', 1)
+			if key in cls.INT_PROPERTIES:
+				state[key] = int(val) if val.lstrip('-').isdigit() else 0
+			elif key in cls.TIMESTAMP_PROPERTIES:
+				state[key] = cls.parse_timestamp(val)
+			elif key in cls.EXEC_PROPERTIES:
+				# Units with multiple commands list one line per command, the last one executed is the most relevant.
+				parsed = cls.parse_exec(val)
+				if parsed is not None:
+					state[key] = parsed
+			else:
+				state[key] = val
+
+			if key == 'Id':
+				states[val] = state
+
+		return states
+
+	@classmethod
+	def parse_timestamp(cls, val: str) -> Union[int, None]:
+		"""
+		Parse a timestamp value from systemd into a unix timestamp
+
+		:param val: "@1700000000" when requested with --timestamp=unix
+		:return:
+		"""
+		val = val.strip()
+		if val == '' or val == 'n/a':
+			return None
+
+		if val.startswith('@'):
+			return int(val[1:])
+
+		# Older versions of systemd only support the localised format
+		try:
+			return int(datetime.datetime.strptime(val, '%a %Y-%m-%d %H:%M:%S %Z').timestamp())
+		except ValueError:
+			return None
+
+	@classmethod
+	def parse_exec(cls, val: str) -> Union[dict, None]:
+		"""
+		Parse an ExecStart-style property from systemd
+
+		* path - string: Path of the command
+		* arguments - string: Arguments passed to the command
+		* start_time - int: Unix timestamp the command started
+		* stop_time - int: Unix timestamp the command stopped
+		* pid - int: PID of the command
+		* code - string: Exit code of the command
+		* status - int: Exit status of the command
+
+		:param val: "{ path=... ; argv[]=... ; start_time=[@1700000000] ; ... }"
+		:return:
+		"""
+		val = val.strip()
+		if val == '':
+			return None
+
+		if val.startswith('{') and val.endswith('}'):
+			val = val[1:-1]  # Remove surrounding {}
+
+		result = {
+			'path': None,
+			'arguments': None,
+			'start_time': None,
+			'stop_time': None,
+			'pid': 0,
+			'code': None,
+			'status': 0,
+		}
+		for part in val.split(' ; '):
+			if '=' not in part:
+				continue
+			key, part_val = part.split('=', 1)
+			key = key.strip()
+			part_val = part_val.strip()
+			if key == 'path':
+				result['path'] = part_val
+			elif key == 'argv[]':
+				result['arguments'] = part_val
+			elif key == 'start_time' or key == 'stop_time':
+				result[key] = cls.parse_timestamp(part_val[1:-1])  # Remove surrounding []
+			elif key == 'pid':
+				result['pid'] = int(part_val) if part_val.isdigit() else 0
+			elif key == 'code':
+				result['code'] = None if part_val == '(null)' else part_val
+			elif key == 'status':
+				if '/' in part_val:
+					part_val = part_val.split('/')[0]
+				result['status'] = int(part_val) if part_val.lstrip('-').isdigit() else 0
+
+		return result
@@ -0,0 +1,168 @@
+import threading
+import time
+import traceback
+from typing import Union
+from scriptlets.warlock.host_stats import *
+
+
+class StartScheduler:
+	"""
+	Starts multiple service instances without overloading the host
+
+	The next instance is admitted as soon as every instance already admitted is ready, (or has failed),
+	or earlier if the host load, pressure stall and available memory are all within their thresholds.
+	This avoids every instance loading its map at the same moment and each one taking far longer to become ready.
+	"""
+
+	def __init__(
+		self,
+		max_load: float = 0.8,
+		max_pressure: float = 20.0,
+		min_memory: int = 2 * 1024 * 1024 * 1024,
+		host: Union[HostStatsReader, None] = None
+	):
+		self.max_load = max_load
+		"""
+		:type float:
+		Maximum 1-minute load average per CPU to admit another instance early, (0 to ignore load)
+		"""
+
+		self.max_pressure = max_pressure
+		"""
+		:type float:
+		Maximum "some" avg10 pressure stall percentage of CPU, memory and IO to admit another instance early,
+		(0 to ignore pressure)
+		"""
+
+		self.min_memory = min_memory
+		"""
+		:type int:
+		Minimum bytes of MemAvailable to admit another instance early, (0 to ignore memory)
+		"""
+
+		self.settle_time = 10.0
+		"""
+		:type float:
+		Seconds after admitting an instance before the host is checked again,
+		(load and pressure averages take a few seconds to reflect a new instance)
+		"""
+
+		self.poll_interval = 1.0
+		"""
+		:type float:
+		Seconds between checks while instances are starting
+		"""
+
+		self.host = host if host is not None else HostStatsReader()
+
+	def get_host_limit(self) -> Union[str, None]:
+		"""
+		Check the host against the configured thresholds
+
+		:return: Description of the first threshold exceeded, or None if the host has capacity
+		"""
+		load = self.host.read_loadavg()
+		if self.max_load > 0 and load is not None and load['load1_per_cpu'] > self.max_load:
+			return 'load %.2f per CPU' % load['load1_per_cpu']
+
+		if self.max_pressure > 0:
+			for resource in ('cpu', 'memory', 'io'):
+				pressure = self.host.read_pressure(resource)
+				if pressure is not None and pressure['some_avg10'] is not None and pressure['some_avg10'] > self.max_pressure:
+					return '%s pressure %.1f%%' % (resource, pressure['some_avg10'])
+
+		meminfo = self.host.read_meminfo()
+		if self.min_memory > 0 and meminfo is not None and 'MemAvailable' in meminfo and meminfo['MemAvailable'] < self.min_memory:
+			return 'memory available %d MB' % (meminfo['MemAvailable'] // (1024 * 1024))
+
+		return None
+
+	def _wait(self, service, watcher, start_timer: float, entry: dict, done: threading.Event):
+		try:
+			entry['result'] = service.wait_until_ready(watcher, start_timer, False)
+			entry['success'] = entry['result']['status'] == 'ready'
+			print('%s %s after %.1f seconds' % (service.service, entry['result']['status'], entry['result']['seconds']))
+		except Exception as e:
+			entry['error'] = '%s: %s' % (type(e).__name__, str(e))
+			traceback.print_exc()
+		entry['seconds'] = round(time.time() - start_timer, 2)
+		done.set()
+
+	def run(self, services: list) -> dict:
+		"""
+		Start the given services, (in order), and wait for all of them to be ready
+
+		The report contains:
+
+		* action - str: 'start'
+		* success - bool: True if every service became ready, (or was already running or starting)
+		* seconds - float: Total time taken
+		* results - list: Per-service dicts in the order they were admitted, containing:
+		  * service - str: Service name
+		  * success - bool: True if the service became ready, (or was already running or starting)
+		  * admitted_at - float: Seconds after the scheduler began that the service was started
+		  * admitted_because - str: Why the service was started at that point
+		  * seconds - float: Time from start to ready, (or failure)
+		  * result - dict: Result of wait_until_ready, None if the service was not started, (ie: already running)
+		  * error - str: Exception raised while waiting, if any
+
+		:param services: List of BaseService instances, (each providing begin_start and wait_until_ready)
+		:return:
+		"""
+		timer = time.time()
+		pending = list(services)
+		results = []
+		threads = []
+		done = threading.Event()
+		last_admit = 0.0
+
+		while len(pending) > 0:
+			starting = [t for t in threads if t.is_alive()]
+			reason = None
+			if len(starting) == 0:
+				reason = 'first' if len(results) == 0 else 'previous ready'
+			elif time.monotonic() - last_admit >= self.settle_time:
+				limit = self.get_host_limit()
+				if limit is None:
+					reason = 'host below thresholds'
+
+			if reason is None:
+				done.wait(self.poll_interval)
+				done.clear()
+				continue
+
+			service = pending.pop(0)
+			last_admit = time.monotonic()
+			entry = {
+				'service': service.service,
+				'success': True,
+				'admitted_at': round(time.time() - timer, 2),
+				'admitted_because': reason,
+				'seconds': 0.0,
+				'result': None,
+				'error': None,
+			}
+			results.append(entry)
+
+			print('Starting %s (%s)' % (service.service, reason))
+			start_timer = time.time()
+			watcher = service.begin_start()
+			if watcher is None:
+				# Already running, (or could not be started, which begin_start reports)
+				entry['success'] = service.is_running() or service.is_starting()
+				continue
+
+			entry['success'] = False
+			thread = threading.Thread(target=self._wait, args=(service, watcher, start_timer, entry, done), daemon=True)
+			thread.start()
+			threads.append(thread)
+
+		for thread in threads:
+			thread.join()
+
+		return {
+			'action': 'start',
+			'success': all(r['success'] for r in results),
+			'seconds': round(time.time() - timer, 2),
+			'results': results,
+		}
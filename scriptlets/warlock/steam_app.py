@@ -1,7 +1,9 @@
 import os
 import time
 import subprocess
+import sys
 from scriptlets.warlock.base_app import *
+from scriptlets.warlock.start_scheduler import *
 from scriptlets.steam.steamcmd_check_app_update import *
 
 class SteamApp(BaseApp):
@@ -30,28 +32,41 @@ class SteamApp(BaseApp):
 
 		:return:
 		"""
-		# Stop any running services before updating
+		# Stop any running services before updating, all at once
 		services = []
+		waiters = []
+		failed = []
+		stop_timer = time.time()
+		self.load_service_states()
 		for service in self.get_services():
 			if service.is_running() or service.is_starting():
 				print('Stopping service %s for update...' % service.service)
-				services.append(service.service)
-				subprocess.Popen(['systemctl', 'stop', service.service])
+				waiter = service.begin_stop()
+				if waiter is None:
+					# Still running, the files must not be replaced under it
+					failed.append(service)
+				else:
+					services.append(service)
+					waiters.append(waiter)
 
-		if len(services) > 0:
+		if len(services) > 0 or len(failed) > 0:
 			# Wait for all services to stop, may take 5 minutes if players are online.
-			print('Waiting up to 5 minutes for all services to stop...')
-			counter = 0
-			while counter < 30:
-				all_stopped = True
-				counter += 1
-				for service in self.get_services():
-					if service.is_running() or service.is_starting() or service.is_stopping():
-						all_stopped = False
-						break
-				if all_stopped:
-					break
-				time.sleep(10)
+			print('Waiting for all services to stop...')
+			stopped = []
+			for service, waiter in zip(services, waiters):
+				result = service.wait_until_stopped(waiter, stop_timer)
+				print('Service %s %s after %.1f seconds' % (service.service, result['status'], result['seconds']))
+				if result['status'] == 'stopped':
+					stopped.append(service)
+				else:
+					failed.append(service)
+			if len(failed) > 0:
+				print('Not all services stopped (%s), aborting update!' % ', '.join(svc.service for svc in failed), file=sys.stderr)
+				if len(stopped) > 0:
+					# Bring back the instances which were taken down for nothing
+					print('Restarting services which did stop...')
+					StartScheduler().run(stopped)
+				return False
 		else:
 			print('No running services found, proceeding with update...')
 
@@ -92,8 +107,7 @@ class SteamApp(BaseApp):
 
 		if len(services) > 0:
 			print('Update completed, restarting previously running services...')
-			for service in services:
-				subprocess.Popen(['systemctl', 'start', service])
-				time.sleep(10)
+			# Staggered so every instance does not load its map at the same moment
+			StartScheduler().run(services)
 
 		return res.returncode == 0
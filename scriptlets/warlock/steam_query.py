@@ -0,0 +1,63 @@
+import socket
+import time
+from typing import Union
+
+
+class SteamQuery:
+	"""
+	Minimal client for the Steam server query protocol, (A2S_INFO), answered by the query port of most Steam game servers
+
+	A single datagram round trip, so cheap enough to be used as a liveness probe.
+	"""
+
+	HEADER = b'\xFF\xFF\xFF\xFF'
+	"""
+	:type bytes:
+	Prefix of every single-packet request and response
+	"""
+
+	SPLIT_HEADER = b'\xFE\xFF\xFF\xFF'
+	"""
+	:type bytes:
+	Prefix of a response split over multiple packets
+	"""
+
+	INFO_REQUEST = HEADER + b'TSource Engine Query\x00'
+
+	def __init__(self, host: str = '127.0.0.1', port: int = 27015, timeout: float = 5.0):
+		self.host = host
+		self.port = port
+		self.timeout = timeout
+		"""
+		:type float:
+		Seconds to wait for each response
+		"""
+
+	def ping(self) -> Union[float, None]:
+		"""
+		Send an A2S_INFO request and wait for the server to answer it
+
+		Servers which require a challenge, (a response of 'A'), are sent the request again with it appended.
+
+		:return: Seconds taken to respond, or None if the server did not respond
+		"""
+		timer = time.time()
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		try:
+			sock.settimeout(self.timeout)
+			request = self.INFO_REQUEST
+			for _ in range(2):
+				sock.sendto(request, (self.host, self.port))
+				data, _ = sock.recvfrom(65535)
+				if data.startswith(self.SPLIT_HEADER) or data.startswith(self.HEADER + b'I'):
+					return round(time.time() - timer, 4)
+				if data.startswith(self.HEADER + b'A') and len(data) >= 9:
+					request = self.INFO_REQUEST + data[5:9]
+					continue
+				return None
+		except OSError:
+			# Includes socket.timeout and ICMP port unreachable
+			return None
+		finally:
+			sock.close()
+		return None
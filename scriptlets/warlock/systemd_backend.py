@@ -0,0 +1,466 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Union
+from scriptlets.warlock.dbus_client import *
+from scriptlets.warlock.service_state_snapshot import *
+
+
+class UnitWatcher:
+	"""
+	Waits for state changes of a unit
+
+	This base version has no notifications available, so waiting simply sleeps
+	and the caller is expected to poll the unit state afterwards.
+	"""
+
+	def __init__(self, unit: str):
+		self.unit = ServiceStateSnapshot.unit_id(unit)
+
+		self.job_result = None
+		"""
+		:type str|None:
+		Result of the last job completed on this unit, (done, failed, canceled, timeout, dependency, skipped)
+		"""
+
+	def wait(self, timeout: float) -> bool:
+		"""
+		Wait for the unit to change state
+
+		:param timeout: Maximum number of seconds to wait
+		:return: True if a change was signalled, False if the timeout elapsed
+		"""
+		time.sleep(timeout)
+		return False
+
+	def close(self):
+		pass
+
+
+class DBusUnitWatcher(UnitWatcher):
+	"""
+	Waits for PropertiesChanged and JobRemoved signals of a unit from systemd
+	"""
+
+	def __init__(self, unit: str, bus_path: Union[str, None] = None):
+		super().__init__(unit)
+		self.path = DBusBackend.unit_path(unit)
+		# Signals are received on a dedicated connection so they do not interleave with method calls
+		self._conn = DBusConnection(bus_path).connect()
+		try:
+			self._conn.add_match(
+				"type='signal',sender='%s',path='%s',interface='%s',member='PropertiesChanged'" % (
+					DBusBackend.DESTINATION, self.path, DBusBackend.PROPERTIES_INTERFACE
+				)
+			)
+			self._conn.add_match(
+				"type='signal',sender='%s',interface='%s',member='JobRemoved'" % (
+					DBusBackend.DESTINATION, DBusBackend.MANAGER_INTERFACE
+				)
+			)
+			# systemd only emits unit and job signals while at least one client is subscribed
+			self._conn.call(DBusBackend.DESTINATION, DBusBackend.MANAGER_PATH, DBusBackend.MANAGER_INTERFACE, 'Subscribe')
+		except (OSError, DBusError):
+			self._conn.close()
+			raise
+
+	def wait(self, timeout: float) -> bool:
+		deadline = time.monotonic() + timeout
+		while True:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				return False
+			try:
+				msg = self._conn.read_signal(remaining)
+			except (OSError, DBusError):
+				# Lost the bus, degrade to polling
+				time.sleep(max(0.0, deadline - time.monotonic()))
+				return False
+			if msg is None:
+				return False
+			if msg.member == 'JobRemoved' and len(msg.body) == 4 and msg.body[2] == self.unit:
+				self.job_result = msg.body[3]
+				return True
+			if msg.member == 'PropertiesChanged' and msg.path == self.path:
+				return True
+
+	def close(self):
+		self._conn.close()
+
+
+class SystemdBackend:
+	"""
+	Interface to systemd for querying and controlling units
+	"""
+
+	RUNTIME_CONTROL_DIR = '/run/systemd/system.control'
+	"""
+	:type str:
+	Directory systemd stores properties changed with set-property --runtime in, (as <unit>.d/50-<Property>.conf)
+	"""
+
+	def watch(self, unit: str) -> UnitWatcher:
+		"""
+		Start watching a unit for state changes
+
+		Must be called before performing the action to be waited on, so no change is missed.
+
+		:param unit:
+		:return:
+		"""
+		return UnitWatcher(unit)
+
+	def get_states(self, units: list) -> dict:
+		"""
+		Get the state of the requested units, keyed by unit ID
+
+		Each state contains the properties listed in ServiceStateSnapshot.PROPERTIES
+
+		:param units:
+		:return:
+		"""
+		pass
+
+	def start(self, unit: str) -> bool:
+		"""
+		Queue a start job for the unit without waiting for it to complete
+		:param unit:
+		:return:
+		"""
+		pass
+
+	def stop(self, unit: str) -> bool:
+		"""
+		Queue a stop job for the unit without waiting for it to complete
+		:param unit:
+		:return:
+		"""
+		pass
+
+	def restart(self, unit: str) -> bool:
+		"""
+		Queue a restart job for the unit without waiting for it to complete
+		:param unit:
+		:return:
+		"""
+		pass
+
+	def enable(self, unit: str) -> bool:
+		"""
+		Enable the unit to start on boot
+		:param unit:
+		:return:
+		"""
+		pass
+
+	def disable(self, unit: str) -> bool:
+		"""
+		Disable the unit from starting on boot
+		:param unit:
+		:return:
+		"""
+		pass
+
+	def reload(self) -> bool:
+		"""
+		Reload all unit files, (required for changed drop-ins to take effect)
+		:return:
+		"""
+		pass
+
+	def set_properties(self, unit: str, properties: dict) -> bool:
+		"""
+		Change resource control properties of a running unit, (systemctl set-property --runtime)
+
+		The properties are written to RUNTIME_CONTROL_DIR, which takes precedence over drop-ins in /etc/systemd/system
+		and lasts until the next reboot, (see clear_runtime_property).
+
+		:param unit:
+		:param properties: dict of directive to value, (ie: {'MemoryMax': '8G'}), using the unit file syntax
+		:return:
+		"""
+		pass
+
+	def clear_runtime_property(self, unit: str, key: str) -> bool:
+		"""
+		Remove a property set with set_properties, so the unit's own setting applies again from its next start
+
+		:param unit:
+		:param key: Directive, (ie: MemoryMax)
+		:return: True if a runtime setting was removed
+		"""
+		path = os.path.join(self.RUNTIME_CONTROL_DIR, ServiceStateSnapshot.unit_id(unit) + '.d', '50-%s.conf' % key)
+		try:
+			os.remove(path)
+		except FileNotFoundError:
+			return False
+		except OSError as e:
+			print('Unable to remove runtime setting %s: %s' % (path, e), file=sys.stderr)
+			return False
+		self.reload()
+		return True
+
+
+class SystemctlBackend(SystemdBackend):
+	"""
+	Systemd backend which forks `systemctl` for each operation
+	"""
+
+	def get_states(self, units: list) -> dict:
+		if len(units) == 0:
+			return {}
+
+		cmd = ['systemctl', 'show', '--timestamp=unix', '-p', ','.join(ServiceStateSnapshot.PROPERTIES)] + list(units)
+		result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+		if result.returncode != 0 and b'timestamp' in result.stderr:
+			# systemd < 248 does not support --timestamp, fallback to the default (local time) format
+			cmd.remove('--timestamp=unix')
+			result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+
+		return ServiceStateSnapshot.parse(result.stdout.decode())
+
+	def _systemctl(self, *args) -> bool:
+		return subprocess.run(['systemctl'] + list(args), check=False).returncode == 0
+
+	def start(self, unit: str) -> bool:
+		return self._systemctl('start', '--no-block', unit)
+
+	def stop(self, unit: str) -> bool:
+		return self._systemctl('stop', '--no-block', unit)
+
+	def restart(self, unit: str) -> bool:
+		return self._systemctl('restart', '--no-block', unit)
+
+	def enable(self, unit: str) -> bool:
+		return self._systemctl('enable', unit)
+
+	def disable(self, unit: str) -> bool:
+		return self._systemctl('disable', unit)
+
+	def reload(self) -> bool:
+		return self._systemctl('daemon-reload')
+
+	def set_properties(self, unit: str, properties: dict) -> bool:
+		assignments = ['%s=%s' % (key, val) for key, val in properties.items()]
+		return self._systemctl('set-property', '--runtime', unit, *assignments)
+
+
+class DBusBackend(SystemdBackend):
+	"""
+	Systemd backend which talks to org.freedesktop.systemd1 directly over the system bus
+
+	Any failure to communicate with the bus falls back to the given backend, (systemctl by default).
+	"""
+
+	DESTINATION = 'org.freedesktop.systemd1'
+	MANAGER_PATH = '/org/freedesktop/systemd1'
+	MANAGER_INTERFACE = 'org.freedesktop.systemd1.Manager'
+	UNIT_INTERFACE = 'org.freedesktop.systemd1.Unit'
+	SERVICE_INTERFACE = 'org.freedesktop.systemd1.Service'
+	PROPERTIES_INTERFACE = 'org.freedesktop.DBus.Properties'
+
+	def __init__(self, bus_path: str = None, fallback: Union[SystemdBackend, None] = None):
+		self.bus_path = bus_path
+		self.fallback = fallback if fallback is not None else SystemctlBackend()
+		self._conn = None
+		self._lock = threading.RLock()
+		"""
+		:type threading.RLock:
+		Serialises use of the shared connection when services are managed from multiple threads
+		"""
+
+	def get_connection(self) -> DBusConnection:
+		"""
+		Get the (shared) connection to the system bus, connecting if necessary
+		:return:
+		"""
+		if self._conn is None or not self._conn.connected:
+			self._conn = DBusConnection(self.bus_path).connect()
+		return self._conn
+
+	@classmethod
+	def unit_path(cls, unit: str) -> str:
+		"""
+		Get the object path of a unit, (escaped as sd_bus_path_encode does)
+
+		:param unit:
+		:return:
+		"""
+		escaped = ''
+		for i, char in enumerate(ServiceStateSnapshot.unit_id(unit)):
+			if char.isascii() and (char.isalpha() or (char.isdigit() and i > 0)):
+				escaped += char
+			else:
+				escaped += '_%02x' % ord(char)
+		return '/org/freedesktop/systemd1/unit/' + escaped
+
+	@classmethod
+	def _timestamp(cls, usec: int) -> Union[int, None]:
+		return usec // 1000000 if usec else None
+
+	@classmethod
+	def _exec_status(cls, commands: list) -> Union[dict, None]:
+		"""
+		Convert an a(sasbttttuii) ExecStart-style property into the format used by ServiceStateSnapshot
+
+		:param commands:
+		:return:
+		"""
+		if not commands:
+			return None
+		# Units with multiple commands list one entry per command, the last one executed is the most relevant.
+		path, argv, _, start_time, _, stop_time, _, pid, code, status = commands[-1]
+		return {
+			'path': path,
+			'arguments': ' '.join(argv),
+			'start_time': cls._timestamp(start_time),
+			'stop_time': cls._timestamp(stop_time),
+			'pid': pid,
+			'code': ServiceStateSnapshot.EXIT_CODES.get(code),
+			'status': status,
+		}
+
+	def _get_states(self, units: list) -> dict:
+		calls = []
+		for unit in units:
+			path = self.unit_path(unit)
+			for interface in (self.UNIT_INTERFACE, self.SERVICE_INTERFACE):
+				calls.append((self.DESTINATION, path, self.PROPERTIES_INTERFACE, 'GetAll', 's', [interface]))
+
+		replies = self.get_connection().call_many(calls, raise_errors=False)
+		states = {}
+		for i, unit in enumerate(units):
+			unit_props = replies[i * 2]
+			service_props = replies[i * 2 + 1]
+			if isinstance(unit_props, DBusError):
+				continue
+			if len(unit_props) != 1 or not isinstance(unit_props[0], dict):
+				raise DBusError('org.freedesktop.DBus.Error.InvalidSignature', 'Unexpected reply to GetAll of %s' % unit)
+			props = dict(unit_props[0])
+			if not isinstance(service_props, DBusError) and len(service_props) == 1 and isinstance(service_props[0], dict):
+				props.update(service_props[0])
+
+			state = ServiceStateSnapshot.empty_state()
+			for prop in ServiceStateSnapshot.PROPERTIES:
+				if prop not in props:
+					continue
+				if prop in ServiceStateSnapshot.TIMESTAMP_PROPERTIES:
+					state[prop] = self._timestamp(props[prop])
+				elif prop in ServiceStateSnapshot.EXEC_PROPERTIES:
+					state[prop] = self._exec_status(props[prop])
+				else:
+					state[prop] = props[prop]
+			states[state['Id'] or ServiceStateSnapshot.unit_id(unit)] = state
+		return states
+
+	def watch(self, unit: str) -> UnitWatcher:
+		try:
+			return DBusUnitWatcher(unit, self.bus_path)
+		except (OSError, DBusError) as e:
+			logging.debug('Unable to watch %s over D-Bus, falling back to polling: %s' % (unit, e))
+			return UnitWatcher(unit)
+
+	def _manager_call(self, member: str, signature: str, args: list) -> list:
+		return self.get_connection().call(self.DESTINATION, self.MANAGER_PATH, self.MANAGER_INTERFACE, member, signature, args)
+
+	def _with_fallback(self, name: str, arg, func, *func_args):
+		"""
+		Run func against the bus, retrying the operation with the fallback backend on failure
+
+		:param name: Name of the backend method being performed
+		:param arg: Argument to pass to the fallback backend method, (None for methods without one)
+		:param func: Callable performing the operation over D-Bus
+		:param func_args: Arguments for func
+		:return:
+		"""
+		with self._lock:
+			try:
+				return func(*func_args)
+			except (OSError, DBusError) as e:
+				logging.debug('systemd D-Bus %s failed, falling back to %s: %s' % (name, type(self.fallback).__name__, e))
+				if self._conn is not None:
+					self._conn.close()
+		if arg is None:
+			return getattr(self.fallback, name)()
+		return getattr(self.fallback, name)(arg)
+
+	def _queue_job(self, member: str, unit: str) -> bool:
+		self._manager_call(member, 'ss', [ServiceStateSnapshot.unit_id(unit), 'replace'])
+		return True
+
+	def get_states(self, units: list) -> dict:
+		if len(units) == 0:
+			return {}
+		return self._with_fallback('get_states', units, self._get_states, units)
+
+	def start(self, unit: str) -> bool:
+		return self._with_fallback('start', unit, self._queue_job, 'StartUnit', unit)
+
+	def stop(self, unit: str) -> bool:
+		return self._with_fallback('stop', unit, self._queue_job, 'StopUnit', unit)
+
+	def restart(self, unit: str) -> bool:
+		return self._with_fallback('restart', unit, self._queue_job, 'RestartUnit', unit)
+
+	def _enable(self, unit: str) -> bool:
+		self._manager_call('EnableUnitFiles', 'asbb', [[ServiceStateSnapshot.unit_id(unit)], False, False])
+		self._manager_call('Reload', '', [])
+		return True
+
+	def _disable(self, unit: str) -> bool:
+		self._manager_call('DisableUnitFiles', 'asb', [[ServiceStateSnapshot.unit_id(unit)], False])
+		self._manager_call('Reload', '', [])
+		return True
+
+	def enable(self, unit: str) -> bool:
+		return self._with_fallback('enable', unit, self._enable, unit)
+
+	def disable(self, unit: str) -> bool:
+		return self._with_fallback('disable', unit, self._disable, unit)
+
+	def _reload(self) -> bool:
+		self._manager_call('Reload', '', [])
+		return True
+
+	def reload(self) -> bool:
+		return self._with_fallback('reload', None, self._reload)
+
+	def set_properties(self, unit: str, properties: dict) -> bool:
+		# Values use the unit file syntax, (ie: "200%" or "8G"), which systemctl converts to the typed bus properties
+		return self.fallback.set_properties(unit, properties)
+
+
+_systemd_backend = None
+
+
+def get_systemd_backend() -> SystemdBackend:
+	"""
+	Get the shared systemd backend for this process
+
+	The D-Bus backend is used when the system bus socket is available,
+	(override with WARLOCK_SYSTEMD_BACKEND=systemctl or =dbus).
+
+	:return:
+	"""
+	global _systemd_backend
+	if _systemd_backend is None:
+		preferred = os.environ.get('WARLOCK_SYSTEMD_BACKEND', '')
+		if preferred == 'dbus' or (preferred != 'systemctl' and os.path.exists(DBusConnection.SYSTEM_BUS_PATH)):
+			_systemd_backend = DBusBackend()
+		else:
+			_systemd_backend = SystemctlBackend()
+	return _systemd_backend
+
+
+def set_systemd_backend(backend: Union[SystemdBackend, None]):
+	"""
+	Override the shared systemd backend, (None to auto-detect again)
+
+	:param backend:
+	:return:
+	"""
+	global _systemd_backend
+	_systemd_backend = backend
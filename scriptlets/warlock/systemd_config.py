@@ -0,0 +1,154 @@
+import os
+import sys
+from typing import Union
+from scriptlets.warlock.base_config import *
+
+
+class SystemdConfig(BaseConfig):
+	"""
+	Configuration stored as a systemd drop-in of a unit, (ie: /etc/systemd/system/<unit>.service.d/<name>.conf)
+
+	The section of each option is the unit file section, (ie: Service), and the key its directive.
+	Options without a value are left out of the drop-in so the unit's own setting applies,
+	and the drop-in is removed once no options are set.
+	"""
+
+	RESET_DIRECTIVES = ('CPUAffinity', 'NUMAMask')
+	"""
+	:type tuple<str>:
+	Directives which systemd merges across the unit and its drop-ins instead of overriding,
+	written after an empty assignment which clears the values set before this drop-in
+	"""
+
+	def __init__(self, group_name: str, path: str):
+		super().__init__(group_name)
+		self.path = path
+		self.values = {}
+		"""
+		:type dict<str, dict<str, str>>
+		Directives set in the drop-in, keyed by section
+		"""
+
+	@classmethod
+	def dropin_path(cls, unit_dir: str, unit: str, name: str) -> str:
+		"""
+		Get the path of a drop-in of a service unit
+
+		:param unit_dir: Directory of the unit files, (ie: /etc/systemd/system)
+		:param unit: Service name, (with or without .service)
+		:param name: Name of the drop-in, (drop-ins are applied in alphabetical order)
+		:return:
+		"""
+		if not unit.endswith('.service'):
+			unit += '.service'
+		return os.path.join(unit_dir, unit + '.d', name + '.conf')
+
+	def get_value(self, name: str) -> Union[str, int, bool]:
+		"""
+		Get a configuration option from the config
+
+		:param name: Name of the option
+		:return:
+		"""
+		if name not in self.options:
+			print('Invalid option: %s, not present in %s configuration!' % (name, os.path.basename(self.path)), file=sys.stderr)
+			return ''
+
+		section = self.options[name][0]
+		key = self.options[name][1]
+		default = self.options[name][2]
+		val_type = self.options[name][3]
+		val = self.values.get(section, {}).get(key, default)
+		return BaseConfig.convert_to_system_type(val, val_type)
+
+	def set_value(self, name: str, value: Union[str, int, bool]):
+		"""
+		Set a configuration option in the config, (an empty value removes the directive)
+
+		:param name: Name of the option
+		:param value: Value to save
+		:return:
+		"""
+		if name not in self.options:
+			print('Invalid option: %s, not present in %s configuration!' % (name, os.path.basename(self.path)), file=sys.stderr)
+			return
+
+		section = self.options[name][0]
+		key = self.options[name][1]
+		val_type = self.options[name][3]
+		str_value = BaseConfig.convert_from_system_type(value, val_type).strip()
+
+		if str_value == '':
+			self.values.get(section, {}).pop(key, None)
+		else:
+			self.values.setdefault(section, {})[key] = str_value
+
+	def has_value(self, name: str) -> bool:
+		"""
+		Check if a configuration option has been set
+
+		:param name: Name of the option
+		:return:
+		"""
+		if name not in self.options:
+			return False
+
+		section = self.options[name][0]
+		key = self.options[name][1]
+		return self.values.get(section, {}).get(key, '') != ''
+
+	def exists(self) -> bool:
+		"""
+		Check if the drop-in exists on disk
+		:return:
+		"""
+		return os.path.exists(self.path)
+
+	def load(self):
+		"""
+		Load the drop-in from disk
+		:return:
+		"""
+		self.values = {}
+		if not os.path.exists(self.path):
+			return
+
+		section = None
+		with open(self.path, 'r') as f:
+			for line in f:
+				line = line.strip()
+				if line == '' or line[0] in '#;':
+					continue
+				if line.startswith('[') and line.endswith(']'):
+					section = line[1:-1]
+				elif '=' in line and section is not None:
+					key, _, val = line.partition('=')
+					if val.strip() == '':
+						# An empty assignment resets the directive
+						self.values.get(section, {}).pop(key.strip(), None)
+					else:
+						# Repeated directives override the previous one
+						self.values.setdefault(section, {})[key.strip()] = val.strip()
+
+	def save(self):
+		"""
+		Save the drop-in back to disk, (removing it when no directives are set)
+
+		systemd needs to be reloaded for the change to be picked up.
+		:return:
+		"""
+		sections = {section: values for section, values in self.values.items() if len(values)}
+		if len(sections) == 0:
+			if os.path.exists(self.path):
+				os.remove(self.path)
+			return
+
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		with open(self.path, 'w') as f:
+			f.write('# Managed by Warlock, changes may be overwritten\n')
+			for section, values in sections.items():
+				f.write('[%s]\n' % section)
+				for key, val in values.items():
+					if key in self.RESET_DIRECTIVES:
+						f.write('%s=\n' % key)
+					f.write('%s=%s\n' % (key, val))
@@ -0,0 +1,63 @@
+"""
+Compare the per-call latency of the systemd backends
+
+Usage: python3 tests/bench_systemd_backend.py [iterations] [unit ...]
+
+Against the real system bus when available, otherwise against the fake bus used by the tests.
+The systemctl backend is only measured when systemd is running on this host.
+"""
+import os
+import sys
+import time
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+sys.path.insert(0, here)
+
+from scriptlets.warlock.dbus_client import DBusConnection
+from scriptlets.warlock.systemd_backend import DBusBackend, SystemctlBackend
+from fake_systemd_bus import FakeSystemdBus
+
+
+def bench(name: str, func, iterations: int):
+	# Warm up the connection / page cache before timing
+	func()
+	start = time.perf_counter()
+	for _ in range(iterations):
+		func()
+	elapsed = time.perf_counter() - start
+	print('%-32s %8.3f ms/call  (%d calls)' % (name, elapsed / iterations * 1000, iterations))
+
+
+def main():
+	iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	units = sys.argv[2:] or ['dbus.service', 'systemd-journald.service', 'cron.service', 'ssh.service']
+	have_systemd = os.path.exists('/run/systemd/system')
+
+	bus = None
+	if os.path.exists(DBusConnection.SYSTEM_BUS_PATH) and have_systemd:
+		print('Using the system bus at %s' % DBusConnection.SYSTEM_BUS_PATH)
+		dbus = DBusBackend()
+	else:
+		print('System bus not available, using the fake bus')
+		bus = FakeSystemdBus()
+		for unit in units:
+			bus.add_unit(unit if unit.endswith('.service') else unit + '.service', ActiveState='active')
+		dbus = DBusBackend(bus.path)
+
+	print('Querying %d units' % len(units))
+	bench('D-Bus get_states (batch)', lambda: dbus.get_states(units), iterations)
+	bench('D-Bus get_states (1 unit)', lambda: dbus.get_states(units[:1]), iterations)
+
+	if have_systemd:
+		systemctl = SystemctlBackend()
+		bench('systemctl get_states (batch)', lambda: systemctl.get_states(units), max(1, iterations // 10))
+		bench('systemctl get_states (1 unit)', lambda: systemctl.get_states(units[:1]), max(1, iterations // 10))
+	else:
+		print('systemd is not running on this host, skipping the systemctl backend')
+
+	if bus is not None:
+		bus.close()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,41 @@
+"""
+Stand-in for journalctl which serves `-o json` entries from a fixture file
+
+The fixture is a JSON list of entries, (dicts of journal fields including __CURSOR),
+read from the path in FAKE_JOURNAL.  The arguments of each call are appended to FAKE_JOURNAL + '.args'.
+"""
+import json
+import os
+import sys
+
+
+def main():
+	path = os.environ['FAKE_JOURNAL']
+	args = sys.argv[1:]
+	with open(path + '.args', 'a') as f:
+		f.write(json.dumps(args) + '\n')
+	with open(path, 'r') as f:
+		entries = json.load(f)
+
+	# Field matches, (positional FIELD=value arguments)
+	matches = [a for i, a in enumerate(args) if '=' in a and not a.startswith('-') and args[i - 1] not in ('--since', '--until', '--after-cursor')]
+	for match in matches:
+		field, value = match.split('=', 1)
+		entries = [e for e in entries if e.get(field) == value]
+
+	if '--after-cursor' in args:
+		cursor = args[args.index('--after-cursor') + 1]
+		cursors = [e['__CURSOR'] for e in entries]
+		if cursor not in cursors:
+			print('Failed to seek to cursor: Invalid argument', file=sys.stderr)
+			sys.exit(1)
+		entries = entries[cursors.index(cursor) + 1:]
+	if '-n' in args:
+		entries = entries[-int(args[args.index('-n') + 1]):]
+
+	for entry in entries:
+		print(json.dumps(entry))
+
+
+if __name__ == '__main__':
+	main()
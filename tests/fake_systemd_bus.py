@@ -0,0 +1,185 @@
+import os
+import socket
+import tempfile
+import threading
+
+from scriptlets.warlock.dbus_client import DBusMessage
+from scriptlets.warlock.systemd_backend import DBusBackend
+
+
+class FakeSystemdBus:
+	"""
+	Stand-in for the system bus and systemd, serving just enough of org.freedesktop.systemd1 for DBusBackend
+
+	Units are stored as a dictionary of D-Bus properties keyed by unit ID.
+	"""
+
+	UNIT_PROPERTIES = {
+		'Id': 's',
+		'LoadState': 's',
+		'ActiveState': 's',
+		'SubState': 's',
+		'UnitFileState': 's',
+		'ActiveEnterTimestamp': 't',
+		'InactiveEnterTimestamp': 't',
+	}
+
+	SERVICE_PROPERTIES = {
+		'MainPID': 'u',
+		'ExecMainPID': 'u',
+		'ExecMainCode': 'i',
+		'ExecMainStatus': 'i',
+		'ExecMainStartTimestamp': 't',
+		'ExecMainExitTimestamp': 't',
+		'NRestarts': 'u',
+		'ExecStartPre': 'a(sasbttttuii)',
+		'ExecStart': 'a(sasbttttuii)',
+		'ControlGroup': 's',
+	}
+
+	def __init__(self):
+		self.units = {}
+		self.calls = []
+		"""
+		:type list<tuple>:
+		Log of (interface, member, body) for every method call received
+		"""
+		self._dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self._dir.name, 'system_bus_socket')
+		self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self._server.bind(self.path)
+		self._server.listen(8)
+		self._clients = []
+		self._thread = threading.Thread(target=self._accept, daemon=True)
+		self._thread.start()
+
+	def add_unit(self, unit: str, **props):
+		state = {
+			'Id': unit,
+			'LoadState': 'loaded',
+			'ActiveState': 'inactive',
+			'SubState': 'dead',
+			'UnitFileState': 'enabled',
+			'ActiveEnterTimestamp': 0,
+			'InactiveEnterTimestamp': 0,
+			'MainPID': 0,
+			'ExecMainPID': 0,
+			'ExecMainCode': 0,
+			'ExecMainStatus': 0,
+			'ExecMainStartTimestamp': 0,
+			'ExecMainExitTimestamp': 0,
+			'NRestarts': 0,
+			'ExecStartPre': [],
+			'ExecStart': [],
+			'ControlGroup': '/system.slice/%s' % unit,
+		}
+		state.update(props)
+		self.units[unit] = state
+
+	def close(self):
+		self._server.close()
+		for client in self._clients:
+			client.close()
+		self._dir.cleanup()
+
+	def emit_signal(self, path: str, interface: str, member: str, signature: str, body: list):
+		"""
+		Broadcast a signal to all connected clients
+
+		:return:
+		"""
+		msg = DBusMessage(DBusMessage.SIGNAL, {
+			DBusMessage.FIELD_PATH: path,
+			DBusMessage.FIELD_INTERFACE: interface,
+			DBusMessage.FIELD_MEMBER: member,
+		}, signature, body)
+		for client in self._clients:
+			try:
+				client.sendall(msg.encode())
+			except OSError:
+				pass
+
+	def _accept(self):
+		while True:
+			try:
+				client, _ = self._server.accept()
+			except OSError:
+				return
+			self._clients.append(client)
+			threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+	def _serve(self, client: socket.socket):
+		buffer = b''
+		try:
+			while b'BEGIN\r\n' not in buffer:
+				chunk = client.recv(4096)
+				if not chunk:
+					return
+				buffer += chunk
+				if b'AUTH EXTERNAL' in buffer and b'OK' not in buffer:
+					client.sendall(b'OK 0123456789abcdef0123456789abcdef\r\n')
+					buffer += b'OK'
+			buffer = buffer.split(b'BEGIN\r\n', 1)[1]
+
+			while True:
+				length = DBusMessage.message_length(buffer)
+				if length is None or len(buffer) < length:
+					chunk = client.recv(65536)
+					if not chunk:
+						return
+					buffer += chunk
+					continue
+				msg = DBusMessage.decode(buffer[:length])
+				buffer = buffer[length:]
+				client.sendall(self._handle(msg).encode())
+		except OSError:
+			return
+
+	def _reply(self, msg: DBusMessage, signature: str = '', body: list = None) -> DBusMessage:
+		return DBusMessage(DBusMessage.METHOD_RETURN, {DBusMessage.FIELD_REPLY_SERIAL: msg.serial}, signature, body)
+
+	def _error(self, msg: DBusMessage, name: str, text: str) -> DBusMessage:
+		return DBusMessage(DBusMessage.ERROR, {
+			DBusMessage.FIELD_REPLY_SERIAL: msg.serial,
+			DBusMessage.FIELD_ERROR_NAME: name,
+		}, 's', [text])
+
+	def _unit_for_path(self, path: str):
+		for unit in self.units:
+			if DBusBackend.unit_path(unit) == path:
+				return unit
+		return None
+
+	def _handle(self, msg: DBusMessage) -> DBusMessage:
+		self.calls.append((msg.interface, msg.member, msg.body))
+
+		if msg.interface == 'org.freedesktop.DBus':
+			if msg.member == 'Hello':
+				return self._reply(msg, 's', [':1.42'])
+			return self._reply(msg)
+
+		if msg.interface == 'org.freedesktop.DBus.Properties' and msg.member == 'GetAll':
+			unit = self._unit_for_path(msg.path)
+			if unit is None:
+				return self._error(msg, 'org.freedesktop.DBus.Error.UnknownObject', 'Unknown object %s' % msg.path)
+			props = self.UNIT_PROPERTIES if msg.body[0] == DBusBackend.UNIT_INTERFACE else self.SERVICE_PROPERTIES
+			return self._reply(msg, 'a{sv}', [{key: (sig, self.units[unit][key]) for key, sig in props.items()}])
+
+		if msg.interface == DBusBackend.MANAGER_INTERFACE:
+			if msg.member in ('StartUnit', 'StopUnit', 'RestartUnit'):
+				unit = msg.body[0]
+				if unit not in self.units:
+					return self._error(msg, 'org.freedesktop.systemd1.NoSuchUnit', 'Unit %s not found.' % unit)
+				self.units[unit]['ActiveState'] = 'inactive' if msg.member == 'StopUnit' else 'active'
+				return self._reply(msg, 'o', ['/org/freedesktop/systemd1/job/%s' % len(self.calls)])
+			if msg.member == 'EnableUnitFiles':
+				for unit in msg.body[0]:
+					self.units[unit]['UnitFileState'] = 'enabled'
+				return self._reply(msg, 'ba(sss)', [True, []])
+			if msg.member == 'DisableUnitFiles':
+				for unit in msg.body[0]:
+					self.units[unit]['UnitFileState'] = 'disabled'
+				return self._reply(msg, 'a(sss)', [[]])
+			return self._reply(msg)
+
+		return self._error(msg, 'org.freedesktop.DBus.Error.UnknownMethod', 'Unknown method %s' % msg.member)
@@ -0,0 +1,105 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.cgroup_stats import CgroupReader
+from scriptlets.warlock.process_sampler import ProcessSampler
+import unittest
+
+
+def write_cgroup(root: str, control_group: str, files: dict):
+	path = os.path.join(root, control_group.lstrip('/'))
+	os.makedirs(path, exist_ok=True)
+	for name, content in files.items():
+		with open(os.path.join(path, name), 'w') as f:
+			f.write(content)
+
+
+class TestCgroupReader(unittest.TestCase):
+	def test_read_unit(self):
+		with tempfile.TemporaryDirectory() as td:
+			control_group = CgroupReader.unit_control_group('ark-island')
+			self.assertEqual('/system.slice/ark-island.service', control_group)
+			write_cgroup(td, control_group, {
+				'cgroup.procs': '100\n101\n',
+				'memory.current': '8589934592\n',
+				'memory.peak': '10737418240\n',
+				'cpu.stat': 'usage_usec 5000000\nuser_usec 4000000\nsystem_usec 1000000\nnr_periods 0\nnr_throttled 0\nthrottled_usec 250\n',
+				'io.stat': '8:0 rbytes=1000 wbytes=2000 rios=1 wios=2 dbytes=0 dios=0\n259:0 rbytes=500 wbytes=0 rios=3 wios=0 dbytes=0 dios=0\n',
+				'pids.current': '57\n',
+			})
+
+			stats = CgroupReader(td).read(control_group)
+			self.assertEqual(8589934592, stats['memory_current_bytes'])
+			self.assertEqual(10737418240, stats['memory_peak_bytes'])
+			self.assertEqual(5000000, stats['cpu_usage_usec'])
+			self.assertEqual(4000000, stats['cpu_user_usec'])
+			self.assertEqual(250, stats['cpu_throttled_usec'])
+			self.assertEqual(1500, stats['io_read_bytes'])
+			self.assertEqual(2000, stats['io_write_bytes'])
+			self.assertEqual(57, stats['pids_current'])
+
+	def test_missing_files(self):
+		with tempfile.TemporaryDirectory() as td:
+			# Older kernels do not provide memory.peak
+			write_cgroup(td, '/system.slice/a.service', {'cgroup.procs': '', 'memory.current': '1024'})
+			stats = CgroupReader(td).read('/system.slice/a.service')
+			self.assertEqual(1024, stats['memory_current_bytes'])
+			self.assertIsNone(stats['memory_peak_bytes'])
+			self.assertIsNone(stats['cpu_usage_usec'])
+			self.assertIsNone(stats['io_read_bytes'])
+
+			# Unit not running, (no cgroup)
+			self.assertIsNone(CgroupReader(td).read('/system.slice/b.service'))
+
+	def test_pressure(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_cgroup(td, '/system.slice/a.service', {
+				'cgroup.procs': '100\n',
+				'cpu.pressure': 'some avg10=1.50 avg60=0.75 avg300=0.10 total=12345\nfull avg10=0.00 avg60=0.00 avg300=0.00 total=0\n',
+				'memory.pressure': 'some avg10=30.00 avg60=12.00 avg300=2.00 total=999\nfull avg10=25.00 avg60=10.00 avg300=1.00 total=888\n',
+			})
+			pressure = CgroupReader(td).read_pressure('/system.slice/a.service')
+			self.assertEqual(1.5, pressure['cpu']['some_avg10'])
+			self.assertEqual(0.75, pressure['cpu']['some_avg60'])
+			self.assertEqual(25.0, pressure['memory']['full_avg10'])
+			self.assertIsNone(pressure['io'])
+
+			# Not running, (or no PSI support)
+			self.assertIsNone(CgroupReader(td).read_pressure('/system.slice/b.service'))
+
+	def test_limits(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_cgroup(td, '/system.slice/a.service', {
+				'cgroup.procs': '100\n',
+				'memory.max': '12884901888\n',
+				'memory.high': 'max\n',
+				'cpu.max': '200000 100000\n',
+				'io.weight': 'default 500\n8:0 100\n',
+				'pids.max': 'max\n',
+			})
+			limits = CgroupReader(td).read_limits('/system.slice/a.service')
+			self.assertEqual(12884901888, limits['memory_max_bytes'])
+			self.assertIsNone(limits['memory_high_bytes'])
+			self.assertEqual(200.0, limits['cpu_quota_percent'])
+			self.assertEqual(500, limits['io_weight'])
+			self.assertIsNone(limits['pids_max'])
+
+			# Unlimited CPU
+			write_cgroup(td, '/system.slice/a.service', {'cpu.max': 'max 100000\n'})
+			self.assertIsNone(CgroupReader(td).read_limits('/system.slice/a.service')['cpu_quota_percent'])
+
+			self.assertIsNone(CgroupReader(td).read_limits('/system.slice/b.service'))
+
+	def test_counter_rate(self):
+		sampler = ProcessSampler(None, '/nonexistent')
+		self.assertIsNone(sampler.rate('cpu', 1000000, 1, 100.0))
+		self.assertEqual(500000.0, sampler.rate('cpu', 2000000, 1, 102.0))
+		# Counter belongs to a new lifetime (service restarted), so the baseline is reset
+		self.assertIsNone(sampler.rate('cpu', 100, 2, 104.0))
+
+
+if __name__ == '__main__':
+	unittest.main()
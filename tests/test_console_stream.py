@@ -0,0 +1,89 @@
+import io
+import json
+import os
+import sys
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.console_stream import ConsoleStream
+import subprocess
+import unittest
+
+
+class CountingOutput(io.BytesIO):
+	"""
+	Output which records how many times it was flushed
+	"""
+	def __init__(self):
+		super().__init__()
+		self.flushes = 0
+
+	def flush(self):
+		self.flushes += 1
+
+
+class TestConsoleStream(unittest.TestCase):
+	def test_batching(self):
+		out = CountingOutput()
+		stream = ConsoleStream(out)
+		stream.flush(10.0)
+		# Lines split across chunks are joined back together
+		stream.feed(b'first line\nsecond ', 10.0)
+		stream.feed(b'line\n' + b'x\n' * 1000, 10.01)
+		self.assertEqual(b'', out.getvalue())
+
+		# Nothing is written until the flush interval has passed
+		stream.tick(10.05)
+		self.assertEqual(0, out.flushes)
+		stream.tick(10.2)
+		self.assertEqual(1, out.flushes)
+		self.assertTrue(out.getvalue().startswith(b'first line\nsecond line\nx\n'))
+
+		# A full buffer is written immediately
+		stream.feed(b'y' * 70000 + b'\n', 10.21)
+		self.assertEqual(2, out.flushes)
+
+	def test_filters(self):
+		out = CountingOutput()
+		stream = ConsoleStream(out, 'Player|Error', 'heartbeat')
+		stream.feed(b'Player joined\ntick\nError: heartbeat missed\nError: crashed\n', 1.0)
+		stream.flush(1.0)
+		self.assertEqual(b'Player joined\nError: crashed\n', out.getvalue())
+
+	def test_rate_limit(self):
+		out = CountingOutput()
+		stream = ConsoleStream(out, max_rate=3)
+		stream.feed(b''.join(b'line %d\n' % i for i in range(10)), 5.0)
+		stream.tick(6.0)
+		stream.flush(6.0)
+		self.assertEqual(
+			b'line 0\nline 1\nline 2\n[... 7 lines dropped, over 3 lines per second ...]\n',
+			out.getvalue()
+		)
+
+	def test_prefix_units(self):
+		out = CountingOutput()
+		stream = ConsoleStream(out, prefix=True)
+		cmd = stream.build_command(['ark-island', 'ark-scorched'])
+		self.assertEqual(['-u', 'ark-island', '-u', 'ark-scorched'], cmd[cmd.index('-u'):cmd.index('-u') + 4])
+		self.assertIn('json', cmd)
+
+		stream.feed(
+			json.dumps({'_SYSTEMD_UNIT': 'ark-island.service', 'MESSAGE': 'hello'}).encode() + b'\n' +
+			json.dumps({'_SYSTEMD_UNIT': 'ark-scorched.service', 'MESSAGE': list(b'bye')}).encode() + b'\n',
+			1.0
+		)
+		stream.flush(1.0)
+		self.assertEqual(b'[ark-island] hello\n[ark-scorched] bye\n', out.getvalue())
+
+	def test_run(self):
+		out = CountingOutput()
+		proc = subprocess.Popen([sys.executable, '-c', 'print("a\\nb\\nc", end="")'], stdout=subprocess.PIPE)
+		ConsoleStream(out).run(proc)
+		proc.wait()
+		# An unterminated final line is still written
+		self.assertEqual(b'a\nb\nc\n', out.getvalue())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,125 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.cpu_placement import CpuTopology, parse_cpulist, format_cpulist
+from scriptlets.warlock.systemd_config import SystemdConfig
+import unittest
+
+
+def write_sys(root: str, nodes: dict, threads: int = 2):
+	"""
+	Populate a fake /sys/devices/system tree
+
+	:param nodes: dict of node number to its CPUs
+	:param threads: Hyperthreads per core, (siblings are CPU n and n + half of all CPUs, as on most hosts)
+	"""
+	total = sum(len(cpus) for cpus in nodes.values())
+	for node, cpus in nodes.items():
+		os.makedirs(os.path.join(root, 'node', 'node%d' % node), exist_ok=True)
+		with open(os.path.join(root, 'node', 'node%d' % node, 'cpulist'), 'w') as f:
+			f.write(format_cpulist(cpus) + '\n')
+		for cpu in cpus:
+			os.makedirs(os.path.join(root, 'cpu', 'cpu%d' % cpu, 'topology'), exist_ok=True)
+			first = cpu % (total // threads)
+			siblings = [first + i * (total // threads) for i in range(threads)]
+			with open(os.path.join(root, 'cpu', 'cpu%d' % cpu, 'topology', 'thread_siblings_list'), 'w') as f:
+				f.write(format_cpulist(siblings) + '\n')
+
+
+class TestCpuPlacement(unittest.TestCase):
+	def test_cpulist(self):
+		self.assertEqual([0, 1, 2, 3, 8, 10, 11], parse_cpulist('0-3,8,10-11\n'))
+		self.assertEqual('0-3,8,10-11', format_cpulist([11, 10, 8, 3, 2, 1, 0]))
+		self.assertEqual('', format_cpulist([]))
+
+	def test_topology(self):
+		with tempfile.TemporaryDirectory() as td:
+			# 2 nodes of 4 cores with 2 threads each, node 0 = CPUs 0-3,8-11
+			write_sys(td, {0: [0, 1, 2, 3, 8, 9, 10, 11], 1: [4, 5, 6, 7, 12, 13, 14, 15]})
+			nodes = CpuTopology(td).get_nodes()
+			self.assertEqual([[0, 8], [1, 9], [2, 10], [3, 11]], nodes[0])
+			self.assertEqual([[4, 12], [5, 13], [6, 14], [7, 15]], nodes[1])
+
+	def test_single_node_fallback(self):
+		with tempfile.TemporaryDirectory() as td:
+			os.makedirs(os.path.join(td, 'cpu'))
+			with open(os.path.join(td, 'cpu', 'online'), 'w') as f:
+				f.write('0-3\n')
+			topology = CpuTopology(td)
+			self.assertEqual({0: [[0], [1], [2], [3]]}, topology.get_nodes())
+
+			plan = topology.plan(['a', 'b', 'c'])
+			self.assertEqual('0', plan['a']['cpu_affinity'])
+			self.assertEqual('1', plan['b']['cpu_affinity'])
+			self.assertEqual('2', plan['c']['cpu_affinity'])
+			# No NUMA policy on a single node
+			self.assertIsNone(plan['a']['numa_policy'])
+
+	def test_plan_disjoint_within_nodes(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_sys(td, {0: [0, 1, 2, 3, 8, 9, 10, 11], 1: [4, 5, 6, 7, 12, 13, 14, 15]})
+			plan = CpuTopology(td).plan(['a', 'b', 'c', 'd'])
+			used = []
+			for svc in ('a', 'b', 'c', 'd'):
+				self.assertEqual(4, len(plan[svc]['cpus']))
+				self.assertEqual(1, len(plan[svc]['nodes']))
+				self.assertEqual('preferred', plan[svc]['numa_policy'])
+				self.assertEqual(str(plan[svc]['nodes'][0]), plan[svc]['numa_mask'])
+				used.extend(plan[svc]['cpus'])
+			self.assertEqual(16, len(set(used)))
+			# Hyperthread siblings stay together
+			self.assertEqual('0-1,8-9', plan['a']['cpu_affinity'])
+
+	def test_plan_with_manual_pin(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_sys(td, {0: [0, 1, 2, 3, 8, 9, 10, 11], 1: [4, 5, 6, 7, 12, 13, 14, 15]})
+			plan = CpuTopology(td).plan(['a', 'b', 'c'], {'b': '4-7,12-15'})
+			self.assertEqual('manual', plan['b']['source'])
+			self.assertEqual([1], plan['b']['nodes'])
+			# The other instances split the remaining node
+			self.assertEqual('0-1,8-9', plan['a']['cpu_affinity'])
+			self.assertEqual('2-3,10-11', plan['c']['cpu_affinity'])
+
+	def test_plan_excludes_siblings_of_manual_pin(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_sys(td, {0: [0, 1, 2, 3, 4, 5, 6, 7]})
+			# CPU 1 is pinned without its sibling 5, the whole core is kept away from the others
+			plan = CpuTopology(td).plan(['a', 'b'], {'b': '1'})
+			self.assertEqual('0,2-4,6-7', plan['a']['cpu_affinity'])
+
+	def test_dropin(self):
+		with tempfile.TemporaryDirectory() as td:
+			path = SystemdConfig.dropin_path(td, 'ark-island', 'warlock-placement')
+			self.assertEqual(os.path.join(td, 'ark-island.service.d', 'warlock-placement.conf'), path)
+
+			config = SystemdConfig('placement', path)
+			config.add_option('CPU Affinity', 'Service', 'CPUAffinity')
+			config.add_option('NUMA Policy', 'Service', 'NUMAPolicy')
+			config.set_value('CPU Affinity', '0-1,8-9')
+			config.set_value('NUMA Policy', 'preferred')
+			config.save()
+			with open(path, 'r') as f:
+				self.assertEqual(
+					'# Managed by Warlock, changes may be overwritten\n[Service]\nCPUAffinity=\nCPUAffinity=0-1,8-9\nNUMAPolicy=preferred\n',
+					f.read()
+				)
+
+			config = SystemdConfig('placement', path)
+			config.add_option('CPU Affinity', 'Service', 'CPUAffinity')
+			config.add_option('NUMA Policy', 'Service', 'NUMAPolicy')
+			config.load()
+			self.assertTrue(config.has_value('CPU Affinity'))
+			self.assertEqual('0-1,8-9', config.get_value('CPU Affinity'))
+
+			# Removing every value removes the drop-in
+			config.set_value('CPU Affinity', '')
+			config.set_value('NUMA Policy', '')
+			config.save()
+			self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+	unittest.main()
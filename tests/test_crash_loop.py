@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.crash_loop import CrashLoopTracker
+import unittest
+
+
+def state(restarts=0, code=0, status=0, exit_time=None):
+	return {
+		'NRestarts': restarts,
+		'ExecMainCode': code,
+		'ExecMainStatus': status,
+		'ExecMainExitTimestamp': exit_time,
+	}
+
+
+class TestCrashLoopTracker(unittest.TestCase):
+	def test_is_failure(self):
+		self.assertFalse(CrashLoopTracker.is_failure('exited', 0))
+		self.assertTrue(CrashLoopTracker.is_failure('exited', 1))
+		self.assertFalse(CrashLoopTracker.is_failure('killed', 15))
+		self.assertTrue(CrashLoopTracker.is_failure('killed', 9))
+		self.assertTrue(CrashLoopTracker.is_failure('dumped', 11))
+
+	def test_restarts_across_invocations(self):
+		with tempfile.TemporaryDirectory() as td:
+			state_file = os.path.join(td, 'crash.json')
+			# Restarted by systemd twice per minute
+			for i in range(4):
+				tracker = CrashLoopTracker(state_file)
+				report = tracker.observe('a', state(10 + i * 2, 1, 1, 1000 + i * 60), 1000.0 + i * 60)
+				tracker.save()
+
+			self.assertEqual(16, report['restarts'])
+			self.assertEqual(6, report['crashes_in_window'])
+			self.assertTrue(report['looping'])
+			self.assertEqual({'time': 1180, 'code': 'exited', 'status': 1}, report['exits'][-1])
+
+			# Restarts from before the window are no longer counted
+			report = CrashLoopTracker(state_file).observe('a', state(16, 1, 1, 1180), 2000.0)
+			self.assertEqual(0, report['crashes_in_window'])
+			self.assertFalse(report['looping'])
+
+	def test_clean_exits_and_manual_start(self):
+		tracker = CrashLoopTracker()
+		tracker.observe('a', state(3), 1000.0)
+		tracker.observe('a', state(3, 2, 15, 1050), 1060.0)
+		# NRestarts is reset by a manual start
+		report = tracker.observe('a', state(0), 1120.0)
+		self.assertEqual(0, report['crashes_in_window'])
+		self.assertEqual([], report['exits'])
+
+	def test_backoff_and_quarantine(self):
+		tracker = CrashLoopTracker()
+		now = 1000.0
+		for level in range(1, CrashLoopTracker.LEVEL_QUARANTINE + 1):
+			tracker.observe('a', state(0), now)
+			tracker.observe('a', state(CrashLoopTracker.MAX_CRASHES), now + 60)
+			decision = tracker.decide('a', True, now + 60)
+			self.assertEqual('stop', decision['action'])
+			report = tracker.report('a', now + 60)
+			self.assertEqual(level, report['level'])
+			if level == CrashLoopTracker.LEVEL_QUARANTINE:
+				break
+
+			self.assertEqual('backoff', report['state'])
+			self.assertEqual(now + 60 + tracker.get_backoff(level), report['until'])
+			self.assertEqual('none', tracker.decide('a', False, now + 120)['action'])
+			now = report['until']
+			self.assertEqual('start', tracker.decide('a', False, now)['action'])
+			self.assertEqual('ok', tracker.report('a', now)['state'])
+
+		self.assertEqual('quarantined', tracker.report('a', now)['state'])
+		self.assertIsNone(tracker.report('a', now)['until'])
+		self.assertEqual('none', tracker.decide('a', False, now + 86400)['action'])
+
+		# Starting it manually lifts the quarantine, and it is reset once stable
+		self.assertEqual('none', tracker.decide('a', True, now + 86400)['action'])
+		self.assertEqual('ok', tracker.report('a', now + 86400)['state'])
+		tracker.decide('a', True, now + 86400 + CrashLoopTracker.STABLE)
+		self.assertEqual(0, tracker.report('a', now + 86400 + CrashLoopTracker.STABLE)['level'])
+
+	def test_backoff_is_capped(self):
+		tracker = CrashLoopTracker()
+		self.assertEqual(CrashLoopTracker.BACKOFF, tracker.get_backoff(1))
+		self.assertEqual(CrashLoopTracker.BACKOFF * 4, tracker.get_backoff(3))
+		self.assertEqual(CrashLoopTracker.BACKOFF_MAX, tracker.get_backoff(20))
+
+
+if __name__ == '__main__':
+	unittest.main()
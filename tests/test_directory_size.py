@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.directory_size import DirectorySizeTracker
+import unittest
+
+
+def write_file(path: str, size: int):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, 'wb') as f:
+		f.write(b'x' * size)
+
+
+class TestDirectorySizeTracker(unittest.TestCase):
+	def test_incremental_scan(self):
+		with tempfile.TemporaryDirectory() as td:
+			root = os.path.join(td, 'Saves')
+			state_file = os.path.join(td, 'manifest.json')
+			write_file(os.path.join(root, 'world.sav'), 100)
+			write_file(os.path.join(root, 'Players', 'a.sav'), 10)
+			write_file(os.path.join(root, 'Players', 'b.sav'), 20)
+			write_file(os.path.join(root, 'Backups', 'old', 'world.bak'), 1000)
+
+			tracker = DirectorySizeTracker(state_file)
+			first = tracker.measure(root)
+			self.assertEqual(1130, first['bytes'])
+			self.assertEqual(4, first['files'])
+			self.assertEqual(4, first['scanned'])
+			tracker.save()
+
+			# Nothing changed, nothing is scanned, (loaded from the persisted manifest)
+			tracker = DirectorySizeTracker(state_file)
+			second = tracker.measure(root)
+			self.assertEqual(1130, second['bytes'])
+			self.assertEqual(0, second['scanned'])
+
+			# Adding a file only rescans its own directory
+			write_file(os.path.join(root, 'Players', 'c.sav'), 30)
+			os.utime(os.path.join(root, 'Players'), ns=(1, 1))
+			third = tracker.measure(root)
+			self.assertEqual(1160, third['bytes'])
+			self.assertEqual(5, third['files'])
+			self.assertEqual(1, third['scanned'])
+
+	def test_full_rescan_interval(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_file(os.path.join(td, 'world.sav'), 100)
+			tracker = DirectorySizeTracker()
+			tracker.measure(td)
+
+			# Rewritten in place, the directory mtime does not change
+			os.utime(td, ns=(1, 1))
+			tracker.measure(td)
+			write_file(os.path.join(td, 'world.sav'), 200)
+			os.utime(td, ns=(1, 1))
+			self.assertEqual(100, tracker.measure(td)['bytes'])
+
+			tracker._manifests[td]['scanned_at'] -= tracker.FULL_SCAN_INTERVAL
+			self.assertEqual(200, tracker.measure(td)['bytes'])
+
+	def test_reuse_recent_measurement(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_file(os.path.join(td, 'world.sav'), 100)
+			tracker = DirectorySizeTracker()
+			first = tracker.measure(td, 60)
+			self.assertIsNone(first['bytes_per_hour'])
+
+			# Polled again within a minute, the tree is not walked
+			write_file(os.path.join(td, 'other.sav'), 3600)
+			self.assertEqual(first, tracker.measure(td, 60))
+
+			# Growth is measured against the previous measurement
+			tracker._manifests[td]['result']['measured_at'] -= 3600
+			second = tracker.measure(td, 60)
+			self.assertEqual(3700, second['bytes'])
+			self.assertEqual(3600, second['bytes_per_hour'])
+
+	def test_missing_directory(self):
+		tracker = DirectorySizeTracker()
+		self.assertIsNone(tracker.measure('/nonexistent/warlock/saves'))
+
+
+if __name__ == '__main__':
+	unittest.main()
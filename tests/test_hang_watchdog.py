@@ -0,0 +1,116 @@
+import json
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.hang_watchdog import HangWatchdog
+import unittest
+
+
+class FakeGame:
+	def __init__(self, cache_dir: str):
+		self.cache_dir = cache_dir
+
+	def get_cache_path(self, filename: str) -> str:
+		return os.path.join(self.cache_dir, filename)
+
+
+class FakeService:
+	"""
+	Stand-in for a BaseService with a settable probe result
+	"""
+	def __init__(self, game, responsive):
+		self.service = 'game-1'
+		self.game = game
+		self.responsive = responsive
+		self.running = True
+		self.start_time = 1000
+		self.restarts = 0
+
+	def invalidate_state(self):
+		pass
+
+	def is_running(self) -> bool:
+		return self.running
+
+	def is_responsive(self, timeout: float):
+		return self.responsive
+
+	def get_start_time(self) -> int:
+		return self.start_time
+
+	def get_game_pid(self) -> int:
+		return os.getpid()
+
+	def get_log_entries(self, lines: int = 0) -> dict:
+		return {'entries': [{'message': 'Tick took 120.0s'}], 'cursor': None, 'error': None}
+
+	def restart(self, progress: bool = True) -> dict:
+		self.restarts += 1
+		self.start_time += 5000
+		return {'service': self.service, 'status': 'ready', 'seconds': 0.0, 'exit_status': 0}
+
+
+class TestHangWatchdog(unittest.TestCase):
+	def test_consecutive_failures(self):
+		svc = FakeService(None, True)
+		watchdog = HangWatchdog(svc, 60, 3, 1)
+		self.assertEqual('healthy', watchdog.check())
+
+		svc.responsive = False
+		self.assertEqual('failing', watchdog.check())
+		self.assertEqual('failing', watchdog.check())
+		# A single answer resets the count
+		svc.responsive = True
+		self.assertEqual('healthy', watchdog.check())
+		svc.responsive = False
+		self.assertEqual('failing', watchdog.check())
+		self.assertEqual('failing', watchdog.check())
+		self.assertEqual('hung', watchdog.check())
+
+	def test_startup_grace(self):
+		svc = FakeService(None, False)
+		watchdog = HangWatchdog(svc, 60, 1, 1)
+		# Still loading, has not answered since it started
+		self.assertEqual('starting', watchdog.check())
+		# A process which never answered is never counted as failing
+		self.assertEqual('starting', watchdog.check())
+		self.assertEqual(0, watchdog.failed)
+
+		svc.responsive = True
+		self.assertEqual('healthy', watchdog.check())
+		svc.responsive = False
+		self.assertEqual('hung', watchdog.check())
+
+		svc.responsive = None
+		self.assertEqual('skipped', watchdog.check())
+		svc.running = False
+		self.assertEqual('skipped', watchdog.check())
+
+	def test_recover(self):
+		with tempfile.TemporaryDirectory() as td:
+			svc = FakeService(FakeGame(td), True)
+			watchdog = HangWatchdog(svc, 60, 1, 1)
+			self.assertEqual('healthy', watchdog.check())
+			svc.responsive = False
+			self.assertEqual('hung', watchdog.check())
+			watchdog.recover()
+			self.assertEqual(1, svc.restarts)
+			self.assertEqual(0, watchdog.failed)
+
+			files = os.listdir(td)
+			self.assertEqual(1, len(files))
+			with open(os.path.join(td, files[0]), 'r') as f:
+				diagnostics = json.load(f)
+			self.assertEqual('game-1', diagnostics['service'])
+			self.assertIn(os.getpid(), [t['tid'] for t in diagnostics['threads']])
+			self.assertEqual('Tick took 120.0s', diagnostics['logs']['entries'][0]['message'])
+
+			# The restarted server is not counted until it answers again
+			self.assertEqual('starting', watchdog.check())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,170 @@
+import os
+import sys
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.hibernation import WakeListener, Hibernator
+import socket
+import threading
+import unittest
+
+
+def free_port(kind: int) -> int:
+	with socket.socket(socket.AF_INET, kind) as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+
+class FakeService:
+	"""
+	Stand-in for a BaseService with a settable player count
+	"""
+	def __init__(self, service: str, ports: list):
+		self.service = service
+		self.ports = ports
+		self.running = True
+		self.players = 0
+		self.started = threading.Event()
+		self.stopped = threading.Event()
+
+	def get_player_count(self):
+		return self.players
+
+	def get_ports(self) -> list:
+		return [{'value': port, 'config': None, 'protocol': protocol, 'description': ''} for port, protocol in self.ports]
+
+	def is_running(self) -> bool:
+		return self.running
+
+	def is_active(self) -> bool:
+		return self.running
+
+	def stop(self) -> dict:
+		self.running = False
+		self.stopped.set()
+		return {'service': self.service, 'status': 'stopped', 'seconds': 0.0, 'exit_code': 'exited', 'exit_status': 0}
+
+	def start(self) -> dict:
+		# The game can only bind once the listener released its ports
+		for port, protocol in self.ports:
+			with socket.socket(socket.AF_INET, socket.SOCK_STREAM if protocol == 'TCP' else socket.SOCK_DGRAM) as sock:
+				sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+				sock.bind(('', port))
+		self.running = True
+		self.started.set()
+		return {'service': self.service, 'status': 'ready', 'seconds': 0.0, 'exit_status': 0}
+
+
+class TestWakeListener(unittest.TestCase):
+	def test_udp(self):
+		port = free_port(socket.SOCK_DGRAM)
+		listener = WakeListener([(port, 'UDP')], '127.0.0.1')
+		listener.open()
+		try:
+			self.assertIsNone(listener.wait(0.05))
+			with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+				client.sendto(b'\xff\xff\xff\xffTSource Engine Query\x00', ('127.0.0.1', port))
+			event = listener.wait(5)
+			self.assertEqual({'port': port, 'protocol': 'UDP', 'address': '127.0.0.1'}, event)
+		finally:
+			listener.close()
+
+	def test_tcp(self):
+		port = free_port(socket.SOCK_STREAM)
+		listener = WakeListener([(port, 'tcp')], '127.0.0.1')
+		listener.open()
+		try:
+			with socket.create_connection(('127.0.0.1', port), timeout=5):
+				event = listener.wait(5)
+			self.assertEqual('TCP', event['protocol'])
+			self.assertEqual(port, event['port'])
+		finally:
+			listener.close()
+
+	def test_port_in_use(self):
+		with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as game:
+			game.bind(('127.0.0.1', 0))
+			port = game.getsockname()[1]
+			listener = WakeListener([(free_port(socket.SOCK_STREAM), 'TCP'), (port, 'UDP')], '127.0.0.1')
+			with self.assertRaises(OSError):
+				listener.open()
+			# Nothing is left bound
+			self.assertIsNone(listener.wait(0))
+
+
+class TestHibernator(unittest.TestCase):
+	def test_idle(self):
+		svc = FakeService('a', [])
+		hibernator = Hibernator(svc, 10)
+		self.assertFalse(hibernator.check_idle(1000.0))
+		self.assertFalse(hibernator.check_idle(1000.0 + 599))
+		self.assertTrue(hibernator.check_idle(1000.0 + 600))
+
+		# A player joining resets the timer, as does an unknown count
+		svc.players = 1
+		self.assertFalse(hibernator.check_idle(2000.0))
+		svc.players = 0
+		self.assertFalse(hibernator.check_idle(2001.0))
+		svc.players = None
+		self.assertFalse(hibernator.check_idle(3000.0))
+		self.assertIsNone(hibernator.idle_since)
+
+	def test_hibernate_and_wake(self):
+		port = free_port(socket.SOCK_DGRAM)
+		svc = FakeService('a', [(port, 'UDP')])
+		hibernator = Hibernator(svc, 0)
+		hibernator.check_interval = 0.05
+		hibernator.poll_interval = 0.05
+		stop_event = threading.Event()
+		thread = threading.Thread(target=hibernator.run, args=(stop_event, ))
+		thread.start()
+		try:
+			self.assertTrue(svc.stopped.wait(5))
+			# Players on the way, so it is not hibernated again straight away
+			svc.players = 1
+			# Keep knocking until the listener is up
+			while not svc.started.is_set():
+				with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+					client.sendto(b'hello', ('127.0.0.1', port))
+				svc.started.wait(0.1)
+			self.assertTrue(svc.running)
+			self.assertFalse(hibernator.hibernating)
+		finally:
+			stop_event.set()
+			thread.join(5)
+
+	def test_started_elsewhere(self):
+		port = free_port(socket.SOCK_DGRAM)
+		svc = FakeService('a', [(port, 'UDP')])
+		svc.running = False
+		svc.players = 1
+		hibernator = Hibernator(svc, 0)
+		hibernator.hibernating = True
+		hibernator.poll_interval = 0.05
+		hibernator.check_interval = 0.05
+		stop_event = threading.Event()
+		thread = threading.Thread(target=hibernator.run, args=(stop_event, ))
+		thread.start()
+		try:
+			# Wait for the listener to hold the port
+			while True:
+				try:
+					with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+						sock.bind(('', port))
+				except OSError:
+					break
+				stop_event.wait(0.05)
+
+			# Started by the operator, the port is released for the game
+			svc.running = True
+			while hibernator.hibernating:
+				stop_event.wait(0.05)
+			with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+				sock.bind(('', port))
+			self.assertFalse(svc.started.is_set())
+		finally:
+			stop_event.set()
+			thread.join(5)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.host_stats import HostStatsReader
+from scriptlets.warlock.process_sampler import ProcessSampler
+import unittest
+
+
+def write_host(root: str, user: int, idle: int, rx_bytes: int, uptime: float):
+	"""
+	Populate a fake /proc tree with host-wide counters
+	"""
+	os.makedirs(os.path.join(root, 'net'), exist_ok=True)
+	with open(os.path.join(root, 'uptime'), 'w') as f:
+		f.write('%.2f 12345.00\n' % uptime)
+	with open(os.path.join(root, 'loadavg'), 'w') as f:
+		f.write('1.50 1.00 0.50 2/300 4000\n')
+	with open(os.path.join(root, 'meminfo'), 'w') as f:
+		f.write('MemTotal:       16384000 kB\nMemAvailable:    8192000 kB\nHugePages_Total:       0\n')
+	with open(os.path.join(root, 'stat'), 'w') as f:
+		f.write(
+			'cpu  %d 0 500 %d 100 0 0 0 0 0\n'
+			'cpu0 500 0 250 %d 50 0 0 0 0 0\n'
+			'ctxt 123456\nbtime 1700000000\nprocs_running 3\nprocs_blocked 1\n' % (user, idle, idle // 2)
+		)
+	with open(os.path.join(root, 'net', 'dev'), 'w') as f:
+		f.write(
+			'Inter-|   Receive                                                |  Transmit\n'
+			' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n'
+			'    lo:     100       1    0    0    0     0          0         0      100       1    0    0    0     0       0          0\n'
+			'  eth0: %d    2000    1    2    0     0          0         0   500000    1500    0    3    0     0       0          0\n' % rx_bytes
+		)
+
+
+class TestHostStatsReader(unittest.TestCase):
+	def test_collect(self):
+		with tempfile.TemporaryDirectory() as td:
+			ticks = os.sysconf('SC_CLK_TCK')
+			host = HostStatsReader(td)
+			host.cpu_count = 2
+			sampler = ProcessSampler(None, td)
+
+			write_host(td, 1000, 10000, 1000000, 500.0)
+			first = host.collect(td, sampler)
+			self.assertEqual(2, first['cpu_count'])
+			self.assertEqual(1.5, first['loadavg']['load1'])
+			self.assertEqual(8192000 * 1024, first['memory']['MemAvailable'])
+			self.assertEqual(0, first['memory']['HugePages_Total'])
+			self.assertEqual(10000, first['cpu']['idle'])
+			self.assertEqual(3, first['cpu']['procs_running'])
+			self.assertIsNone(first['cpu']['busy_percent'])
+			self.assertEqual(1000000, first['network']['eth0']['rx_bytes'])
+			self.assertEqual(3, first['network']['eth0']['tx_drop'])
+			self.assertIn('lo', first['network'])
+			self.assertEqual(td, first['disk']['path'])
+			self.assertGreater(first['disk']['total_bytes'], 0)
+
+			# 2 seconds later, one of the two CPUs was busy the whole time
+			write_host(td, 1000 + 2 * ticks, 10000 + 2 * ticks, 1200000, 502.0)
+			second = host.collect(td, sampler)
+			self.assertEqual(50.0, second['cpu']['busy_percent'])
+			self.assertEqual(0.0, second['cpu']['iowait_percent'])
+			self.assertEqual(100000.0, second['network']['eth0']['rx_bytes_per_sec'])
+
+	def test_missing(self):
+		host = HostStatsReader('/nonexistent/warlock/proc')
+		result = host.collect('/nonexistent/warlock/install')
+		self.assertIsNone(result['cpu'])
+		self.assertIsNone(result['network'])
+		self.assertIsNone(result['disk'])
+
+
+if __name__ == '__main__':
+	unittest.main()
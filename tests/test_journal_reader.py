@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.journal_reader import JournalError, JournalReader
+import unittest
+
+
+def journal_entry(n: int, message) -> dict:
+	return {
+		'__CURSOR': 's=abc;i=%x' % n,
+		'__REALTIME_TIMESTAMP': str(1700000000000000 + n * 1000000),
+		'MESSAGE': message,
+		'PRIORITY': '6',
+		'_PID': '4242',
+	}
+
+
+class TestJournalReader(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.journal = os.path.join(self.dir.name, 'journal.json')
+		script = os.path.join(self.dir.name, 'journalctl')
+		with open(script, 'w') as f:
+			f.write('#!/bin/sh\nexec "%s" "%s" "$@"\n' % (sys.executable, os.path.join(here, 'fake_journalctl.py')))
+		os.chmod(script, 0o755)
+		os.environ['FAKE_JOURNAL'] = self.journal
+		self.reader = JournalReader(script)
+		self.write_journal([journal_entry(i, 'line %d' % i) for i in range(1, 6)])
+
+	def tearDown(self):
+		del os.environ['FAKE_JOURNAL']
+		self.dir.cleanup()
+
+	def write_journal(self, entries: list):
+		with open(self.journal, 'w') as f:
+			json.dump(entries, f)
+
+	def test_parse_entry(self):
+		# Messages which are not valid UTF-8 are encoded as arrays of bytes
+		entry = JournalReader.parse_entry(json.dumps(journal_entry(1, list(b'caf\xc3\xa9 \xff'))))
+		self.assertEqual('café �', entry['message'])
+		self.assertEqual(1700000001.0, entry['timestamp'])
+		self.assertEqual(6, entry['priority'])
+		self.assertEqual(4242, entry['pid'])
+		self.assertIsNone(JournalReader.parse_entry('-- No entries --'))
+
+	def test_incremental(self):
+		result = self.reader.read('ark-island', lines=2)
+		self.assertEqual(['line 4', 'line 5'], [e['message'] for e in result['entries']])
+		self.assertEqual('s=abc;i=5', result['cursor'])
+
+		# Nothing new, the cursor stays where it was
+		result = self.reader.read('ark-island', result['cursor'])
+		self.assertEqual([], result['entries'])
+		self.assertEqual('s=abc;i=5', result['cursor'])
+		self.assertIsNone(result['error'])
+
+		self.write_journal([journal_entry(i, 'line %d' % i) for i in range(1, 8)])
+		result = self.reader.read('ark-island', result['cursor'])
+		self.assertEqual(['line 6', 'line 7'], [e['message'] for e in result['entries']])
+
+		with open(self.journal + '.args', 'r') as f:
+			args = json.loads(f.readlines()[-1])
+		self.assertEqual(['--after-cursor', 's=abc;i=5'], args[args.index('--after-cursor'):args.index('--after-cursor') + 2])
+		self.assertIn('-u', args)
+
+	def test_max_bytes(self):
+		result = self.reader.read('ark-island', 's=abc;i=1', max_bytes=13)
+		self.assertEqual(['line 2', 'line 3'], [e['message'] for e in result['entries']])
+		self.assertTrue(result['truncated'])
+
+		result = self.reader.read('ark-island', result['cursor'], max_bytes=13)
+		self.assertEqual(['line 4', 'line 5'], [e['message'] for e in result['entries']])
+		self.assertFalse(result['truncated'])
+
+	def test_invalid_cursor(self):
+		result = self.reader.read('ark-island', 'bogus')
+		self.assertEqual([], result['entries'])
+		self.assertIn('Failed to seek to cursor', result['error'])
+
+
+	def test_search(self):
+		entries = [journal_entry(i, 'tick %d' % i) for i in range(1, 11)]
+		entries[3]['MESSAGE'] = 'Player Alice joined'
+		entries[7]['MESSAGE'] = 'player Bob joined'
+		entries[7]['PRIORITY'] = '4'
+		self.write_journal(entries)
+
+		found = list(self.reader.search('ark-island', r'player \w+ joined', ignore_case=True, context=1))
+		self.assertEqual(
+			[('tick 3', False), ('Player Alice joined', True), ('tick 5', False), ('tick 7', False), ('player Bob joined', True), ('tick 9', False)],
+			[(e['message'], e['match']) for e in found]
+		)
+
+		# Stops reading once the limit is reached
+		found = list(self.reader.search('ark-island', 'joined', limit=1))
+		self.assertEqual(['Player Alice joined'], [e['message'] for e in found])
+
+		# Field matches are passed to journald
+		found = list(self.reader.search('ark-island', matches=['PRIORITY=4']))
+		self.assertEqual(['player Bob joined'], [e['message'] for e in found])
+
+	def test_search_error(self):
+		with self.assertRaises(JournalError):
+			list(JournalReader(os.path.join(self.dir.name, 'missing-journalctl')).search('ark-island', 'x'))
+
+
+if __name__ == '__main__':
+	unittest.main()
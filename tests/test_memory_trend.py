@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.memory_trend import MemoryTrend, MemoryRestartPolicy
+import unittest
+
+GB = 1024 * 1024 * 1024
+
+
+class TestMemoryTrend(unittest.TestCase):
+	def test_fit_across_invocations(self):
+		with tempfile.TemporaryDirectory() as td:
+			state_file = os.path.join(td, 'trend.json')
+			# 100 MB per hour, sampled every 5 minutes for an hour
+			for i in range(13):
+				trend = MemoryTrend(state_file)
+				trend.record('a', 1234, 4 * GB + i * 100 * 1024 * 1024 // 12, 1000.0 + i * 300)
+				trend.save()
+
+			fit = MemoryTrend(state_file).fit('a')
+			self.assertEqual(13, fit['samples'])
+			self.assertEqual(3600.0, fit['span_seconds'])
+			self.assertAlmostEqual(100 * 1024 * 1024, fit['bytes_per_hour'], delta=1024)
+			self.assertGreater(fit['r2'], 0.99)
+
+			# 400 MB more takes 4 hours
+			self.assertAlmostEqual(4 * 3600, MemoryTrend.seconds_until(fit, fit['rss_bytes'] + 400 * 1024 * 1024), delta=10)
+			self.assertEqual(0, MemoryTrend.seconds_until(fit, GB))
+
+	def test_pending_restart(self):
+		with tempfile.TemporaryDirectory() as td:
+			state_file = os.path.join(td, 'trend.json')
+			first = MemoryTrend(state_file)
+			first.record('a', 1234, GB, 1000.0)
+			first.save()
+			first.set_pending_restart('a', 1000.0)
+
+			# Seen by the next invocation while this process is alive
+			self.assertTrue(MemoryTrend(state_file).has_pending_restart('a', 1060.0))
+			self.assertFalse(MemoryTrend(state_file).has_pending_restart('a', 1000.0 + MemoryTrend.PENDING_MAX_AGE))
+
+			# Samples added meanwhile are kept when it is cleared
+			second = MemoryTrend(state_file)
+			second.record('a', 1234, GB, 1060.0)
+			second.save()
+			first.clear_pending_restart('a')
+			third = MemoryTrend(state_file)
+			self.assertFalse(third.has_pending_restart('a', 1120.0))
+			self.assertEqual(2, len(third._history['a']['samples']))
+
+	def test_not_enough_history(self):
+		trend = MemoryTrend()
+		for i in range(10):
+			# Samples closer together than MIN_SAMPLE_INTERVAL are skipped
+			trend.record('a', 1, GB, 1000.0 + i * 10)
+		self.assertIsNone(trend.fit('a'))
+		self.assertIsNone(trend.fit('missing'))
+
+	def test_restart_resets_history(self):
+		trend = MemoryTrend()
+		for i in range(10):
+			trend.record('a', 1, GB + i * 1000, 1000.0 + i * 600)
+		self.assertIsNotNone(trend.fit('a'))
+		trend.record('a', 2, GB, 7000.0)
+		self.assertIsNone(trend.fit('a'))
+
+	def test_window(self):
+		trend = MemoryTrend()
+		for i in range(100):
+			trend.record('a', 1, GB, 1000.0 + i * 600)
+		# Only the last 6 hours are kept
+		self.assertEqual(37, trend.fit('a')['samples'])
+		self.assertEqual(0.0, trend.fit('a')['bytes_per_hour'])
+
+
+class TestMemoryRestartPolicy(unittest.TestCase):
+	def fit(self, rss: int, per_hour: int, r2: float = 1.0) -> dict:
+		return {'samples': 20, 'span_seconds': 7200.0, 'rss_bytes': rss, 'bytes_per_hour': per_hour, 'r2': r2}
+
+	def test_decide(self):
+		policy = MemoryRestartPolicy()
+		self.assertEqual('none', policy.decide(None, 10 * GB, 0)['action'])
+
+		# Not growing, or noisy
+		self.assertEqual('none', policy.decide(self.fit(8 * GB, 0), 10 * GB, 0)['action'])
+		self.assertEqual('none', policy.decide(self.fit(8 * GB, GB, 0.1), 10 * GB, 0)['action'])
+
+		# Growing, but 10 hours away
+		decision = policy.decide(self.fit(8 * GB, GB // 5), 10 * GB, 0)
+		self.assertEqual('none', decision['action'])
+		self.assertEqual(36000.0, decision['seconds_to_threshold'])
+
+		# 4 hours away, restart while empty, otherwise wait for it to empty
+		self.assertEqual('restart', policy.decide(self.fit(8 * GB, GB // 2), 10 * GB, 0)['action'])
+		self.assertEqual('wait', policy.decide(self.fit(8 * GB, GB // 2), 10 * GB, 3)['action'])
+		self.assertEqual('wait', policy.decide(self.fit(8 * GB, GB // 2), 10 * GB, None)['action'])
+
+		# An hour away with players online, warn them and restart
+		self.assertEqual('delayed_restart', policy.decide(self.fit(8 * GB, 2 * GB), 10 * GB, 3)['action'])
+
+		# Already over, even if noisy
+		self.assertEqual('restart', policy.decide(self.fit(11 * GB, 0, 0.0), 10 * GB, 0)['action'])
+		self.assertEqual('delayed_restart', policy.decide(self.fit(11 * GB, 0, 0.0), 10 * GB, 1)['action'])
+
+
+if __name__ == '__main__':
+	unittest.main()
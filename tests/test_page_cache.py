@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.host_stats import HostStatsReader
+from scriptlets.warlock.page_cache import PageCachePrewarmer
+import unittest
+
+
+def write_file(path: str, size: int):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, 'wb') as f:
+		f.write(b'x' * size)
+
+
+def write_meminfo(root: str, available_kb: int):
+	with open(os.path.join(root, 'meminfo'), 'w') as f:
+		f.write('MemTotal:       16384000 kB\nMemAvailable:   %d kB\n' % available_kb)
+
+
+class TestPageCachePrewarmer(unittest.TestCase):
+	def test_expand(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_file(os.path.join(td, 'Content', 'Paks', 'a.pak'), 10)
+			write_file(os.path.join(td, 'Content', 'Paks', 'b.pak'), 10)
+			write_file(os.path.join(td, 'Binaries', 'Server'), 10)
+			write_file(os.path.join(td, 'readme.txt'), 10)
+
+			files = PageCachePrewarmer.expand(td, ['Binaries/*', '**/*.pak', 'Content/Paks/a.pak', 'missing/*'])
+			self.assertEqual([
+				os.path.join(td, 'Binaries', 'Server'),
+				os.path.join(td, 'Content', 'Paks', 'a.pak'),
+				os.path.join(td, 'Content', 'Paks', 'b.pak'),
+			], files)
+
+	def test_memory_budget(self):
+		with tempfile.TemporaryDirectory() as td:
+			proc = os.path.join(td, 'proc')
+			os.makedirs(proc)
+			# 8 KB available, so only 4 KB may be used
+			write_meminfo(proc, 8)
+			write_file(os.path.join(td, 'files', 'a'), 3000)
+			write_file(os.path.join(td, 'files', 'b'), 2000)
+			write_file(os.path.join(td, 'files', 'c'), 1000)
+
+			prewarmer = PageCachePrewarmer(host=HostStatsReader(proc))
+			files = prewarmer.expand(os.path.join(td, 'files'), ['*']) + [os.path.join(td, 'missing')]
+			result = prewarmer.prewarm(files)
+			self.assertEqual(4096, result['budget_bytes'])
+			self.assertEqual(2, result['files'])
+			self.assertEqual(4000, result['bytes_requested'])
+			self.assertEqual([os.path.join(td, 'files', 'b'), os.path.join(td, 'missing')], result['skipped'])
+
+			# A fixed limit applies when lower
+			prewarmer = PageCachePrewarmer(1000, host=HostStatsReader(proc))
+			self.assertEqual(1000, prewarmer.get_budget())
+			self.assertEqual(1000, prewarmer.prewarm(files)['bytes_requested'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,62 @@
+import os
+import sys
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.pid_waiter import PidWaiter
+import subprocess
+import threading
+import time
+import unittest
+
+
+class TestPidWaiter(unittest.TestCase):
+	def spawn(self, seconds: float) -> subprocess.Popen:
+		proc = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(%s)' % seconds])
+		self.addCleanup(proc.kill)
+		return proc
+
+	def reap(self, proc: subprocess.Popen):
+		# Children linger as zombies until reaped, (systemd reaps the real game processes)
+		threading.Thread(target=proc.wait, daemon=True).start()
+
+	def test_wait_for_exit(self):
+		procs = [self.spawn(0.2), self.spawn(0.4)]
+		waiter = PidWaiter([p.pid for p in procs])
+		for proc in procs:
+			self.reap(proc)
+
+		started = time.monotonic()
+		self.assertTrue(waiter.wait(5))
+		self.assertLess(time.monotonic() - started, 2)
+		self.assertEqual(sorted(p.pid for p in procs), sorted(waiter.exited.keys()))
+		waiter.close()
+
+	def test_timeout(self):
+		proc = self.spawn(30)
+		waiter = PidWaiter([proc.pid])
+		started = time.monotonic()
+		self.assertFalse(waiter.wait(0.2))
+		self.assertLess(time.monotonic() - started, 2)
+		self.assertEqual({}, waiter.exited)
+		waiter.close()
+
+	def test_polling_fallback(self):
+		proc = self.spawn(0.2)
+		waiter = PidWaiter([proc.pid])
+		# Behave as a kernel without pidfd support
+		waiter.close()
+		waiter._polled = [proc.pid]
+		self.reap(proc)
+		self.assertTrue(waiter.wait(5))
+		self.assertIn(proc.pid, waiter.exited)
+
+	def test_no_process(self):
+		# Service not running, (MainPID 0)
+		waiter = PidWaiter([0])
+		self.assertTrue(waiter.wait(0))
+		self.assertEqual([], waiter.pids)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.proc_net import ProcNetReader
+import unittest
+
+
+tcp = '''  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000:6982 00000000:0000 0A 00000000:00000000 00:00000000 00000000  1000        0 21001 1 0000000000000000 100 0 0 10 0
+   1: 0100007F:1F90 0100007F:D431 01 00000000:00000000 00:00000000 00000000  1000        0 21002 1 0000000000000000 20 4 30 10 -1
+'''
+
+udp = '''   sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode ref pointer drops
+  100: 00000000:1E61 00000000:0000 07 00000200:00000400 00:00000000 00000000  1000        0 22001 2 0000000000000000 15
+'''
+
+snmp = '''Ip: Forwarding DefaultTTL InReceives
+Ip: 2 64 11789
+Udp: InDatagrams NoPorts InErrors OutDatagrams RcvbufErrors SndbufErrors InCsumErrors IgnoredMulti MemErrors
+Udp: 5000 3 120 4800 117 0 3 0 0
+'''
+
+udp6 = '''  sl  local_address                         remote_address                        st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode ref pointer drops
+  200: 00000000000000000000000000000000:1E62 00000000000000000000000000000000:0000 07 00000000:00000000 00:00000000 00000000  1000        0 22002 2 0000000000000000 0
+'''
+
+
+class TestProcNetReader(unittest.TestCase):
+	def setUp(self):
+		self.td = tempfile.TemporaryDirectory()
+		os.makedirs(os.path.join(self.td.name, 'net'))
+		for name, content in (('tcp', tcp), ('udp', udp), ('udp6', udp6), ('snmp', snmp)):
+			with open(os.path.join(self.td.name, 'net', name), 'w') as f:
+				f.write(content)
+		self.reader = ProcNetReader(self.td.name)
+
+	def tearDown(self):
+		self.td.cleanup()
+
+	def test_read_sockets(self):
+		sockets = self.reader.read_sockets('udp')
+		self.assertEqual(2, len(sockets))
+		self.assertEqual(7777, sockets[0]['port'])
+		self.assertEqual(0x200, sockets[0]['tx_queue'])
+		self.assertEqual(0x400, sockets[0]['rx_queue'])
+		self.assertEqual(22001, sockets[0]['inode'])
+		self.assertEqual(15, sockets[0]['drops'])
+		self.assertEqual(7778, sockets[1]['port'])
+
+	def test_bound_ports(self):
+		# Only listening TCP sockets count as bound, (the established connection on 8080 does not)
+		self.assertEqual({27010}, self.reader.get_bound_ports('tcp'))
+		self.assertEqual({7777, 7778}, self.reader.get_bound_ports('udp'))
+		self.assertTrue(self.reader.is_port_bound(7777))
+		self.assertTrue(self.reader.is_port_bound(27010, 'tcp'))
+		self.assertFalse(self.reader.is_port_bound(27010, 'udp'))
+		self.assertFalse(self.reader.is_port_bound(8080))
+
+
+	def test_summarise_port(self):
+		# IPv4 and IPv6 sockets on the same port are combined
+		sockets = self.reader.read_sockets('udp')
+		sockets.append(dict(sockets[0], inode=22010, rx_queue=100, drops=5))
+		stats = ProcNetReader.summarise_port(sockets, 7777)
+		self.assertEqual(2, stats['sockets'])
+		self.assertEqual(0x400 + 100, stats['rx_queue_bytes'])
+		self.assertEqual(20, stats['drops'])
+		self.assertEqual(22001, stats['inode'])
+		self.assertEqual(0, ProcNetReader.summarise_port(sockets, 9999)['sockets'])
+
+	def test_read_snmp(self):
+		counters = self.reader.read_snmp()
+		self.assertEqual(117, counters['Udp']['RcvbufErrors'])
+		self.assertEqual(5000, counters['Udp']['InDatagrams'])
+		self.assertEqual(64, counters['Ip']['DefaultTTL'])
+		self.assertEqual({}, ProcNetReader('/nonexistent').read_snmp())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,197 @@
+import json
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.process_sampler import ProcessSampler, format_bytes
+import unittest
+
+
+def write_proc(root: str, pid: int, ticks: int, start: int, rss_pages: int, pss_kb: int = None, uptime: float = 1000.0):
+	"""
+	Populate a fake /proc tree for a single process
+	"""
+	os.makedirs(os.path.join(root, str(pid)), exist_ok=True)
+	with open(os.path.join(root, 'uptime'), 'w') as f:
+		f.write('%.2f 12345.00\n' % uptime)
+	# utime and stime (fields 14 and 15) are split evenly
+	stat = '%d (Game Server (x)) S 1 %d %d 0 -1 4194560 100 0 0 0 %d %d 0 0 20 0 8 0 %d 1000000 %d' % (
+		pid, pid, pid, ticks // 2, ticks - ticks // 2, start, rss_pages
+	)
+	with open(os.path.join(root, str(pid), 'stat'), 'w') as f:
+		f.write(stat + '\n')
+	with open(os.path.join(root, str(pid), 'statm'), 'w') as f:
+		f.write('500000 %d 1000 10 0 20000 0\n' % rss_pages)
+	if pss_kb is not None:
+		with open(os.path.join(root, str(pid), 'smaps_rollup'), 'w') as f:
+			f.write('00400000-7fff00000000 ---p 00000000 00:00 0    [rollup]\nRss:  %d kB\nPss:  %d kB\n' % (rss_pages * 4, pss_kb))
+
+
+def write_thread(root: str, pid: int, tid: int, name: str, ticks: int, start: int):
+	"""
+	Populate a fake /proc/<pid>/task/<tid>/stat
+	"""
+	path = os.path.join(root, str(pid), 'task', str(tid))
+	os.makedirs(path, exist_ok=True)
+	with open(os.path.join(path, 'stat'), 'w') as f:
+		f.write('%d (%s) S 1 %d %d 0 -1 4194560 100 0 0 0 %d 0 0 0 20 0 8 0 %d 1000000 100\n' % (tid, name, pid, pid, ticks, start))
+
+
+class TestProcessSampler(unittest.TestCase):
+	def test_interval_cpu_across_invocations(self):
+		with tempfile.TemporaryDirectory() as td:
+			state_file = os.path.join(td, 'samples.json')
+			ticks = os.sysconf('SC_CLK_TCK')
+
+			# Process started 100 seconds ago and has used 10 seconds of CPU in total
+			write_proc(td, 4242, 10 * ticks, 900 * ticks, 1000, 2048, uptime=1000.0)
+			sampler = ProcessSampler(state_file, td)
+			first = sampler.sample(4242)
+			self.assertEqual(10.0, first['cpu_percent'])
+			self.assertEqual(1000 * sampler.page_size, first['rss_bytes'])
+			self.assertEqual(2048 * 1024, first['pss_bytes'])
+			sampler.save()
+
+			# 3 seconds later it used another 6 seconds of CPU, (2 cores fully busy)
+			write_proc(td, 4242, 16 * ticks, 900 * ticks, 1000, 2048, uptime=1003.0)
+			sampler = ProcessSampler(state_file, td)
+			self.assertEqual(200.0, sampler.sample(4242)['cpu_percent'])
+			sampler.save()
+
+			with open(state_file, 'r') as f:
+				self.assertEqual(16 * ticks, json.load(f)['4242']['ticks'])
+
+	def test_close_samples_repeat_previous_interval(self):
+		with tempfile.TemporaryDirectory() as td:
+			state_file = os.path.join(td, 'samples.json')
+			ticks = os.sysconf('SC_CLK_TCK')
+			write_proc(td, 4242, 10 * ticks, 900 * ticks, 1000, uptime=1000.0)
+			sampler = ProcessSampler(state_file, td)
+			sampler.sample(4242)
+			sampler.save()
+
+			write_proc(td, 4242, 16 * ticks, 900 * ticks, 1000, uptime=1003.0)
+			sampler = ProcessSampler(state_file, td)
+			self.assertEqual(200.0, sampler.sample(4242)['cpu_percent'])
+			sampler.save()
+
+			# A poll right after the previous one reports that interval, not the lifetime average
+			write_proc(td, 4242, 16 * ticks, 900 * ticks, 1000, uptime=1003.1)
+			sampler = ProcessSampler(state_file, td)
+			self.assertEqual(200.0, sampler.sample(4242)['cpu_percent'])
+
+	def test_concurrent_saves_merge(self):
+		with tempfile.TemporaryDirectory() as td:
+			state_file = os.path.join(td, 'samples.json')
+			ticks = os.sysconf('SC_CLK_TCK')
+			write_proc(td, 100, 10 * ticks, 900 * ticks, 10, uptime=1000.0)
+			write_proc(td, 200, 10 * ticks, 900 * ticks, 10, uptime=1000.0)
+
+			# Two invocations loaded the (empty) state before either saved
+			first = ProcessSampler(state_file, td)
+			second = ProcessSampler(state_file, td)
+			first.sample(100)
+			second.sample(200)
+			first.save()
+			second.save()
+
+			with open(state_file, 'r') as f:
+				self.assertEqual(['100', '200'], sorted(json.load(f).keys()))
+			self.assertEqual([], [f for f in os.listdir(td) if f.endswith('.tmp')])
+
+	def test_pid_reuse_resets_baseline(self):
+		with tempfile.TemporaryDirectory() as td:
+			ticks = os.sysconf('SC_CLK_TCK')
+			sampler = ProcessSampler(None, td)
+			write_proc(td, 100, 50 * ticks, 500 * ticks, 10, uptime=1000.0)
+			sampler.sample(100)
+
+			# Same PID, different process started 10 seconds ago using 1 second of CPU
+			write_proc(td, 100, 1 * ticks, 990 * ticks, 10, uptime=1000.5)
+			self.assertEqual(round(1 / 10.5 * 100, 2), sampler.sample(100)['cpu_percent'])
+
+	def test_thread_saturation(self):
+		with tempfile.TemporaryDirectory() as td:
+			ticks = os.sysconf('SC_CLK_TCK')
+			sampler = ProcessSampler(None, td)
+			write_proc(td, 500, 0, 100 * ticks, 10, uptime=1000.0)
+			threads = [(500, 'GameServer', 0), (501, 'GameThread', 0), (502, 'RenderThread', 0), (503, 'Pool Worker', 0)]
+			for tid, name, used in threads:
+				write_thread(td, 500, tid, name, used, 100 * ticks)
+			sampler.sample_threads(500)
+
+			# Over the next 2 seconds the game thread used a full core and a worker a quarter of one
+			write_proc(td, 500, 0, 100 * ticks, 10, uptime=1002.0)
+			write_thread(td, 500, 501, 'GameThread', 2 * ticks, 100 * ticks)
+			write_thread(td, 500, 503, 'Pool Worker', ticks // 2, 100 * ticks)
+			result = sampler.sample_threads(500, 2)
+
+			self.assertEqual(4, result['count'])
+			self.assertEqual(['GameThread', 'Pool Worker'], [t['name'] for t in result['top']])
+			self.assertEqual(100.0, result['busiest_thread_percent'])
+			self.assertEqual(0.0, result['main_thread_percent'])
+			self.assertTrue(result['saturated'])
+			self.assertIsNone(sampler.sample_threads(999999))
+
+	def test_thread_dump(self):
+		with tempfile.TemporaryDirectory() as td:
+			sampler = ProcessSampler(None, td)
+			write_proc(td, 500, 0, 100, 10)
+			write_thread(td, 500, 500, 'GameServer', 10, 100)
+			write_thread(td, 500, 501, 'GameThread', 20, 100)
+			with open(os.path.join(td, '500', 'task', '500', 'wchan'), 'w') as f:
+				f.write('0')
+			with open(os.path.join(td, '500', 'task', '501', 'wchan'), 'w') as f:
+				f.write('futex_wait_queue')
+			with open(os.path.join(td, '500', 'task', '501', 'stack'), 'w') as f:
+				f.write('[<0>] futex_wait_queue+0x69/0xa0\n[<0>] do_futex+0x106/0x1b0\n')
+
+			threads = sampler.read_threads(500)
+			self.assertEqual([500, 501], [t['tid'] for t in threads])
+			self.assertIsNone(threads[0]['wchan'])
+			self.assertIsNone(threads[0]['stack'])
+			self.assertEqual('futex_wait_queue', threads[1]['wchan'])
+			self.assertEqual(['futex_wait_queue+0x69/0xa0', 'do_futex+0x106/0x1b0'], threads[1]['stack'])
+			self.assertEqual('S', threads[1]['state'])
+			self.assertEqual(20, threads[1]['ticks'])
+			self.assertIsNone(sampler.read_threads(999999))
+
+	def test_io_rates(self):
+		with tempfile.TemporaryDirectory() as td:
+			ticks = os.sysconf('SC_CLK_TCK')
+			write_proc(td, 4242, 10 * ticks, 900 * ticks, 1000, uptime=1000.0)
+			with open(os.path.join(td, '4242', 'io'), 'w') as f:
+				f.write('rchar: 5000\nwchar: 6000\nsyscr: 10\nsyscw: 20\nread_bytes: 4096\nwrite_bytes: 8192\ncancelled_write_bytes: 0\n')
+			sampler = ProcessSampler(None, td)
+			first = sampler.sample_io(4242)
+			self.assertEqual(4096, first['read_bytes'])
+			self.assertEqual(8192, first['write_bytes'])
+			self.assertIsNone(first['write_bytes_per_sec'])
+
+			write_proc(td, 4242, 10 * ticks, 900 * ticks, 1000, uptime=1002.0)
+			with open(os.path.join(td, '4242', 'io'), 'w') as f:
+				f.write('rchar: 5000\nwchar: 6000\nread_bytes: 4096\nwrite_bytes: 28192\n')
+			second = sampler.sample_io(4242)
+			self.assertEqual(0.0, second['read_bytes_per_sec'])
+			self.assertEqual(10000.0, second['write_bytes_per_sec'])
+
+			# Not readable, (owned by another user)
+			os.remove(os.path.join(td, '4242', 'io'))
+			self.assertIsNone(sampler.sample_io(4242))
+
+	def test_missing_process(self):
+		with tempfile.TemporaryDirectory() as td:
+			sampler = ProcessSampler(None, td)
+			self.assertIsNone(sampler.sample(0))
+			self.assertIsNone(sampler.sample(999999))
+
+	def test_format_bytes(self):
+		self.assertEqual('512 MB', format_bytes(512 * 1024 * 1024))
+		self.assertEqual('1.50 GB', format_bytes(1536 * 1024 * 1024))
+		self.assertEqual('N/A', format_bytes(None))
+
+
+if __name__ == '__main__':
+	unittest.main()
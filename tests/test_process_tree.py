@@ -0,0 +1,120 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.process_tree import ProcessTree
+import unittest
+
+
+def write_process(root: str, pid: int, ppid: int, cmdline: list, rss_pages: int = 100, start: int = 5000, children=None):
+	"""
+	Populate a fake /proc entry for a single-threaded process
+
+	:param children: Child PIDs, (None to leave out the children list as kernels without CONFIG_PROC_CHILDREN do)
+	"""
+	task = os.path.join(root, str(pid), 'task', str(pid))
+	os.makedirs(task, exist_ok=True)
+	with open(os.path.join(root, str(pid), 'stat'), 'w') as f:
+		f.write('%d (%s) S %d %d %d 0 -1 4194560 100 0 0 0 10 10 0 0 20 0 1 0 %d 1000000 %d\n' % (
+			pid, os.path.basename(cmdline[0])[:15], ppid, pid, pid, start, rss_pages
+		))
+	with open(os.path.join(root, str(pid), 'statm'), 'w') as f:
+		f.write('500000 %d 1000 10 0 20000 0\n' % rss_pages)
+	with open(os.path.join(root, str(pid), 'cmdline'), 'w') as f:
+		f.write('\0'.join(cmdline) + '\0')
+	if children is not None:
+		with open(os.path.join(task, 'children'), 'w') as f:
+			f.write(' '.join(str(c) for c in children) + (' ' if children else ''))
+
+
+def write_proton_tree(root: str, children_lists: bool = True):
+	"""
+	bash wrapper (100) -> proton (101) -> [wineserver (102), ShooterGameServer.exe (103)]
+	"""
+	write_process(root, 100, 1, ['/bin/bash', '/opt/game/start.sh'], children=[101] if children_lists else None)
+	write_process(root, 101, 100, ['/usr/bin/python3', '/opt/proton/proton', 'run', 'ShooterGameServer.exe'], children=[102, 103] if children_lists else None)
+	write_process(root, 102, 101, ['/opt/proton/files/bin/wineserver'], 500, children=[] if children_lists else None)
+	write_process(root, 103, 101, ['Z:\\opt\\game\\ShooterGameServer.exe', '-server'], 900000, children=[] if children_lists else None)
+
+
+class TestProcessTree(unittest.TestCase):
+	def test_descendants(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_proton_tree(td)
+			self.assertEqual([100, 101, 102, 103], ProcessTree(None, td).get_descendants(100))
+
+	def test_descendants_without_children_lists(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_proton_tree(td, False)
+			# Falls back to scanning the parent of every process
+			self.assertEqual([100, 101, 102, 103], ProcessTree(None, td).get_descendants(100))
+
+			# Or to the unit's cgroup when available
+			procs = os.path.join(td, 'cgroup.procs')
+			with open(procs, 'w') as f:
+				f.write('101\n100\n103\n')
+			self.assertEqual([100, 101, 103], ProcessTree(None, td).get_descendants(100, procs))
+
+	def test_find_by_pattern(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_proton_tree(td)
+			tree = ProcessTree(None, td)
+			# The proton wrapper mentions the executable too, the deepest match is the server
+			self.assertEqual(103, tree.find_game_pid('ark', 100, r'ShooterGameServer\.exe'))
+			self.assertEqual(0, tree.find_game_pid('ark', 100, 'NoSuchServer'))
+			self.assertEqual(0, tree.find_game_pid('ark', 0))
+
+	def test_find_by_memory(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_proton_tree(td)
+			self.assertEqual(103, ProcessTree(None, td).find_game_pid('ark', 100))
+
+	def test_memory_ranking_settles(self):
+		with tempfile.TemporaryDirectory() as td:
+			ticks = os.sysconf('SC_CLK_TCK')
+			with open(os.path.join(td, 'uptime'), 'w') as f:
+				f.write('%.2f 0.00\n' % (5000 / ticks + 60))
+			write_proton_tree(td)
+			# The wineserver briefly uses the most memory while the server is still loading
+			write_process(td, 102, 101, ['/opt/proton/files/bin/wineserver'], 2000000, children=[])
+			tree = ProcessTree(None, td)
+			self.assertEqual(102, tree.find_game_pid('ark', 100))
+
+			# Only up for a minute, so the ranking is checked again
+			write_process(td, 102, 101, ['/opt/proton/files/bin/wineserver'], 500, children=[])
+			self.assertEqual(103, tree.find_game_pid('ark', 100))
+
+			# Once settled the result is kept
+			with open(os.path.join(td, 'uptime'), 'w') as f:
+				f.write('%.2f 0.00\n' % (5000 / ticks + ProcessTree.SETTLE_TIME))
+			self.assertEqual(103, tree.find_game_pid('ark', 100))
+			write_process(td, 102, 101, ['/opt/proton/files/bin/wineserver'], 2000000, children=[])
+			self.assertEqual(103, tree.find_game_pid('ark', 100))
+
+	def test_cache(self):
+		with tempfile.TemporaryDirectory() as td:
+			proc = os.path.join(td, 'proc')
+			state_file = os.path.join(td, 'game_pids.json')
+			write_proton_tree(proc)
+			tree = ProcessTree(state_file, proc)
+			self.assertEqual(103, tree.find_game_pid('ark', 100, 'ShooterGameServer'))
+			tree.save()
+
+			# The next invocation uses the cached result without walking the tree
+			write_process(proc, 100, 1, ['/bin/bash', '/opt/game/start.sh'], children=[])
+			tree = ProcessTree(state_file, proc)
+			self.assertEqual(103, tree.find_game_pid('ark', 100, 'ShooterGameServer'))
+
+			# Until the cached process is replaced, (same PID with a different start time)
+			write_process(proc, 103, 101, ['Z:\\opt\\game\\ShooterGameServer.exe'], start=9000, children=[])
+			self.assertEqual(0, tree.find_game_pid('ark', 100, 'ShooterGameServer'))
+
+			# Or the main process changes
+			write_process(proc, 200, 1, ['Z:\\opt\\game\\ShooterGameServer.exe'], children=[])
+			self.assertEqual(200, tree.find_game_pid('ark', 200, 'ShooterGameServer'))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.service_executor import ServiceExecutor
+import threading
+import time
+import unittest
+
+
+class SlowService:
+	"""
+	Stand-in for a BaseService whose stop takes a fixed time
+	"""
+	def __init__(self, service: str, seconds: float, fails: bool = False):
+		self.service = service
+		self.seconds = seconds
+		self.fails = fails
+
+	def stop(self) -> dict:
+		time.sleep(self.seconds)
+		if self.fails:
+			raise RuntimeError('bus unavailable')
+		return {'service': self.service, 'status': 'stopped', 'seconds': self.seconds}
+
+
+def is_stopped(result) -> bool:
+	return result is not None and result['status'] == 'stopped'
+
+
+class TestServiceExecutor(unittest.TestCase):
+	def test_runs_concurrently(self):
+		services = [SlowService('game-%d' % i, 0.3) for i in range(5)]
+		started = time.monotonic()
+		report = ServiceExecutor().run('stop', services, lambda svc: svc.stop(), is_stopped)
+
+		# Roughly the time of the slowest instance, not the sum of all of them
+		self.assertLess(time.monotonic() - started, 1.0)
+		self.assertTrue(report['success'])
+		self.assertEqual('stop', report['action'])
+		self.assertEqual(['game-%d' % i for i in range(5)], [r['service'] for r in report['results']])
+
+	def test_concurrency_limit(self):
+		running = []
+		peak = []
+		lock = threading.Lock()
+
+		def action(svc):
+			with lock:
+				running.append(svc.service)
+				peak.append(len(running))
+			time.sleep(0.05)
+			with lock:
+				running.remove(svc.service)
+			return {'status': 'stopped'}
+
+		services = [SlowService('game-%d' % i, 0) for i in range(6)]
+		report = ServiceExecutor(2).run('stop', services, action, is_stopped)
+		self.assertTrue(report['success'])
+		self.assertEqual(2, max(peak))
+
+	def test_failures_reported(self):
+		services = [SlowService('ok', 0), SlowService('broken', 0, True)]
+		report = ServiceExecutor().run('stop', services, lambda svc: svc.stop(), is_stopped)
+		self.assertFalse(report['success'])
+		self.assertTrue(report['results'][0]['success'])
+		self.assertFalse(report['results'][1]['success'])
+		self.assertEqual('RuntimeError: bus unavailable', report['results'][1]['error'])
+		self.assertIsNone(report['results'][1]['result'])
+
+
+if __name__ == '__main__':
+	unittest.main()
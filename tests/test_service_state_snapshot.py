@@ -0,0 +1,93 @@
+import os
+import sys
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.service_state_snapshot import ServiceStateSnapshot
+import unittest
+
+
+show_output = '''Id=ark-island.service
+LoadState=loaded
+ActiveState=active
+SubState=running
+UnitFileState=enabled
+MainPID=4242
+ExecMainPID=4242
+ExecMainCode=0
+ExecMainStatus=0
+ExecMainStartTimestamp=@1700000100
+ExecMainExitTimestamp=
+ExecMainStartTimestampMonotonic=52000123456
+ExecMainExitTimestampMonotonic=0
+ActiveEnterTimestamp=@1700000100
+InactiveEnterTimestamp=n/a
+NRestarts=2
+ExecStartPre={ path=/usr/bin/true ; argv[]=/usr/bin/true ; ignore_errors=no ; start_time=[@1700000000] ; stop_time=[@1700000090] ; pid=4200 ; code=exited ; status=0/SUCCESS }
+ExecStart={ path=/opt/ark/proton ; argv[]=/opt/ark/proton run ArkAscendedServer.exe ; ignore_errors=no ; start_time=[@1700000100] ; stop_time=[n/a] ; pid=4242 ; code=(null) ; status=0/0 }
+
+Id=ark-scorched.service
+LoadState=loaded
+ActiveState=inactive
+SubState=dead
+UnitFileState=disabled
+MainPID=0
+ExecMainStatus=1
+NRestarts=0
+ExecStartPre=
+ExecStart={ path=/opt/ark/proton ; argv[]=/opt/ark/proton run ArkAscendedServer.exe ; ignore_errors=no ; start_time=[n/a] ; stop_time=[n/a] ; pid=0 ; code=(null) ; status=0/0 }
+'''
+
+
+class TestServiceStateSnapshot(unittest.TestCase):
+	def test_parse_multiple_units(self):
+		states = ServiceStateSnapshot.parse(show_output)
+		self.assertEqual(['ark-island.service', 'ark-scorched.service'], list(states.keys()))
+
+		island = states['ark-island.service']
+		self.assertEqual('active', island['ActiveState'])
+		self.assertEqual('enabled', island['UnitFileState'])
+		self.assertEqual(4242, island['MainPID'])
+		self.assertEqual(2, island['NRestarts'])
+		self.assertEqual(1700000100, island['ActiveEnterTimestamp'])
+		self.assertIsNone(island['InactiveEnterTimestamp'])
+		self.assertIsNone(island['ExecMainExitTimestamp'])
+		self.assertEqual(52000123456, island['ExecMainStartTimestampMonotonic'])
+		self.assertEqual(0, island['ExecMainExitTimestampMonotonic'])
+
+		self.assertEqual('/usr/bin/true', island['ExecStartPre']['path'])
+		self.assertEqual(1700000000, island['ExecStartPre']['start_time'])
+		self.assertEqual(1700000090, island['ExecStartPre']['stop_time'])
+		self.assertEqual('exited', island['ExecStartPre']['code'])
+		self.assertEqual(0, island['ExecStartPre']['status'])
+		self.assertEqual(4242, island['ExecStart']['pid'])
+		self.assertIsNone(island['ExecStart']['code'])
+		self.assertIsNone(island['ExecStart']['stop_time'])
+
+		scorched = states['ark-scorched.service']
+		self.assertEqual('inactive', scorched['ActiveState'])
+		self.assertEqual(1, scorched['ExecMainStatus'])
+		self.assertIsNone(scorched['ExecStartPre'])
+		self.assertIsNone(scorched['ExecStart']['start_time'])
+
+	def test_lookup_by_service_name(self):
+		snapshot = ServiceStateSnapshot(['ark-island', 'ark-scorched'])
+		snapshot.states = ServiceStateSnapshot.parse(show_output)
+
+		self.assertTrue(snapshot.has('ark-island'))
+		self.assertTrue(snapshot.has('ark-island.service'))
+		self.assertEqual(4242, snapshot.get('ark-island')['MainPID'])
+
+		# Units not present in the snapshot return an empty state
+		self.assertFalse(snapshot.has('ark-center'))
+		self.assertEqual('', snapshot.get('ark-center')['ActiveState'])
+		self.assertEqual(0, snapshot.get('ark-center')['MainPID'])
+
+	def test_parse_timestamp(self):
+		self.assertEqual(1700000000, ServiceStateSnapshot.parse_timestamp('@1700000000'))
+		self.assertIsNone(ServiceStateSnapshot.parse_timestamp('n/a'))
+		self.assertIsNone(ServiceStateSnapshot.parse_timestamp(''))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,148 @@
+import os
+import sys
+import tempfile
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.host_stats import HostStatsReader
+from scriptlets.warlock.start_scheduler import StartScheduler
+import threading
+import time
+import unittest
+
+
+def write_host(root: str, loadavg: str = '0.10 0.10 0.10 1/100 1000', cpu_pressure: str = None, mem_available_kb: int = 16777216):
+	with open(os.path.join(root, 'loadavg'), 'w') as f:
+		f.write(loadavg + '\n')
+	with open(os.path.join(root, 'meminfo'), 'w') as f:
+		f.write('MemTotal:       33554432 kB\nMemAvailable:   %d kB\nHugePages_Total:       0\n' % mem_available_kb)
+	if cpu_pressure is not None:
+		os.makedirs(os.path.join(root, 'pressure'), exist_ok=True)
+		with open(os.path.join(root, 'pressure', 'cpu'), 'w') as f:
+			f.write(cpu_pressure)
+
+
+class FakeService:
+	"""
+	Stand-in for a BaseService which becomes ready once released
+	"""
+	def __init__(self, service: str, running: bool = False, broken: bool = False):
+		self.service = service
+		self.running = running
+		self.broken = broken
+		self.started = threading.Event()
+		self.ready = threading.Event()
+
+	def is_running(self) -> bool:
+		return self.running
+
+	def is_starting(self) -> bool:
+		return False
+
+	def begin_start(self):
+		if self.running or self.broken:
+			return None
+		self.started.set()
+		return object()
+
+	def wait_until_ready(self, watcher, start_timer: float, progress: bool = True) -> dict:
+		self.ready.wait(5)
+		return {'service': self.service, 'status': 'ready', 'seconds': round(time.time() - start_timer, 2), 'exit_status': 0}
+
+
+class TestHostStatsReader(unittest.TestCase):
+	def test_read(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_host(td, '6.00 3.00 1.00 2/300 4000', 'some avg10=12.50 avg60=4.00 avg300=1.00 total=100\nfull avg10=0.00 avg60=0.00 avg300=0.00 total=0\n')
+			host = HostStatsReader(td)
+			host.cpu_count = 4
+			self.assertEqual(1.5, host.read_loadavg()['load1_per_cpu'])
+			self.assertEqual(12.5, host.read_pressure('cpu')['some_avg10'])
+			self.assertEqual(0.0, host.read_pressure('cpu')['full_avg10'])
+			# Kernel without PSI
+			self.assertIsNone(host.read_pressure('io'))
+			meminfo = host.read_meminfo()
+			self.assertEqual(16777216 * 1024, meminfo['MemAvailable'])
+			self.assertEqual(0, meminfo['HugePages_Total'])
+
+
+class TestStartScheduler(unittest.TestCase):
+	def scheduler(self, root: str) -> StartScheduler:
+		host = HostStatsReader(root)
+		host.cpu_count = 4
+		scheduler = StartScheduler(0.8, 20.0, 2 * 1024 * 1024 * 1024, host)
+		scheduler.settle_time = 0.0
+		scheduler.poll_interval = 0.02
+		return scheduler
+
+	def test_host_limits(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_host(td)
+			self.assertIsNone(self.scheduler(td).get_host_limit())
+
+			write_host(td, loadavg='8.00 1.00 1.00 1/100 1000')
+			self.assertEqual('load 2.00 per CPU', self.scheduler(td).get_host_limit())
+
+			write_host(td, cpu_pressure='some avg10=45.00 avg60=10.00 avg300=1.00 total=100\n')
+			self.assertEqual('cpu pressure 45.0%', self.scheduler(td).get_host_limit())
+
+			write_host(td, cpu_pressure='some avg10=0.00 avg60=0.00 avg300=0.00 total=100\n', mem_available_kb=1024)
+			self.assertEqual('memory available 1 MB', self.scheduler(td).get_host_limit())
+
+	def run_scheduler(self, scheduler: StartScheduler, services: list) -> tuple:
+		report = {}
+		thread = threading.Thread(target=lambda: report.update(scheduler.run(services)))
+		thread.start()
+		return report, thread
+
+	def test_waits_for_ready_when_busy(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_host(td, loadavg='8.00 1.00 1.00 1/100 1000')
+			services = [FakeService('a'), FakeService('b')]
+			report, thread = self.run_scheduler(self.scheduler(td), services)
+
+			self.assertTrue(services[0].started.wait(5))
+			# Host is busy, so the second instance waits for the first to be ready
+			time.sleep(0.2)
+			self.assertFalse(services[1].started.is_set())
+			services[0].ready.set()
+			self.assertTrue(services[1].started.wait(5))
+			services[1].ready.set()
+			thread.join(5)
+
+			self.assertTrue(report['success'])
+			self.assertEqual(['a', 'b'], [r['service'] for r in report['results']])
+			self.assertEqual(['first', 'previous ready'], [r['admitted_because'] for r in report['results']])
+
+	def test_admits_early_when_idle(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_host(td)
+			services = [FakeService('a', True), FakeService('b'), FakeService('c')]
+			report, thread = self.run_scheduler(self.scheduler(td), services)
+
+			# Both start without waiting for each other, (a is already running)
+			self.assertTrue(services[2].started.wait(5))
+			self.assertFalse(services[0].started.is_set())
+			services[1].ready.set()
+			services[2].ready.set()
+			thread.join(5)
+
+			self.assertTrue(report['success'])
+			self.assertEqual(['first', 'previous ready', 'host below thresholds'], [r['admitted_because'] for r in report['results']])
+			self.assertIsNone(report['results'][0]['result'])
+			self.assertEqual('ready', report['results'][2]['result']['status'])
+
+	def test_failed_to_start(self):
+		with tempfile.TemporaryDirectory() as td:
+			write_host(td)
+			services = [FakeService('a', broken=True), FakeService('b', True)]
+			report, thread = self.run_scheduler(self.scheduler(td), services)
+			thread.join(5)
+
+			# begin_start returned None for both, but only b is actually up
+			self.assertFalse(report['success'])
+			self.assertEqual([False, True], [r['success'] for r in report['results']])
+
+
+if __name__ == '__main__':
+	unittest.main()
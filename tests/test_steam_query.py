@@ -0,0 +1,66 @@
+import os
+import sys
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from scriptlets.warlock.steam_query import SteamQuery
+import socket
+import threading
+import unittest
+
+
+class FakeQueryServer:
+	"""
+	Answers A2S_INFO requests on a local UDP port, optionally requiring a challenge first
+	"""
+	def __init__(self, challenge: bool):
+		self.challenge = challenge
+		self.requests = []
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind(('127.0.0.1', 0))
+		self.port = self.sock.getsockname()[1]
+		self.thread = threading.Thread(target=self.serve, daemon=True)
+		self.thread.start()
+
+	def serve(self):
+		try:
+			while True:
+				data, address = self.sock.recvfrom(65535)
+				self.requests.append(data)
+				if self.challenge and not data.endswith(b'\x01\x02\x03\x04'):
+					self.sock.sendto(b'\xFF\xFF\xFF\xFFA\x01\x02\x03\x04', address)
+				else:
+					self.sock.sendto(b'\xFF\xFF\xFF\xFFI\x11Test Server\x00', address)
+		except OSError:
+			pass
+
+	def close(self):
+		self.sock.close()
+
+
+class TestSteamQuery(unittest.TestCase):
+	def test_ping(self):
+		server = FakeQueryServer(False)
+		try:
+			self.assertIsNotNone(SteamQuery('127.0.0.1', server.port, 2).ping())
+			self.assertEqual([SteamQuery.INFO_REQUEST], server.requests)
+		finally:
+			server.close()
+
+	def test_challenge(self):
+		server = FakeQueryServer(True)
+		try:
+			self.assertIsNotNone(SteamQuery('127.0.0.1', server.port, 2).ping())
+			self.assertEqual(SteamQuery.INFO_REQUEST + b'\x01\x02\x03\x04', server.requests[-1])
+		finally:
+			server.close()
+
+	def test_no_answer(self):
+		# Bound but never answered, as a deadlocked server would
+		with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+			sock.bind(('127.0.0.1', 0))
+			self.assertIsNone(SteamQuery('127.0.0.1', sock.getsockname()[1], 0.2).ping())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,208 @@
+import os
+import sys
+here = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+sys.path.insert(0, here)
+
+from scriptlets.warlock.dbus_client import DBusMessage, DBusConnection, DBusError, Marshaller, Unmarshaller, split_signature
+from scriptlets.warlock.systemd_backend import DBusBackend, SystemdBackend
+from fake_systemd_bus import FakeSystemdBus
+import tempfile
+import threading
+import time
+import unittest
+
+
+class RecordingBackend(SystemdBackend):
+	"""
+	Fallback backend which records the operations delegated to it
+	"""
+	def __init__(self):
+		self.ops = []
+
+	def get_states(self, units: list) -> dict:
+		self.ops.append(('get_states', units))
+		return {}
+
+	def start(self, unit: str) -> bool:
+		self.ops.append(('start', unit))
+		return True
+
+	def reload(self) -> bool:
+		self.ops.append(('reload', ))
+		return True
+
+
+class TestDBusWireFormat(unittest.TestCase):
+	def test_split_signature(self):
+		self.assertEqual(['s', 'a{sv}', 'u'], split_signature('sa{sv}u'))
+		self.assertEqual(['a(sasbttttuii)', 'b'], split_signature('a(sasbttttuii)b'))
+
+	def test_round_trip(self):
+		signature = 'sa{sv}a(sasbttttuii)tb'
+		values = [
+			'ark-island.service',
+			{'ActiveState': ('s', 'active'), 'MainPID': ('u', 4242)},
+			[('/usr/bin/true', ['/usr/bin/true', '-x'], False, 1700000000000000, 5, 0, 0, 12, 1, 0)],
+			2 ** 40,
+			True,
+		]
+		data = Marshaller()
+		data.write(signature, values)
+		decoded = Unmarshaller(bytes(data.data)).read(signature)
+
+		self.assertEqual('ark-island.service', decoded[0])
+		self.assertEqual({'ActiveState': 'active', 'MainPID': 4242}, decoded[1])
+		self.assertEqual([('/usr/bin/true', ['/usr/bin/true', '-x'], False, 1700000000000000, 5, 0, 0, 12, 1, 0)], decoded[2])
+		self.assertEqual(2 ** 40, decoded[3])
+		self.assertTrue(decoded[4])
+
+	def test_message_encode_decode(self):
+		msg = DBusConnection.method_call('org.freedesktop.systemd1', '/org/freedesktop/systemd1', 'org.freedesktop.systemd1.Manager', 'StartUnit', 'ss', ['a.service', 'replace'])
+		msg.serial = 7
+		data = msg.encode()
+		self.assertEqual(len(data), DBusMessage.message_length(data))
+
+		decoded = DBusMessage.decode(data)
+		self.assertEqual(7, decoded.serial)
+		self.assertEqual('StartUnit', decoded.member)
+		self.assertEqual('/org/freedesktop/systemd1', decoded.path)
+		self.assertEqual(['a.service', 'replace'], decoded.body)
+
+	def test_malformed_and_closed(self):
+		msg = DBusConnection.method_call('org.freedesktop.systemd1', '/org/freedesktop/systemd1', 'org.freedesktop.systemd1.Manager', 'StartUnit', 'ss', ['a.service', 'replace'])
+		msg.serial = 7
+		data = msg.encode()
+		# Truncated body
+		with self.assertRaises(DBusError):
+			DBusMessage.decode(data[:-6])
+
+		conn = DBusConnection('/nonexistent')
+		with self.assertRaises(DBusError):
+			conn.read_message(0.1)
+		with self.assertRaises(DBusError):
+			conn.send(msg)
+
+
+class TestDBusBackend(unittest.TestCase):
+	def setUp(self):
+		self.bus = FakeSystemdBus()
+		self.bus.add_unit(
+			'ark-island.service',
+			ActiveState='active',
+			SubState='running',
+			MainPID=4242,
+			NRestarts=3,
+			ActiveEnterTimestamp=1700000100 * 1000000,
+			ExecStart=[('/opt/ark/proton', ['/opt/ark/proton', 'run'], False, 1700000100 * 1000000, 0, 0, 0, 4242, 0, 0)],
+		)
+		self.bus.add_unit('ark-scorched.service', UnitFileState='disabled', ExecMainCode=1, ExecMainStatus=3)
+		self.fallback = RecordingBackend()
+		self.backend = DBusBackend(self.bus.path, self.fallback)
+
+	def tearDown(self):
+		self.bus.close()
+
+	def test_unit_path(self):
+		self.assertEqual('/org/freedesktop/systemd1/unit/ark_2disland_2eservice', DBusBackend.unit_path('ark-island'))
+		self.assertEqual('/org/freedesktop/systemd1/unit/_37dtd_2eservice', DBusBackend.unit_path('7dtd'))
+
+	def test_get_states(self):
+		states = self.backend.get_states(['ark-island', 'ark-scorched', 'missing'])
+		self.assertEqual(['ark-island.service', 'ark-scorched.service'], sorted(states.keys()))
+
+		island = states['ark-island.service']
+		self.assertEqual('active', island['ActiveState'])
+		self.assertEqual(4242, island['MainPID'])
+		self.assertEqual(3, island['NRestarts'])
+		self.assertEqual(1700000100, island['ActiveEnterTimestamp'])
+		self.assertIsNone(island['InactiveEnterTimestamp'])
+		self.assertEqual('/opt/ark/proton run', island['ExecStart']['arguments'])
+		self.assertEqual(1700000100, island['ExecStart']['start_time'])
+		self.assertIsNone(island['ExecStart']['code'])
+		self.assertIsNone(island['ExecStartPre'])
+
+		scorched = states['ark-scorched.service']
+		self.assertEqual('disabled', scorched['UnitFileState'])
+		self.assertEqual(3, scorched['ExecMainStatus'])
+
+		# All properties of all units are requested in one pipelined batch on a single connection
+		get_all = [c for c in self.bus.calls if c[1] == 'GetAll']
+		self.assertEqual(6, len(get_all))
+		self.assertEqual([], self.fallback.ops)
+
+	def test_control(self):
+		self.assertTrue(self.backend.start('ark-scorched'))
+		self.assertEqual('active', self.bus.units['ark-scorched.service']['ActiveState'])
+		self.assertTrue(self.backend.stop('ark-island'))
+		self.assertEqual('inactive', self.bus.units['ark-island.service']['ActiveState'])
+		self.assertTrue(self.backend.disable('ark-island'))
+		self.assertEqual('disabled', self.bus.units['ark-island.service']['UnitFileState'])
+		self.assertIn(('org.freedesktop.systemd1.Manager', 'Reload', []), self.bus.calls)
+		self.bus.calls.clear()
+		self.assertTrue(self.backend.reload())
+		self.assertIn(('org.freedesktop.systemd1.Manager', 'Reload', []), self.bus.calls)
+
+	def test_watch_job_completion(self):
+		watcher = self.backend.watch('ark-scorched')
+		try:
+			# Nothing happening, the wait times out
+			self.assertFalse(watcher.wait(0.1))
+
+			# Job for a different unit is ignored
+			timer = threading.Timer(0.05, lambda: (
+				self.bus.emit_signal(DBusBackend.MANAGER_PATH, DBusBackend.MANAGER_INTERFACE, 'JobRemoved', 'uoss', [1, '/org/freedesktop/systemd1/job/1', 'ark-island.service', 'done']),
+				self.bus.emit_signal(DBusBackend.MANAGER_PATH, DBusBackend.MANAGER_INTERFACE, 'JobRemoved', 'uoss', [2, '/org/freedesktop/systemd1/job/2', 'ark-scorched.service', 'failed']),
+			))
+			timer.start()
+			started = time.monotonic()
+			self.assertTrue(watcher.wait(5))
+			self.assertLess(time.monotonic() - started, 2)
+			self.assertEqual('failed', watcher.job_result)
+
+			# Property changes of the watched unit wake the waiter too
+			timer = threading.Timer(0.05, lambda: self.bus.emit_signal(
+				DBusBackend.unit_path('ark-scorched'), DBusBackend.PROPERTIES_INTERFACE, 'PropertiesChanged', 'sa{sv}as',
+				[DBusBackend.UNIT_INTERFACE, {'ActiveState': ('s', 'active')}, []]
+			))
+			timer.start()
+			self.assertTrue(watcher.wait(5))
+		finally:
+			watcher.close()
+
+		self.assertIn(('org.freedesktop.systemd1.Manager', 'Subscribe', []), self.bus.calls)
+
+	def test_fallback_on_error(self):
+		# Unknown units are rejected by systemd, so the operation is retried with the fallback
+		self.assertTrue(self.backend.start('missing'))
+		self.assertEqual([('start', 'missing')], self.fallback.ops)
+
+		# As is any failure to reach the bus
+		backend = DBusBackend(os.path.join(here, 'no-such-socket'), self.fallback)
+		self.assertEqual({}, backend.get_states(['ark-island']))
+		self.assertEqual(('get_states', ['ark-island']), self.fallback.ops[-1])
+		self.assertTrue(backend.reload())
+		self.assertEqual(('reload', ), self.fallback.ops[-1])
+
+
+class TestRuntimeProperties(unittest.TestCase):
+	def test_clear_runtime_property(self):
+		with tempfile.TemporaryDirectory() as td:
+			backend = RecordingBackend()
+			backend.RUNTIME_CONTROL_DIR = td
+			os.makedirs(os.path.join(td, 'ark-island.service.d'))
+			path = os.path.join(td, 'ark-island.service.d', '50-MemoryMax.conf')
+			with open(path, 'w') as f:
+				f.write('[Service]\nMemoryMax=8G\n')
+
+			self.assertTrue(backend.clear_runtime_property('ark-island', 'MemoryMax'))
+			self.assertFalse(os.path.exists(path))
+			self.assertEqual([('reload', )], backend.ops)
+
+			# Nothing set at runtime, nothing to reload
+			self.assertFalse(backend.clear_runtime_property('ark-island', 'CPUQuota'))
+			self.assertEqual([('reload', )], backend.ops)
+
+
+if __name__ == '__main__':
+	unittest.main()